@@ -3,6 +3,21 @@ POSTGRES_PASSWORD=
 PGADMIN_DEFAULT_EMAIL=
 PGADMIN_DEFAULT_PASSWORD=
 POSTGRES_HOST=
+DB_POOL_MIN=
+DB_POOL_MAX=
+DB_POOL_TIMEOUT=
+DB_POOL_MAX_LIFETIME=
+DB_POOL_CHECK_IDLE=
+AUTHZ_CACHE_SIZE=
+AUTHZ_CACHE_TTL=
+RABBITMQ_POOL_SIZE=
+RABBITMQ_BREAKER_FAILURES=
+RABBITMQ_BREAKER_RESET_SECONDS=
+NOTIFICATIONS_RETAIN_MONTHS=
+NOTIFICATIONS_PARTITIONS_AHEAD=
+UNREAD_RECONCILE_BATCH_SIZE=
+NOTIFICATION_CONTENT_TYPE=
+NOTIFICATION_TEMPLATES=
 GRAFANA_ADMIN_USER=
 GRAFANA_ADMIN_PASSWORD=
 
@@ -13,6 +28,10 @@ TICKETS_NOTIFICATIONS_URL=""
 REDIS_HOST=
 REDIS_PORT=
 REDIS_PASSWORD=
+RESPONSE_CACHE_TTL=
+RESPONSE_CACHE_L1_TTL=
+RESPONSE_CACHE_L1_SIZE=
+RESPONSE_CACHE_REDIS_TIMEOUT=
 
 REDIS_UI_USERNAME=
 REDIS_UI_PASSWORD=
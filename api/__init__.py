@@ -1,10 +1,14 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
 import logging
 from dotenv import load_dotenv
 
-# Import the RabbitMQ extension
-from api.services.rabbitmq import rabbitmq
+from api.services.response_cache import response_cache
+from api import database
+from api.pagination import InvalidPageRequest
+from api.streaming import InvalidStreamFormat
+from api.services.ticket_search import InvalidSearchRequest
+from api.services.user_import import InvalidImportRequest
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -15,8 +19,23 @@ def create_app():
     app = Flask(__name__)
     CORS(app)
     
-    # Register RabbitMQ extension
-    rabbitmq.init_app(app)
+    # Return pooled database connections at the end of each request
+    database.init_app(app)
+    
+    @app.errorhandler(database.PoolTimeout)
+    def handle_pool_timeout(e):
+        logger.error(f"Database pool exhausted: {str(e)}")
+        return jsonify({"error": "Database is busy, please retry"}), 503
+    
+    @app.errorhandler(InvalidPageRequest)
+    @app.errorhandler(InvalidStreamFormat)
+    @app.errorhandler(InvalidSearchRequest)
+    @app.errorhandler(InvalidImportRequest)
+    def handle_invalid_list_request(e):
+        return jsonify({"error": str(e)}), 400
+    
+    # Redis-backed cache for hot GET endpoints
+    response_cache.init_app(app)
     
     # Register blueprints
     from api.routes.tickets import tickets_bp
@@ -1,26 +1,422 @@
 import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from flask import g, has_app_context, request
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv('.env', override=True)
 
-def get_db_connection():
-    """Create and return a database connection."""
+# Pool metrics are registered on the default registry, which is the one the
+# PrometheusMetrics instance in api/main.py exposes on /metrics.
+POOL_SIZE = Gauge('db_pool_connections', 'Open connections held by the pool')
+POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Connections currently checked out of the pool')
+POOL_WAIT_SECONDS = Histogram(
+    'db_pool_wait_seconds',
+    'Time spent waiting to check a connection out of the pool',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+ROUND_TRIPS = Histogram(
+    'db_round_trips_per_request',
+    'Database round trips (statements, implicit BEGINs, fetches and COMMIT/ROLLBACK) per request',
+    ['endpoint'],
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50, 100)
+)
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+def _count_round_trips(n=1):
+    if has_app_context():
+        g.db_round_trips = g.get('db_round_trips', 0) + n
+
+
+class RoundTripCountingMixin:
+    """Counts every message exchange with the server for the current request."""
+
+    def _begins_transaction(self):
+        conn = self.connection
+        return not conn.autocommit and conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+
+    def execute(self, query, vars=None):
+        # psycopg2 sends its implicit BEGIN as a separate command
+        _count_round_trips(2 if self._begins_transaction() else 1)
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        _count_round_trips(len(vars_list) + (1 if self._begins_transaction() else 0))
+        return super().executemany(query, vars_list)
+
+    # Fetches only reach the server for named (server-side) cursors
+    def fetchone(self):
+        if self.name is not None:
+            _count_round_trips()
+        return super().fetchone()
+
+    def fetchmany(self, size=None):
+        if self.name is not None:
+            _count_round_trips()
+        return super().fetchmany(size) if size is not None else super().fetchmany()
+
+    def fetchall(self):
+        if self.name is not None:
+            _count_round_trips()
+        return super().fetchall()
+
+
+class CountingCursor(RoundTripCountingMixin, extensions.cursor):
+    pass
+
+
+class CountingDictCursor(RoundTripCountingMixin, RealDictCursor):
+    pass
+
+
+class InstrumentedConnection(extensions.connection):
+    """Connection whose cursors and transaction commands count round trips.
+
+    It also carries post-commit hooks: side effects registered with on_commit()
+    run only after the current transaction commits and are dropped on rollback.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CountingCursor
+        self._commit_hooks = []
+
+    def _in_transaction(self):
+        return self.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE
+
+    def on_commit(self, callback, *args, **kwargs):
+        """Run ``callback(*args, **kwargs)`` after the next successful commit.
+
+        Returns a Future resolved with the callback's result (or exception) once
+        it has run, or cancelled if the transaction is rolled back instead.
+        """
+        future = Future()
+        self._commit_hooks.append((future, callback, args, kwargs))
+        return future
+
+    def discard_commit_hooks(self):
+        hooks, self._commit_hooks = self._commit_hooks, []
+        for future, _, _, _ in hooks:
+            future.cancel()
+
+    def commit(self):
+        if self._in_transaction():
+            _count_round_trips()
+        super().commit()
+
+        hooks, self._commit_hooks = self._commit_hooks, []
+        for future, callback, args, kwargs in hooks:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(callback(*args, **kwargs))
+            except Exception as e:
+                logger.error(f"Post-commit hook {getattr(callback, '__name__', callback)} failed: {str(e)}", exc_info=True)
+                future.set_exception(e)
+
+    def rollback(self):
+        if self._in_transaction():
+            _count_round_trips()
+        try:
+            super().rollback()
+        finally:
+            self.discard_commit_hooks()
+
+
+def connect():
+    """Create and return a new, unpooled database connection."""
     DB_USER = os.getenv("POSTGRES_USER")
     DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
     DB_HOST = os.getenv("POSTGRES_HOST")
     DB_PORT = "5432"
-    
+
     return psycopg2.connect(
         dbname='postgres',
         user=DB_USER,
         password=DB_PASSWORD,
         host=DB_HOST,
-        port=DB_PORT
+        port=DB_PORT,
+        connection_factory=InstrumentedConnection
     )
 
+
+class ConnectionPool:
+    """Thread-safe, bounded pool of psycopg2 connections.
+
+    Keeps at least ``minconn`` connections open and never more than ``maxconn``.
+    Callers that find the pool exhausted wait up to ``timeout`` seconds for a
+    connection to be returned. Connections older than ``max_lifetime`` seconds
+    are recycled, and connections that sat idle longer than ``check_idle``
+    seconds are pinged before being handed out.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=30.0, max_lifetime=1800.0, check_idle=30.0, connect_fn=connect):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool bounds: minconn=%s maxconn=%s" % (minconn, maxconn))
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self._connect = connect_fn
+
+        self._cond = threading.Condition()
+        self._idle = []          # list of (conn, created_at, last_used_at)
+        self._created = {}       # id(conn) -> created_at, for every open connection
+        self._in_use = 0
+        self._opening = 0        # connections being opened outside the lock
+        self._closed = False
+
+        for _ in range(minconn):
+            conn = self._open()
+            self._idle.append((conn, self._created[id(conn)], time.monotonic()))
+
+    def _forget(self, conn):
+        """Drop a connection from the books; the caller must hold ``self._cond``."""
+        self._created.pop(id(conn), None)
+        POOL_SIZE.set(len(self._created))
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _discard(self, conn):
+        self._forget(conn)
+        self._close(conn)
+
+    def _is_expired(self, created_at):
+        return self.max_lifetime and time.monotonic() - created_at > self.max_lifetime
+
+    def _is_healthy(self, conn, last_used_at):
+        """Cheap liveness check, only hitting the server for long-idle connections."""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - last_used_at < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Check a healthy connection out of the pool, waiting if it is exhausted.
+
+        The lock only guards the pool's bookkeeping: health checks and new
+        connections run outside it, so one slow backend never stalls every
+        other checkout and return.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            candidate = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+
+                    if self._idle:
+                        candidate = self._idle.pop()
+                    elif len(self._created) + self._opening >= self.maxconn:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise PoolTimeout("Timed out after %.1fs waiting for a database connection" % self.timeout)
+                        self._cond.wait(remaining)
+                        continue
+
+                    # Reserve the slot (the idle connection, or room for a new one)
+                    # before releasing the lock to validate or connect
+                    self._in_use += 1
+                    POOL_IN_USE.set(self._in_use)
+                    if candidate is None:
+                        self._opening += 1
+                    break
+
+            if candidate is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._in_use -= 1
+                        POOL_IN_USE.set(self._in_use)
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._register(conn)
+                POOL_WAIT_SECONDS.observe(time.monotonic() - started)
+                return conn
+
+            conn, created_at, last_used_at = candidate
+            if not self._is_expired(created_at) and self._is_healthy(conn, last_used_at):
+                POOL_WAIT_SECONDS.observe(time.monotonic() - started)
+                return conn
+
+            # Unusable: give the slot back and try the next idle connection
+            with self._cond:
+                self._forget(conn)
+                self._in_use -= 1
+                POOL_IN_USE.set(self._in_use)
+                self._cond.notify()
+            self._close(conn)
+
+    def _register(self, conn):
+        self._created[id(conn)] = time.monotonic()
+        POOL_SIZE.set(len(self._created))
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._register(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection to the pool, discarding it if it is unusable.
+
+        Any open transaction is rolled back before taking the lock.
+        """
+        if hasattr(conn, 'discard_commit_hooks'):
+            conn.discard_commit_hooks()
+        if not conn.closed and not close:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        else:
+            close = True
+
+        with self._cond:
+            self._in_use -= 1
+            POOL_IN_USE.set(self._in_use)
+
+            created_at = self._created.get(id(conn))
+            discard = close or created_at is None or self._closed or self._is_expired(created_at)
+            if discard:
+                self._forget(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+
+            self._cond.notify()
+
+        if discard:
+            self._close(conn)
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            for conn, _, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": len(self._created),
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "max": self.maxconn
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    minconn=int(os.getenv("DB_POOL_MIN", "1")),
+                    maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+                    check_idle=float(os.getenv("DB_POOL_CHECK_IDLE", "30"))
+                )
+    return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """Check a connection out of the pool for code running outside a request."""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def get_db_connection():
+    """Return the pooled connection bound to the current request.
+
+    The connection is checked out on first use and handed back to the pool
+    when the app context is torn down, so handlers must not close it.
+    """
+    if not has_app_context():
+        raise RuntimeError("get_db_connection() requires an app context; use pooled_connection() instead")
+
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().getconn()
+    return g.db_conn
+
+
+def on_commit(callback, *args, **kwargs):
+    """Queue a side effect to run once the request's transaction commits."""
+    return get_db_connection().on_commit(callback, *args, **kwargs)
+
+
+def release_db_connection(exception=None):
+    """Return the request's connection to the pool, rolling back anything uncommitted."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().putconn(conn)
+
+
+def record_round_trips(exception=None):
+    """Export how many database round trips the request needed."""
+    round_trips = g.pop('db_round_trips', 0)
+    if round_trips and request.endpoint:
+        ROUND_TRIPS.labels(endpoint=request.endpoint).observe(round_trips)
+
+
+def init_app(app):
+    """Hand pooled connections back at the end of every app context."""
+    app.teardown_request(record_round_trips)
+    app.teardown_appcontext(release_db_connection)
+
+
 def dict_cursor():
     """Return a cursor that returns results as dictionaries."""
-    return RealDictCursor
+    return CountingDictCursor
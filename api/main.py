@@ -4,6 +4,7 @@ from prometheus_flask_exporter import PrometheusMetrics
 app = create_app()
 
 # Use a different path to avoid conflicts
+# Serves the default registry, which also holds the db_pool_* metrics from api.database
 metrics = PrometheusMetrics(app)
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""Versioned schema migrations.
+
+Migrations are plain SQL files in ``api/migrations/versions`` named
+``NNNN_description.sql``. They are applied in version order, each inside its
+own transaction, and recorded in ``schema_migrations`` together with a
+checksum of the file so edits to an already-applied migration are detected.
+
+Scripts in ``api/migrations/checks`` exercise the schema's triggers and
+constraints against a migrated database. Each runs in a transaction that is
+always rolled back, and fails by raising (e.g. a failed ASSERT).
+"""
+import os
+import re
+import hashlib
+import logging
+from api.database import connect
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_DIR = os.path.join(os.path.dirname(__file__), 'versions')
+CHECKS_DIR = os.path.join(os.path.dirname(__file__), 'checks')
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+# Arbitrary key so concurrent runners (e.g. several API replicas starting at once) serialize
+ADVISORY_LOCK_KEY = 726361
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+class MigrationError(Exception):
+    """Raised when the migration history does not match the files on disk."""
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    @property
+    def sql(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    @property
+    def checksum(self):
+        return hashlib.sha256(self.sql.encode('utf-8')).hexdigest()
+
+    def __repr__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+def discover_migrations(directory=VERSIONS_DIR):
+    """Return every migration file in ``directory``, sorted by version."""
+    migrations = []
+    seen = {}
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in seen:
+            raise MigrationError(f"Duplicate migration version {version}: {seen[version]} and {filename}")
+        seen[version] = filename
+        migrations.append(Migration(version, match.group(2), os.path.join(directory, filename)))
+    return migrations
+
+
+def get_applied(cur):
+    """Return {version: checksum} for every applied migration."""
+    cur.execute("SELECT version, checksum FROM schema_migrations ORDER BY version;")
+    return {version: checksum for version, checksum in cur.fetchall()}
+
+
+def _verify(migrations, applied):
+    known = {m.version: m for m in migrations}
+    for version, checksum in applied.items():
+        migration = known.get(version)
+        if migration is None:
+            raise MigrationError(f"Migration {version} is applied but its file is missing")
+        if migration.checksum != checksum:
+            raise MigrationError(f"Migration {migration} was modified after being applied")
+
+
+def status(conn=None):
+    """Return a list of (migration, applied) tuples."""
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(CREATE_MIGRATIONS_TABLE)
+        applied = get_applied(cur)
+        conn.commit()
+        cur.close()
+        migrations = discover_migrations()
+        _verify(migrations, applied)
+        return [(m, m.version in applied) for m in migrations]
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def upgrade(target=None, conn=None):
+    """Apply every pending migration up to ``target`` (all of them by default).
+
+    Returns the list of migrations that were applied.
+    """
+    own_conn = conn is None
+    conn = conn or connect()
+    applied_now = []
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s);", (ADVISORY_LOCK_KEY,))
+        try:
+            cur.execute(CREATE_MIGRATIONS_TABLE)
+            conn.commit()
+
+            migrations = discover_migrations()
+            applied = get_applied(cur)
+            conn.commit()
+            _verify(migrations, applied)
+
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+                if target is not None and migration.version > target:
+                    break
+
+                logger.info(f"Applying migration {migration}")
+                try:
+                    cur.execute(migration.sql)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s);",
+                        (migration.version, migration.name, migration.checksum)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    logger.error(f"Migration {migration} failed, rolled back")
+                    raise
+                applied_now.append(migration)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_KEY,))
+            conn.commit()
+            cur.close()
+    finally:
+        if own_conn:
+            conn.close()
+    return applied_now
+
+
+def run_checks(names=None, conn=None):
+    """Run the check scripts (or only ``names``) and return a list of (name, error or None)."""
+    own_conn = conn is None
+    conn = conn or connect()
+    results = []
+    try:
+        for filename in sorted(os.listdir(CHECKS_DIR)):
+            name, ext = os.path.splitext(filename)
+            if ext != '.sql' or (names and name not in names):
+                continue
+            with open(os.path.join(CHECKS_DIR, filename), 'r', encoding='utf-8') as f:
+                sql = f.read()
+            cur = conn.cursor()
+            try:
+                cur.execute(sql)
+                results.append((name, None))
+            except Exception as e:
+                results.append((name, str(e).strip()))
+            finally:
+                cur.close()
+                # Checks never leave data behind
+                conn.rollback()
+    finally:
+        if own_conn:
+            conn.close()
+    return results
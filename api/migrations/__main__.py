@@ -0,0 +1,46 @@
+"""Command line entry point: python -m api.migrations {upgrade,status,check}"""
+import sys
+import logging
+import argparse
+from api.migrations import upgrade, status, run_checks, MigrationError
+
+
+def main(argv=None):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(prog="python -m api.migrations", description="Manage the database schema")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    upgrade_parser = subparsers.add_parser("upgrade", help="Apply pending migrations")
+    upgrade_parser.add_argument("--target", type=int, help="Stop after this version")
+
+    subparsers.add_parser("status", help="List applied and pending migrations")
+
+    check_parser = subparsers.add_parser("check", help="Run the schema check scripts against the database (rolled back)")
+    check_parser.add_argument("names", nargs="*", help="Only run these checks")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "upgrade":
+            applied = upgrade(target=args.target)
+            print(f"Applied {len(applied)} migration(s)")
+            for migration in applied:
+                print(f"  {migration}")
+        elif args.command == "status":
+            for migration, is_applied in status():
+                print(f"[{'x' if is_applied else ' '}] {migration}")
+        elif args.command == "check":
+            results = run_checks(args.names)
+            for name, error in results:
+                print(f"FAIL {name}: {error}" if error else f"ok   {name}")
+            if not results or any(error for _, error in results):
+                return 1
+    except MigrationError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
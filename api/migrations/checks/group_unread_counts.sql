@@ -0,0 +1,99 @@
+-- The unread-counter triggers (migrations 0011 and 0013) against a recount:
+-- announcements created, read, re-read and deleted, members added and removed.
+-- Runs in one session, so it checks the triggers' arithmetic, not their locking.
+--
+-- Run with: python -m api.migrations check group_unread_counts
+
+DO $$
+DECLARE
+    v_teacher_id INTEGER;
+    v_first_id INTEGER;
+    v_second_id INTEGER;
+    v_group_id INTEGER;
+    v_other_group_id INTEGER;
+    v_read_id INTEGER;
+    v_unread_id INTEGER;
+    v_step TEXT;
+    v_mismatch TEXT;
+BEGIN
+    INSERT INTO users (email, password, user_name, user_role)
+    VALUES ('check-unread-teacher@example.invalid', 'x', 'Teacher', 'teacher') RETURNING id INTO v_teacher_id;
+    INSERT INTO users (email, password, user_name, user_role)
+    VALUES ('check-unread-first@example.invalid', 'x', 'First', 'user') RETURNING id INTO v_first_id;
+    INSERT INTO users (email, password, user_name, user_role)
+    VALUES ('check-unread-second@example.invalid', 'x', 'Second', 'user') RETURNING id INTO v_second_id;
+    INSERT INTO groups (name, teacher_id) VALUES ('check-unread', v_teacher_id) RETURNING id INTO v_group_id;
+    INSERT INTO groups (name, teacher_id) VALUES ('check-unread-other', v_teacher_id) RETURNING id INTO v_other_group_id;
+
+    FOR v_step IN SELECT unnest(ARRAY[
+        'member added',
+        'announcements added',
+        'announcement read',
+        'announcement read again',
+        'second member added',
+        'multi-group member insert',
+        'unread announcement deleted',
+        'read announcement deleted',
+        'member removed'
+    ]) LOOP
+        CASE v_step
+        WHEN 'member added' THEN
+            INSERT INTO user_groups (user_id, group_id) VALUES (v_first_id, v_group_id);
+        WHEN 'announcements added' THEN
+            INSERT INTO announcements (group_id, teacher_id, title, content)
+            VALUES (v_group_id, v_teacher_id, 'Read', 'Will be read');
+            INSERT INTO announcements (group_id, teacher_id, title, content)
+            VALUES (v_group_id, v_teacher_id, 'Unread', 'Stays unread');
+            SELECT id INTO v_read_id FROM announcements WHERE group_id = v_group_id AND title = 'Read';
+            SELECT id INTO v_unread_id FROM announcements WHERE group_id = v_group_id AND title = 'Unread';
+        WHEN 'announcement read' THEN
+            INSERT INTO announcement_reads (announcement_id, user_id) VALUES (v_read_id, v_first_id)
+            ON CONFLICT (announcement_id, user_id) DO NOTHING;
+        WHEN 'announcement read again' THEN
+            INSERT INTO announcement_reads (announcement_id, user_id) VALUES (v_read_id, v_first_id)
+            ON CONFLICT (announcement_id, user_id) DO NOTHING;
+        WHEN 'second member added' THEN
+            INSERT INTO user_groups (user_id, group_id) VALUES (v_second_id, v_group_id);
+        WHEN 'multi-group member insert' THEN
+            INSERT INTO announcements (group_id, teacher_id, title, content)
+            VALUES (v_other_group_id, v_teacher_id, 'Other', 'Other group');
+            INSERT INTO user_groups (user_id, group_id)
+            VALUES (v_first_id, v_other_group_id), (v_second_id, v_other_group_id);
+        WHEN 'unread announcement deleted' THEN
+            DELETE FROM announcements WHERE id = v_unread_id;
+        WHEN 'read announcement deleted' THEN
+            DELETE FROM announcements WHERE id = v_read_id;
+        WHEN 'member removed' THEN
+            DELETE FROM user_groups WHERE user_id = v_second_id AND group_id = v_group_id;
+        END CASE;
+
+        -- What api.workers.unread_counters would recompute for these groups
+        SELECT string_agg(format('user %s group %s: counter %s, actual %s',
+                                 COALESCE(c.user_id, a.user_id), COALESCE(c.group_id, a.group_id),
+                                 c.unread_count, a.unread_count), '; ')
+        INTO v_mismatch
+        FROM (
+            SELECT ug.user_id, ug.group_id, COUNT(an.id) FILTER (WHERE ar.user_id IS NULL) AS unread_count
+            FROM user_groups ug
+            LEFT JOIN announcements an ON an.group_id = ug.group_id
+            LEFT JOIN announcement_reads ar ON ar.announcement_id = an.id AND ar.user_id = ug.user_id
+            WHERE ug.group_id IN (v_group_id, v_other_group_id)
+            GROUP BY ug.user_id, ug.group_id
+        ) a
+        FULL JOIN (
+            SELECT * FROM group_unread_counts WHERE group_id IN (v_group_id, v_other_group_id)
+        ) c ON c.user_id = a.user_id AND c.group_id = a.group_id
+        WHERE c.unread_count IS DISTINCT FROM a.unread_count;
+
+        ASSERT v_mismatch IS NULL, format('after %s: %s', v_step, v_mismatch);
+    END LOOP;
+
+    -- Spot-check the end state as well as agreement with the recount
+    ASSERT (SELECT unread_count FROM group_unread_counts WHERE user_id = v_first_id AND group_id = v_group_id) = 0,
+        'first member should have nothing unread once both announcements are gone';
+    ASSERT NOT EXISTS (SELECT 1 FROM group_unread_counts WHERE user_id = v_second_id AND group_id = v_group_id),
+        'removed member still has a counter';
+    ASSERT (SELECT unread_count FROM group_unread_counts WHERE user_id = v_second_id AND group_id = v_other_group_id) = 1,
+        'member of the other group should have its announcement unread';
+END;
+$$;
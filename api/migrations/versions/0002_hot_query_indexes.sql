@@ -0,0 +1,76 @@
+-- Indexes matched to the WHERE / ORDER BY clauses used in api/routes.
+-- Ticket lists are keyset-paginated on (sort key DESC, id DESC), see api/routes/tickets.py.
+
+-- GET /tickets
+CREATE INDEX IF NOT EXISTS tickets_created_idx
+    ON tickets (created_at DESC, id DESC);
+
+-- GET /all_open_tickets
+CREATE INDEX IF NOT EXISTS tickets_status_created_idx
+    ON tickets (status, created_at DESC, id DESC);
+
+-- GET /all_closed_tickets
+CREATE INDEX IF NOT EXISTS tickets_closed_idx
+    ON tickets ((COALESCE(closed_at, created_at)) DESC, id DESC)
+    WHERE status = 'closed';
+
+-- GET /tickets_not_assigned_open: the open-and-unassigned queue stays small
+CREATE INDEX IF NOT EXISTS tickets_open_unassigned_idx
+    ON tickets (created_at DESC, id DESC)
+    WHERE status = 'open' AND assign_id IS NULL;
+
+-- GET /tickets_assign_open/<user_id>
+CREATE INDEX IF NOT EXISTS tickets_assign_status_created_idx
+    ON tickets (assign_id, status, created_at DESC, id DESC)
+    WHERE assign_id IS NOT NULL;
+
+-- GET /tickets_assign_closed/<user_id>
+CREATE INDEX IF NOT EXISTS tickets_assign_closed_idx
+    ON tickets (assign_id, (COALESCE(closed_at, created_at)) DESC, id DESC)
+    WHERE status = 'closed';
+
+-- GET /tickets_user_open/<user_id>
+CREATE INDEX IF NOT EXISTS tickets_user_status_created_idx
+    ON tickets (user_id, status, created_at DESC, id DESC);
+
+-- GET /tickets_user_closed/<user_id>
+CREATE INDEX IF NOT EXISTS tickets_user_closed_idx
+    ON tickets (user_id, (COALESCE(closed_at, created_at)) DESC, id DESC)
+    WHERE status = 'closed';
+
+-- GET /tickets/<id>/comments
+CREATE INDEX IF NOT EXISTS comments_ticket_created_idx
+    ON comments (ticket_id, created_at, id);
+
+-- GET /groups/<group_id>/announcements
+CREATE INDEX IF NOT EXISTS announcements_group_pinned_created_idx
+    ON announcements (group_id, is_pinned DESC, created_at DESC);
+
+-- GET /teachers/<teacher_id>/announcements
+CREATE INDEX IF NOT EXISTS announcements_teacher_created_idx
+    ON announcements (teacher_id, created_at DESC);
+
+-- The primary key leads with user_id; fan-out and member lists filter by group_id
+CREATE INDEX IF NOT EXISTS user_groups_group_idx
+    ON user_groups (group_id, user_id);
+
+-- Unread counts and read-status joins filter by user_id
+CREATE INDEX IF NOT EXISTS announcement_reads_user_idx
+    ON announcement_reads (user_id, announcement_id);
+
+-- GET /teachers/<teacher_id>/groups
+CREATE INDEX IF NOT EXISTS groups_teacher_created_idx
+    ON groups (teacher_id, created_at DESC);
+
+-- POST /groups/<id>/members/add looks members up by user name
+CREATE INDEX IF NOT EXISTS users_user_name_idx
+    ON users (user_name);
+
+-- GET /admin_users
+CREATE INDEX IF NOT EXISTS users_role_name_idx
+    ON users (user_role, user_name);
+
+-- GET /notifications/pending only ever looks at the pending set
+CREATE INDEX IF NOT EXISTS notifications_pending_created_idx
+    ON notifications (created_at DESC)
+    WHERE status = 'pending';
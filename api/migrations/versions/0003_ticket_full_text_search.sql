@@ -0,0 +1,61 @@
+-- Full-text search over ticket descriptions and comments (Spanish configuration).
+-- The tsvectors live in side tables kept in sync by triggers, so the many
+-- SELECT t.* / RETURNING * queries in the API don't start returning them.
+
+CREATE TABLE IF NOT EXISTS ticket_search (
+    ticket_id CHAR(5) PRIMARY KEY REFERENCES tickets(id) ON DELETE CASCADE,
+    search_vector tsvector NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS comment_search (
+    comment_id INTEGER PRIMARY KEY REFERENCES comments(id) ON DELETE CASCADE,
+    ticket_id CHAR(5) NOT NULL REFERENCES tickets(id) ON DELETE CASCADE,
+    search_vector tsvector NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ticket_search_vector_idx ON ticket_search USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS comment_search_vector_idx ON comment_search USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS comment_search_ticket_idx ON comment_search (ticket_id);
+
+CREATE OR REPLACE FUNCTION ticket_search_document(description TEXT, category TEXT, sub_category TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('spanish', coalesce(description, '')), 'A') ||
+           setweight(to_tsvector('spanish', coalesce(category, '') || ' ' || coalesce(sub_category, '')), 'B');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION ticket_search_refresh() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO ticket_search (ticket_id, search_vector)
+    VALUES (NEW.id, ticket_search_document(NEW.description, NEW.category, NEW.sub_category))
+    ON CONFLICT (ticket_id) DO UPDATE SET search_vector = EXCLUDED.search_vector;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION comment_search_refresh() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO comment_search (comment_id, ticket_id, search_vector)
+    VALUES (NEW.id, NEW.ticket_id, to_tsvector('spanish', coalesce(NEW.content, '')))
+    ON CONFLICT (comment_id) DO UPDATE SET search_vector = EXCLUDED.search_vector;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tickets_search_refresh ON tickets;
+CREATE TRIGGER tickets_search_refresh
+    AFTER INSERT OR UPDATE OF description, category, sub_category ON tickets
+    FOR EACH ROW EXECUTE FUNCTION ticket_search_refresh();
+
+DROP TRIGGER IF EXISTS comments_search_refresh ON comments;
+CREATE TRIGGER comments_search_refresh
+    AFTER INSERT OR UPDATE OF content ON comments
+    FOR EACH ROW EXECUTE FUNCTION comment_search_refresh();
+
+-- Backfill existing rows
+INSERT INTO ticket_search (ticket_id, search_vector)
+SELECT id, ticket_search_document(description, category, sub_category) FROM tickets
+ON CONFLICT (ticket_id) DO NOTHING;
+
+INSERT INTO comment_search (comment_id, ticket_id, search_vector)
+SELECT id, ticket_id, to_tsvector('spanish', coalesce(content, '')) FROM comments
+ON CONFLICT (comment_id) DO NOTHING;
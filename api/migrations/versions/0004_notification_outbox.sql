@@ -0,0 +1,31 @@
+-- Transactional outbox: notifications are written in the same transaction as the
+-- change that triggers them and published to RabbitMQ by api.workers.outbox_relay.
+
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    message_id UUID NOT NULL UNIQUE,
+    exchange TEXT NOT NULL DEFAULT 'notifications',
+    routing_key TEXT NOT NULL DEFAULT 'user.notification',
+    payload JSONB NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- The relay drains in id order, skipping rows that are backing off after a failure
+CREATE INDEX IF NOT EXISTS notification_outbox_available_idx
+    ON notification_outbox (available_at, id);
+
+-- Wake idle relays as soon as new rows commit (NOTIFY is delivered on COMMIT)
+CREATE OR REPLACE FUNCTION notification_outbox_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('notification_outbox', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notification_outbox_notify ON notification_outbox;
+CREATE TRIGGER notification_outbox_notify
+    AFTER INSERT ON notification_outbox
+    FOR EACH STATEMENT EXECUTE FUNCTION notification_outbox_notify();
@@ -0,0 +1,31 @@
+-- Announcement fan-out is done by api.workers.announcement_fanout, not the request.
+-- One row per announcement tracks progress; last_user_id is the keyset
+-- checkpoint a restarted worker resumes from.
+
+CREATE TABLE IF NOT EXISTS announcement_fanouts (
+    announcement_id INTEGER PRIMARY KEY REFERENCES announcements(id) ON DELETE CASCADE,
+    group_id INTEGER NOT NULL REFERENCES groups(id) ON DELETE CASCADE,
+    message TEXT NOT NULL,
+    extra_info JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'running', 'completed', 'failed')),
+    total_recipients INTEGER,
+    processed INTEGER NOT NULL DEFAULT 0,
+    published INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    last_user_id INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS announcement_fanout_failures (
+    announcement_id INTEGER NOT NULL REFERENCES announcement_fanouts(announcement_id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (announcement_id, user_id)
+);
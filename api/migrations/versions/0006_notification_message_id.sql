@@ -0,0 +1,8 @@
+-- notifications are written by api.workers.notification_persister from the broker.
+-- message_id is the id the publisher sets on every message; the unique index makes
+-- redelivered messages no-ops.
+
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS message_id UUID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS notifications_message_id_key
+    ON notifications (message_id);
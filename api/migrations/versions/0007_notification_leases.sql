@@ -0,0 +1,13 @@
+-- Delivery workers lease pending notifications through POST /notifications/claim.
+-- A notification stays 'pending' while leased; it can be claimed again once
+-- lease_expires_at has passed without a report from lease_owner.
+
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS delivery_attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS last_error TEXT;
+
+-- Claims take the oldest pending rows first
+CREATE INDEX IF NOT EXISTS notifications_pending_claim_idx
+    ON notifications (created_at, id)
+    WHERE status = 'pending';
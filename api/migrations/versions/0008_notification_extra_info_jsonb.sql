@@ -0,0 +1,19 @@
+-- notifications.extra_info becomes JSONB so the driver returns it decoded and it
+-- can be filtered on (GET /notifications?ticket_id=...). Legacy values that are
+-- not valid JSON are kept as JSON strings rather than failing the migration.
+
+CREATE OR REPLACE FUNCTION pg_temp.text_to_jsonb(value TEXT) RETURNS JSONB AS $$
+BEGIN
+    RETURN value::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN to_jsonb(value);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+ALTER TABLE notifications
+    ALTER COLUMN extra_info TYPE JSONB USING pg_temp.text_to_jsonb(extra_info);
+
+-- Containment (extra_info @> '{"ticket_id": "AB123"}') on any key, including
+-- the commonly filtered ticket_id, group and phone
+CREATE INDEX IF NOT EXISTS notifications_extra_info_idx
+    ON notifications USING GIN (extra_info jsonb_path_ops);
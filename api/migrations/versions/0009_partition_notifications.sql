@@ -0,0 +1,109 @@
+-- notifications becomes a table range-partitioned by month on created_at.
+-- Future partitions are created ahead of time by notifications_ensure_partitions()
+-- and old ones detached and dropped by api.workers.notification_partitions, so
+-- retention never runs a bulk DELETE.
+--
+-- Postgres can't partition a table in place: the existing table is renamed,
+-- its rows are copied into the new partitions and it is dropped.
+
+ALTER TABLE notifications RENAME TO notifications_unpartitioned;
+ALTER TABLE notifications_unpartitioned RENAME CONSTRAINT notifications_pkey TO notifications_unpartitioned_pkey;
+DROP INDEX IF EXISTS notifications_user_id_idx;
+DROP INDEX IF EXISTS notifications_status_idx;
+DROP INDEX IF EXISTS notifications_pending_created_idx;
+DROP INDEX IF EXISTS notifications_pending_claim_idx;
+DROP INDEX IF EXISTS notifications_message_id_key;
+DROP INDEX IF EXISTS notifications_extra_info_idx;
+
+CREATE TABLE notifications (
+    id INTEGER NOT NULL DEFAULT nextval('notifications_id_seq'),
+    message TEXT NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    type VARCHAR(50) NOT NULL,
+    extra_info JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    message_id UUID,
+    lease_owner TEXT,
+    lease_expires_at TIMESTAMP,
+    delivery_attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    -- Unique constraints on a partitioned table must include the partition key
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Keep the id sequence when the old table is dropped
+ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id;
+
+-- Catches rows outside every monthly partition (e.g. a replayed message from long ago)
+CREATE TABLE IF NOT EXISTS notifications_default PARTITION OF notifications DEFAULT;
+
+-- Idempotent inserts: a redelivered message has the same id and created_at
+CREATE UNIQUE INDEX IF NOT EXISTS notifications_message_id_key
+    ON notifications (message_id, created_at);
+CREATE INDEX IF NOT EXISTS notifications_user_id_idx
+    ON notifications (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS notifications_extra_info_idx
+    ON notifications USING GIN (extra_info jsonb_path_ops);
+-- The pending set stays small however much delivered history accumulates;
+-- serves both GET /notifications/pending and the oldest-first claims
+CREATE INDEX IF NOT EXISTS notifications_pending_idx
+    ON notifications (created_at, id)
+    WHERE status = 'pending';
+
+-- Create the monthly partition containing month_start, moving any rows that
+-- already landed in the default partition. Returns its name, or NULL if it existed.
+CREATE OR REPLACE FUNCTION notifications_create_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    lower_bound DATE := date_trunc('month', month_start)::date;
+    upper_bound DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::date;
+    partition_name TEXT := format('notifications_p%s', to_char(date_trunc('month', month_start), 'YYYY_MM'));
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE notifications INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM notifications_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        lower_bound, upper_bound, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE notifications ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, lower_bound, upper_bound
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Make sure partitions exist for the current month and the next months_ahead months
+CREATE OR REPLACE FUNCTION notifications_ensure_partitions(months_ahead INTEGER) RETURNS SETOF TEXT AS $$
+    SELECT p
+    FROM generate_series(
+        date_trunc('month', CURRENT_DATE),
+        date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead),
+        INTERVAL '1 month'
+    ) AS m,
+    LATERAL notifications_create_partition(m::date) AS p
+    WHERE p IS NOT NULL;
+$$ LANGUAGE sql;
+
+-- Partitions for existing history, then the months ahead
+SELECT notifications_create_partition(m::date)
+FROM generate_series(
+    date_trunc('month', (SELECT min(COALESCE(created_at, updated_at)) FROM notifications_unpartitioned)),
+    date_trunc('month', CURRENT_DATE),
+    INTERVAL '1 month'
+) AS m;
+
+SELECT notifications_ensure_partitions(3);
+
+INSERT INTO notifications (id, message, user_id, status, type, extra_info, created_at, updated_at,
+                           message_id, lease_owner, lease_expires_at, delivery_attempts, last_error)
+SELECT id, message, user_id, status, type, extra_info, COALESCE(created_at, updated_at, CURRENT_TIMESTAMP), updated_at,
+       message_id, lease_owner, lease_expires_at, delivery_attempts, last_error
+FROM notifications_unpartitioned;
+
+DROP TABLE notifications_unpartitioned;
@@ -0,0 +1,4 @@
+-- Parameters for the 'announcement_created' template, used instead of the
+-- rendered message when NOTIFICATION_TEMPLATES is enabled.
+
+ALTER TABLE announcement_fanouts ADD COLUMN IF NOT EXISTS template_params JSONB;
@@ -0,0 +1,121 @@
+-- Unread-announcement badges read one maintained counter per (member, group)
+-- instead of counting announcements NOT EXISTS in announcement_reads on
+-- every request. Triggers keep the counters current; drift (e.g. from rows
+-- changed with the triggers disabled) is repaired by api.workers.unread_counters.
+
+CREATE TABLE IF NOT EXISTS group_unread_counts (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    group_id INTEGER NOT NULL REFERENCES groups(id) ON DELETE CASCADE,
+    unread_count INTEGER NOT NULL DEFAULT 0 CHECK (unread_count >= 0),
+    PRIMARY KEY (user_id, group_id)
+);
+
+-- The triggers update every member of one group at a time
+CREATE INDEX IF NOT EXISTS group_unread_counts_group_idx
+    ON group_unread_counts (group_id, user_id);
+
+-- New members start with every existing announcement of the group unread
+-- (less any they somehow already read)
+CREATE OR REPLACE FUNCTION group_unread_counts_members_added() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO group_unread_counts (user_id, group_id, unread_count)
+    SELECT m.user_id, m.group_id,
+           (SELECT COUNT(*) FROM announcements a
+            WHERE a.group_id = m.group_id
+            AND NOT EXISTS (
+                SELECT 1 FROM announcement_reads ar
+                WHERE ar.announcement_id = a.id AND ar.user_id = m.user_id
+            ))
+    FROM added m
+    ON CONFLICT (user_id, group_id) DO UPDATE SET unread_count = EXCLUDED.unread_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION group_unread_counts_members_removed() RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM group_unread_counts c
+    USING removed m
+    WHERE c.user_id = m.user_id AND c.group_id = m.group_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION group_unread_counts_announcements_added() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE group_unread_counts c
+    SET unread_count = c.unread_count + n.new_count
+    FROM (SELECT group_id, COUNT(*) AS new_count FROM added GROUP BY group_id) n
+    WHERE c.group_id = n.group_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Runs BEFORE the delete: the announcement's reads are cascade-deleted with it,
+-- and they are needed to tell which members still had it unread
+CREATE OR REPLACE FUNCTION group_unread_counts_announcement_removed() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE group_unread_counts c
+    SET unread_count = GREATEST(c.unread_count - 1, 0)
+    WHERE c.group_id = OLD.group_id
+    AND NOT EXISTS (
+        SELECT 1 FROM announcement_reads ar
+        WHERE ar.announcement_id = OLD.id AND ar.user_id = c.user_id
+    );
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fires only for reads actually inserted: ON CONFLICT DO NOTHING skips re-reads
+CREATE OR REPLACE FUNCTION group_unread_counts_reads_added() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE group_unread_counts c
+    SET unread_count = GREATEST(c.unread_count - n.read_count, 0)
+    FROM (
+        SELECT r.user_id, a.group_id, COUNT(*) AS read_count
+        FROM added r
+        JOIN announcements a ON a.id = r.announcement_id
+        GROUP BY r.user_id, a.group_id
+    ) n
+    WHERE c.user_id = n.user_id AND c.group_id = n.group_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS group_unread_counts_members_added ON user_groups;
+CREATE TRIGGER group_unread_counts_members_added
+    AFTER INSERT ON user_groups
+    REFERENCING NEW TABLE AS added
+    FOR EACH STATEMENT EXECUTE FUNCTION group_unread_counts_members_added();
+
+DROP TRIGGER IF EXISTS group_unread_counts_members_removed ON user_groups;
+CREATE TRIGGER group_unread_counts_members_removed
+    AFTER DELETE ON user_groups
+    REFERENCING OLD TABLE AS removed
+    FOR EACH STATEMENT EXECUTE FUNCTION group_unread_counts_members_removed();
+
+DROP TRIGGER IF EXISTS group_unread_counts_announcements_added ON announcements;
+CREATE TRIGGER group_unread_counts_announcements_added
+    AFTER INSERT ON announcements
+    REFERENCING NEW TABLE AS added
+    FOR EACH STATEMENT EXECUTE FUNCTION group_unread_counts_announcements_added();
+
+DROP TRIGGER IF EXISTS group_unread_counts_announcement_removed ON announcements;
+CREATE TRIGGER group_unread_counts_announcement_removed
+    BEFORE DELETE ON announcements
+    FOR EACH ROW EXECUTE FUNCTION group_unread_counts_announcement_removed();
+
+DROP TRIGGER IF EXISTS group_unread_counts_reads_added ON announcement_reads;
+CREATE TRIGGER group_unread_counts_reads_added
+    AFTER INSERT ON announcement_reads
+    REFERENCING NEW TABLE AS added
+    FOR EACH STATEMENT EXECUTE FUNCTION group_unread_counts_reads_added();
+
+-- Backfill every existing membership
+INSERT INTO group_unread_counts (user_id, group_id, unread_count)
+SELECT ug.user_id, ug.group_id, COUNT(a.id) FILTER (WHERE ar.user_id IS NULL)
+FROM user_groups ug
+LEFT JOIN announcements a ON a.group_id = ug.group_id
+LEFT JOIN announcement_reads ar ON ar.announcement_id = a.id AND ar.user_id = ug.user_id
+GROUP BY ug.user_id, ug.group_id
+ON CONFLICT (user_id, group_id) DO UPDATE SET unread_count = EXCLUDED.unread_count;
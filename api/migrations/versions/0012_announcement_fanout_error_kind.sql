@@ -0,0 +1,6 @@
+-- Why the last fan-out attempt stopped: 'broker_unavailable' (RabbitMQ down or
+-- its circuit open; the attempt is not counted and the event is retried) or
+-- 'error' (counted towards the worker's attempt limit).
+
+ALTER TABLE announcement_fanouts ADD COLUMN IF NOT EXISTS last_error_kind TEXT
+    CHECK (last_error_kind IN ('broker_unavailable', 'error'));
@@ -0,0 +1,64 @@
+-- Serialize the unread-counter triggers per group. Without this, a member added
+-- while an announcement is being created can miss it for good: the member's
+-- trigger counts announcements from a snapshot without the new one, and the
+-- announcement's trigger updates counters from a snapshot without the new
+-- member's row. Each trigger now first takes a transaction-level advisory lock
+-- on (8412, group_id); its statements after that see whatever the other
+-- transaction committed. Locks are taken in group_id order so statements
+-- touching several groups can't deadlock. api.workers.unread_counters takes
+-- the same locks (GROUP_LOCK_SPACE there must stay 8412).
+--
+-- Checked by: python -m api.migrations check group_unread_counts
+
+CREATE OR REPLACE FUNCTION group_unread_counts_lock(group_ids INTEGER[]) RETURNS VOID AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(8412, g.group_id)
+    FROM (SELECT DISTINCT unnest(group_ids) AS group_id ORDER BY 1) g;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION group_unread_counts_members_added() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM group_unread_counts_lock(ARRAY(SELECT group_id FROM added));
+
+    INSERT INTO group_unread_counts (user_id, group_id, unread_count)
+    SELECT m.user_id, m.group_id,
+           (SELECT COUNT(*) FROM announcements a
+            WHERE a.group_id = m.group_id
+            AND NOT EXISTS (
+                SELECT 1 FROM announcement_reads ar
+                WHERE ar.announcement_id = a.id AND ar.user_id = m.user_id
+            ))
+    FROM added m
+    ON CONFLICT (user_id, group_id) DO UPDATE SET unread_count = EXCLUDED.unread_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION group_unread_counts_announcements_added() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM group_unread_counts_lock(ARRAY(SELECT group_id FROM added));
+
+    UPDATE group_unread_counts c
+    SET unread_count = c.unread_count + n.new_count
+    FROM (SELECT group_id, COUNT(*) AS new_count FROM added GROUP BY group_id) n
+    WHERE c.group_id = n.group_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A member added while an announcement is being deleted would otherwise count it
+CREATE OR REPLACE FUNCTION group_unread_counts_announcement_removed() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM group_unread_counts_lock(ARRAY[OLD.group_id]);
+
+    UPDATE group_unread_counts c
+    SET unread_count = GREATEST(c.unread_count - 1, 0)
+    WHERE c.group_id = OLD.group_id
+    AND NOT EXISTS (
+        SELECT 1 FROM announcement_reads ar
+        WHERE ar.announcement_id = OLD.id AND ar.user_id = c.user_id
+    );
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
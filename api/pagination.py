@@ -0,0 +1,71 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Column every keyset query selects so the next cursor can be built from the last row
+PAGE_KEY = 'page_key'
+
+
+class InvalidPageRequest(ValueError):
+    """Raised when the limit or cursor query parameters cannot be parsed."""
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode the (sort value, id) of the last row of a page as an opaque token."""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a token produced by encode_cursor back into (sort value, id)."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return sort_value, row_id
+    except (ValueError, TypeError):
+        raise InvalidPageRequest("Invalid cursor")
+
+
+def wants_pagination():
+    """Paginate unless the client explicitly asks for the legacy, unpaginated list."""
+    return request.args.get('paginate', 'true').lower() not in ('false', '0', 'no')
+
+
+def get_page_args():
+    """Return (limit, cursor) from the query string, with cursor decoded or None."""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPageRequest("limit must be an integer")
+    if limit < 1:
+        raise InvalidPageRequest("limit must be positive")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    token = request.args.get('cursor')
+    return limit, decode_cursor(token) if token else None
+
+
+def build_page(rows, limit):
+    """Turn ``limit + 1`` fetched rows into a page with a next-cursor token."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_cursor(rows[-1][PAGE_KEY], rows[-1]['id'])
+
+    for row in rows:
+        row.pop(PAGE_KEY, None)
+
+    return {
+        "items": rows,
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }
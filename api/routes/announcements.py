@@ -1,7 +1,11 @@
 from flask import Blueprint, request, jsonify
 import logging
-from api.database import get_db_connection, dict_cursor
-from api.services.rabbitmq import rabbitmq
+from api.database import get_db_connection, dict_cursor, on_commit
+from api.streaming import get_stream_format, stream_query
+from api.services.outbox import enqueue_announcement_fanout, enqueue_announcement_event
+from api.services.notification_templates import render
+from api.services.authorization import authorization
+from api.services.response_cache import response_cache
 
 logger = logging.getLogger(__name__)
 # Create blueprint
@@ -16,26 +20,21 @@ def create_announcement(group_id):
     
     try:
         # Check if the group exists
-        cur.execute("SELECT * FROM groups WHERE id = %s;", (group_id,))
-        group = cur.fetchone()
+        group = authorization.group(cur, group_id)
         
         if not group:
             cur.close()
-            conn.close()
             return jsonify({"error": "Group not found"}), 404
         
         # Check if the user is authorized (must be the teacher who owns the group or an admin)
-        cur.execute("SELECT * FROM users WHERE id = %s;", (data['teacher_id'],))
-        teacher = cur.fetchone()
+        teacher = authorization.user(cur, data['teacher_id'])
         
         if not teacher:
             cur.close()
-            conn.close()
             return jsonify({"error": "Teacher not found"}), 404
         
-        if teacher['user_role'] != 'admin' and (teacher['user_role'] != 'teacher' or teacher['id'] != group['teacher_id']):
+        if not authorization.can_manage_group(teacher, group):
             cur.close()
-            conn.close()
             return jsonify({"error": "Only the teacher who owns the group or an admin can create announcements"}), 403
         
         # Create the announcement
@@ -44,26 +43,14 @@ def create_announcement(group_id):
             INSERT INTO announcements (group_id, teacher_id, title, content, is_pinned)
             VALUES (%s, %s, %s, %s, %s) RETURNING *;
             """,
-            (group_id, data['teacher_id'], data['title'], data['content'], data.get('is_pinned', False))
+            (group['id'], teacher['id'], data['title'], data['content'], data.get('is_pinned', False))
         )
         
         announcement = cur.fetchone()
         
-        # Get all users in the group with their phone numbers
-        cur.execute(
-            """
-            SELECT ug.user_id, u.phone, u.user_name 
-            FROM user_groups ug
-            LEFT JOIN users u ON ug.user_id = u.id
-            WHERE ug.group_id = %s;
-            """,
-            (group_id,)
-        )
-        
-        group_members = cur.fetchall()
-        
         # Create a notification message
-        notification_message = f"Nuevo anuncio en {group['name']}:\n\n{data['title']}\n {data['content'][:100]}..."
+        template_params = {"group_name": group['name'], "title": data['title'], "excerpt": data['content'][:100]}
+        notification_message = render('announcement_created', template_params)
         
         # Create the extra_info as a dict
         extra_info = {
@@ -72,43 +59,27 @@ def create_announcement(group_id):
             "announcement_id": announcement['id']
         }
         
-        # Send notifications through RabbitMQ
-        notification_failures = []
-        for member in group_members:
-            success = rabbitmq.publish_notification(
-                user_id=member['user_id'],
-                message=notification_message,
-                notification_type='group',
-                extra_info={
-                    **extra_info,
-                    "phone": member['phone'],
-                    "user_name": member['user_name']
-                }
-            )
-            if not success:
-                notification_failures.append(member['user_id'])
+        # Queue a single fan-out event in the same transaction; a worker notifies the members
+        enqueue_announcement_fanout(cur, announcement['id'], group['id'], notification_message, extra_info, template_params)
         
+        # Members' unread counts in /users/<id>/groups
+        on_commit(response_cache.invalidate, f"group:{group['id']}:announcements")
         conn.commit()
         
         # Add teacher name to the response
         announcement['teacher_name'] = teacher['user_name']
         
         # Add notification status to the response
-        if not notification_failures:
-            announcement['notification_status'] = 'queued'
-        else:
-            announcement['notification_status'] = 'partial'
-            announcement['failed_notifications'] = notification_failures
+        announcement['notification_status'] = 'queued'
+        announcement['fanout_status_url'] = f"/groups/{group_id}/announcements/{announcement['id']}/fanout"
         
         cur.close()
-        conn.close()
         
         return jsonify(announcement), 201
         
     except Exception as e:
         conn.rollback()
         cur.close()
-        conn.close()
         logger.error(f"Error creating announcement: {str(e)}", exc_info=True)
         return jsonify({"error": "An error occurred while creating the announcement"}), 500
 
@@ -124,45 +95,25 @@ def get_group_announcements(group_id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the group exists
-    cur.execute("SELECT * FROM groups WHERE id = %s;", (group_id,))
-    group = cur.fetchone()
+    group = authorization.group(cur, group_id)
     
     if not group:
         cur.close()
-        conn.close()
         return jsonify({"error": "Group not found"}), 404
     
     # Check if the user is authorized (must be a member of the group, the teacher, or an admin)
-    cur.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-    user = cur.fetchone()
+    user = authorization.user(cur, user_id)
     
     if not user:
         cur.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
-    is_authorized = False
-    
-    # Check if admin or the group's teacher
-    if user['user_role'] == 'admin' or (user['user_role'] == 'teacher' and user['id'] == group['teacher_id']):
-        is_authorized = True
-    else:
-        # Check if user is a member of the group
-        cur.execute(
-            "SELECT * FROM user_groups WHERE user_id = %s AND group_id = %s;",
-            (user_id, group_id)
-        )
-        membership = cur.fetchone()
-        is_authorized = membership is not None
-    
-    if not is_authorized:
+    if not authorization.can_view_group(cur, user, group):
         cur.close()
-        conn.close()
         return jsonify({"error": "User is not authorized to view announcements for this group"}), 403
     
     # Get all announcements for the group, with read status
-    cur.execute(
-        """
+    query = """
         SELECT 
             a.*, 
             u.user_name as teacher_name,
@@ -172,13 +123,16 @@ def get_group_announcements(group_id):
         LEFT JOIN announcement_reads ar ON a.id = ar.announcement_id AND ar.user_id = %s
         WHERE a.group_id = %s
         ORDER BY a.is_pinned DESC, a.created_at DESC;
-        """,
-        (user_id, group_id)
-    )
+        """
+    
+    stream_format = get_stream_format()
+    if stream_format:
+        cur.close()
+        return stream_query(query, (user_id, group_id), stream_format)
     
+    cur.execute(query, (user_id, group_id))
     announcements = cur.fetchall()
     cur.close()
-    conn.close()
     
     return jsonify(announcements)
 
@@ -202,39 +156,20 @@ def get_announcement(group_id, announcement_id):
     
     if not announcement:
         cur.close()
-        conn.close()
         return jsonify({"error": "Announcement not found"}), 404
     
     # Get the group
-    cur.execute("SELECT * FROM groups WHERE id = %s;", (group_id,))
-    group = cur.fetchone()
+    group = authorization.group(cur, announcement['group_id'])
     
     # Check if the user is authorized (must be a member of the group, the teacher, or an admin)
-    cur.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-    user = cur.fetchone()
+    user = authorization.user(cur, user_id)
     
     if not user:
         cur.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
-    is_authorized = False
-    
-    # Check if admin or the group's teacher
-    if user['user_role'] == 'admin' or (user['user_role'] == 'teacher' and user['id'] == group['teacher_id']):
-        is_authorized = True
-    else:
-        # Check if user is a member of the group
-        cur.execute(
-            "SELECT * FROM user_groups WHERE user_id = %s AND group_id = %s;",
-            (user_id, group_id)
-        )
-        membership = cur.fetchone()
-        is_authorized = membership is not None
-    
-    if not is_authorized:
+    if not authorization.can_view_group(cur, user, group):
         cur.close()
-        conn.close()
         return jsonify({"error": "User is not authorized to view this announcement"}), 403
     
     # Get the announcement with teacher name
@@ -260,9 +195,9 @@ def get_announcement(group_id, announcement_id):
         (announcement_id, user_id)
     )
     
+    on_commit(response_cache.invalidate, f"user:{user['id']}:groups")
     conn.commit()
     cur.close()
-    conn.close()
     
     return jsonify(detailed_announcement)
 
@@ -282,21 +217,17 @@ def update_announcement(group_id, announcement_id):
     
     if not announcement:
         cur.close()
-        conn.close()
         return jsonify({"error": "Announcement not found"}), 404
     
     # Check if the user is authorized (must be the teacher who created the announcement or an admin)
-    cur.execute("SELECT * FROM users WHERE id = %s;", (data['user_id'],))
-    user = cur.fetchone()
+    user = authorization.user(cur, data['user_id'])
     
     if not user:
         cur.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
-    if user['user_role'] != 'admin' and (user['user_role'] != 'teacher' or user['id'] != announcement['teacher_id']):
+    if not authorization.owns(user, announcement['teacher_id']):
         cur.close()
-        conn.close()
         return jsonify({"error": "Only the teacher who created the announcement or an admin can update it"}), 403
     
     # Update the announcement
@@ -316,7 +247,6 @@ def update_announcement(group_id, announcement_id):
     updated_announcement['teacher_name'] = user['user_name']
     
     cur.close()
-    conn.close()
     
     return jsonify(updated_announcement)
 
@@ -340,21 +270,17 @@ def delete_announcement(group_id, announcement_id):
     
     if not announcement:
         cur.close()
-        conn.close()
         return jsonify({"error": "Announcement not found"}), 404
     
     # Check if the user is authorized (must be the teacher who created the announcement or an admin)
-    cur.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-    user = cur.fetchone()
+    user = authorization.user(cur, user_id)
     
     if not user:
         cur.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
-    if user['user_role'] != 'admin' and (user['user_role'] != 'teacher' or user['id'] != announcement['teacher_id']):
+    if not authorization.owns(user, announcement['teacher_id']):
         cur.close()
-        conn.close()
         return jsonify({"error": "Only the teacher who created the announcement or an admin can delete it"}), 403
     
     # Delete the announcement
@@ -364,14 +290,146 @@ def delete_announcement(group_id, announcement_id):
     )
     
     result = cur.fetchone()
+    on_commit(response_cache.invalidate, f"group:{announcement['group_id']}:announcements")
     conn.commit()
     cur.close()
-    conn.close()
     
     if result:
         return jsonify({"message": "Announcement deleted successfully"})
     return jsonify({"error": "Failed to delete announcement"}), 500
 
+@announcements_bp.route("/groups/<group_id>/announcements/<announcement_id>/fanout", methods=["GET"])
+def get_announcement_fanout(group_id, announcement_id):
+    """Get notification fan-out progress and failed recipients (teacher who created it or admin only)"""
+    user_id = request.args.get('user_id')
+    
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    
+    try:
+        failures_limit = min(int(request.args.get('failures_limit', 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "failures_limit must be an integer"}), 400
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    
+    cur.execute(
+        """
+        SELECT f.announcement_id, f.group_id, f.status, f.total_recipients, f.processed,
+               f.published, f.failed, f.attempts, f.last_error, f.last_error_kind, f.created_at, f.started_at,
+               f.updated_at, f.completed_at, a.teacher_id
+        FROM announcement_fanouts f
+        JOIN announcements a ON a.id = f.announcement_id
+        WHERE f.announcement_id = %s AND f.group_id = %s;
+        """,
+        (announcement_id, group_id)
+    )
+    fanout = cur.fetchone()
+    
+    if not fanout:
+        cur.close()
+        return jsonify({"error": "Announcement fan-out not found"}), 404
+    
+    requester = authorization.user(cur, user_id)
+    if requester is None:
+        cur.close()
+        return jsonify({"error": "User not found"}), 404
+    
+    if not authorization.owns(requester, fanout['teacher_id']):
+        cur.close()
+        return jsonify({"error": "Only the teacher who created the announcement or an admin can view its delivery status"}), 403
+    
+    cur.execute(
+        """
+        SELECT f.user_id, u.user_name, f.reason, f.created_at
+        FROM announcement_fanout_failures f
+        LEFT JOIN users u ON u.id = f.user_id
+        WHERE f.announcement_id = %s
+        ORDER BY f.user_id
+        LIMIT %s;
+        """,
+        (announcement_id, failures_limit)
+    )
+    fanout['failed_recipients'] = cur.fetchall()
+    cur.close()
+    
+    total = fanout['total_recipients']
+    fanout['progress'] = round(fanout['processed'] / total, 4) if total else (1.0 if fanout['status'] == 'completed' else 0.0)
+    if fanout['status'] == 'failed':
+        fanout['retry_url'] = f"/groups/{group_id}/announcements/{announcement_id}/fanout/retry"
+    
+    return jsonify(fanout)
+
+@announcements_bp.route("/groups/<group_id>/announcements/<announcement_id>/fanout/retry", methods=["POST"])
+def retry_announcement_fanout(group_id, announcement_id):
+    """Requeue a failed fan-out; it resumes after the last member already notified (teacher who created it or admin only)"""
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    
+    try:
+        cur.execute(
+            """
+            SELECT f.announcement_id, f.group_id, f.status, a.teacher_id
+            FROM announcement_fanouts f
+            JOIN announcements a ON a.id = f.announcement_id
+            WHERE f.announcement_id = %s AND f.group_id = %s
+            FOR UPDATE OF f;
+            """,
+            (announcement_id, group_id)
+        )
+        fanout = cur.fetchone()
+        
+        if not fanout:
+            conn.rollback()
+            cur.close()
+            return jsonify({"error": "Announcement fan-out not found"}), 404
+        
+        requester = authorization.user(cur, user_id)
+        if requester is None:
+            conn.rollback()
+            cur.close()
+            return jsonify({"error": "User not found"}), 404
+        
+        if not authorization.owns(requester, fanout['teacher_id']):
+            conn.rollback()
+            cur.close()
+            return jsonify({"error": "Only the teacher who created the announcement or an admin can retry its delivery"}), 403
+        
+        if fanout['status'] != 'failed':
+            conn.rollback()
+            cur.close()
+            return jsonify({"error": f"Only failed fan-outs can be retried (status is {fanout['status']})"}), 409
+        
+        cur.execute(
+            """
+            UPDATE announcement_fanouts
+            SET status = 'pending', attempts = 0, updated_at = CURRENT_TIMESTAMP
+            WHERE announcement_id = %s;
+            """,
+            (fanout['announcement_id'],)
+        )
+        enqueue_announcement_event(cur, fanout['announcement_id'], fanout['group_id'])
+        conn.commit()
+        cur.close()
+        
+        return jsonify({
+            "message": "Announcement fan-out requeued",
+            "fanout_status_url": f"/groups/{group_id}/announcements/{announcement_id}/fanout"
+        }), 202
+    
+    except Exception as e:
+        conn.rollback()
+        cur.close()
+        logger.error(f"Error retrying announcement fan-out: {str(e)}", exc_info=True)
+        return jsonify({"error": "An error occurred while retrying the announcement fan-out"}), 500
+
 @announcements_bp.route("/users/<user_id>/announcements", methods=["GET"])
 def get_user_announcements(user_id):
     """Get all announcements for groups that a user belongs to"""
@@ -379,17 +437,14 @@ def get_user_announcements(user_id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the user exists
-    cur.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-    user = cur.fetchone()
+    user = authorization.user(cur, user_id)
     
     if not user:
         cur.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
     # Get all announcements for groups that the user belongs to
-    cur.execute(
-        """
+    query = """
         SELECT 
             a.*, 
             g.name as group_name,
@@ -401,13 +456,16 @@ def get_user_announcements(user_id):
         JOIN user_groups ug ON g.id = ug.group_id AND ug.user_id = %s
         LEFT JOIN announcement_reads ar ON a.id = ar.announcement_id AND ar.user_id = %s
         ORDER BY a.is_pinned DESC, a.created_at DESC;
-        """,
-        (user_id, user_id)
-    )
+        """
+    
+    stream_format = get_stream_format()
+    if stream_format:
+        cur.close()
+        return stream_query(query, (user_id, user_id), stream_format)
     
+    cur.execute(query, (user_id, user_id))
     announcements = cur.fetchall()
     cur.close()
-    conn.close()
     
     return jsonify(announcements)
 
@@ -418,34 +476,33 @@ def get_teacher_announcements(teacher_id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the teacher exists
-    cur.execute("SELECT * FROM users WHERE id = %s;", (teacher_id,))
-    teacher = cur.fetchone()
+    teacher = authorization.user(cur, teacher_id)
     
     if not teacher:
         cur.close()
-        conn.close()
         return jsonify({"error": "Teacher not found"}), 404
     
-    if teacher['user_role'] != 'teacher' and teacher['user_role'] != 'admin':
+    if not authorization.is_staff(teacher):
         cur.close()
-        conn.close()
         return jsonify({"error": "User is not a teacher or admin"}), 403
     
     # Get all announcements created by this teacher
-    cur.execute(
-        """
+    query = """
         SELECT a.*, g.name as group_name
         FROM announcements a
         JOIN groups g ON a.group_id = g.id
         WHERE a.teacher_id = %s
         ORDER BY a.created_at DESC;
-        """,
-        (teacher_id,)
-    )
+        """
+    
+    stream_format = get_stream_format()
+    if stream_format:
+        cur.close()
+        return stream_query(query, (teacher_id,), stream_format)
     
+    cur.execute(query, (teacher_id,))
     announcements = cur.fetchall()
     cur.close()
-    conn.close()
     
     return jsonify(announcements)
 
@@ -467,44 +524,20 @@ def mark_announcement_read(announcement_id):
     
     if not announcement:
         cur.close()
-        conn.close()
         return jsonify({"error": "Announcement not found"}), 404
     
     # Check if the user exists
-    cur.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-    user = cur.fetchone()
+    user = authorization.user(cur, user_id)
     
     if not user:
         cur.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
-    # Check if the user is authorized to read this announcement
-    cur.execute(
-        """
-        SELECT * FROM user_groups
-        WHERE user_id = %s AND group_id = %s;
-        """,
-        (user_id, announcement['group_id'])
-    )
-    
-    membership = cur.fetchone()
-    
     # Allow if user is a member, admin, or the group's teacher
-    is_authorized = membership is not None or user['user_role'] == 'admin'
-    
-    if not is_authorized:
-        # Check if user is the teacher of this group
-        cur.execute(
-            "SELECT * FROM groups WHERE id = %s AND teacher_id = %s;",
-            (announcement['group_id'], user_id)
-        )
-        is_teacher = cur.fetchone() is not None
-        is_authorized = is_teacher
+    group = authorization.group(cur, announcement['group_id'])
     
-    if not is_authorized:
+    if not authorization.can_read_group(cur, user, group):
         cur.close()
-        conn.close()
         return jsonify({"error": "User is not authorized to read this announcement"}), 403
     
     # Mark the announcement as read
@@ -519,8 +552,8 @@ def mark_announcement_read(announcement_id):
     )
     
     result = cur.fetchone()
+    on_commit(response_cache.invalidate, f"user:{user['id']}:groups")
     conn.commit()
     cur.close()
-    conn.close()
     
     return jsonify({"message": "Announcement marked as read", "success": True})
@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify
 import logging
-from api.database import get_db_connection, dict_cursor
-from api.services.rabbitmq import rabbitmq  # Import the rabbitmq service
+from api.database import get_db_connection, dict_cursor, on_commit
+from api.streaming import get_stream_format, stream_query
+from api.services.outbox import enqueue_notification
+from api.services.notification_templates import render
+from api.services.response_cache import response_cache
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -10,23 +13,28 @@ logger = logging.getLogger(__name__)
 comments_bp = Blueprint('comments', __name__)
 
 @comments_bp.route("/tickets/<id>/comments", methods=["GET"])
+@response_cache.cached(lambda body, id: [f"ticket:{id}:comments"])
 def get_ticket_comments(id):
     """Get all comments for a specific ticket"""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    
     # Join with users table to get the username for each comment
-    cur.execute("""
+    query = """
         SELECT c.*, u.user_name 
         FROM comments c
         JOIN users u ON c.user_id = u.id
         WHERE c.ticket_id = %s
-        ORDER BY c.created_at ASC;
-    """, (id,))
+        ORDER BY c.created_at ASC, c.id ASC;
+    """
+    
+    stream_format = get_stream_format()
+    if stream_format:
+        return stream_query(query, (id,), stream_format)
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    cur.execute(query, (id,))
     
     comments = cur.fetchall()
     cur.close()
-    conn.close()
     return jsonify(comments)
 
 @comments_bp.route("/tickets/<id>/comments", methods=["POST"])
@@ -38,109 +46,118 @@ def create_comment(id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     try:
-        # Begin transaction
-        cur.execute("BEGIN;")
-        
-        # First check if the ticket exists
-        cur.execute("SELECT * FROM tickets WHERE id = %s;", (id,))
-        ticket = cur.fetchone()
+        # Check permissions, insert the comment and fetch the notification
+        # recipient in a single statement. Permission rules:
+        # - Regular users can only comment on open tickets
+        # - Admin/support users can only comment on tickets assigned to them
+        cur.execute(
+            """
+            WITH ticket AS (
+                SELECT id, user_id, assign_id, status, category, sub_category
+                FROM tickets WHERE id = %(ticket_id)s
+            ),
+            checked AS (
+                SELECT ticket.*,
+                       author.id AS author_id,
+                       author.user_name AS author_name,
+                       author.user_role IN ('admin', 'super-user') AS is_staff,
+                       CASE
+                           WHEN author.id IS NULL THEN 'author_not_found'
+                           WHEN author.user_role NOT IN ('admin', 'super-user') AND ticket.status <> 'open' THEN 'ticket_not_open'
+                           WHEN author.user_role IN ('admin', 'super-user') AND ticket.assign_id IS DISTINCT FROM author.id THEN 'not_assigned'
+                       END AS denied
+                FROM ticket
+                LEFT JOIN users author ON author.id = %(user_id)s
+            ),
+            new_comment AS (
+                INSERT INTO comments (ticket_id, user_id, content)
+                SELECT id, author_id, %(content)s FROM checked WHERE denied IS NULL
+                RETURNING *
+            )
+            SELECT checked.*,
+                   new_comment.id AS comment_id,
+                   new_comment.created_at AS comment_created_at,
+                   recipient.id AS recipient_id,
+                   recipient.phone AS recipient_phone,
+                   recipient.user_name AS recipient_name
+            FROM checked
+            LEFT JOIN new_comment ON true
+            LEFT JOIN users recipient ON recipient.id = checked.user_id AND checked.is_staff;
+            """,
+            {"ticket_id": id, "user_id": data['user_id'], "content": data['content']}
+        )
+        result = cur.fetchone()
         
-        if not ticket:
-            cur.execute("ROLLBACK;")
-            cur.close()
-            conn.close()
+        if not result:
+            conn.rollback()
             return jsonify({"error": "Ticket not found"}), 404
         
-        # Check user role to enforce permission rules
-        cur.execute("SELECT * FROM users WHERE id = %s;", (data['user_id'],))
-        user = cur.fetchone()
+        if result['denied'] == 'author_not_found':
+            conn.rollback()
+            return jsonify({"error": "User not found"}), 404
         
-        # Regular users can only comment on open tickets
-        is_admin_or_support = user['user_role'] in ['admin', 'super-user']
-        if not is_admin_or_support and ticket['status'] != 'open':
-            cur.execute("ROLLBACK;")
-            cur.close()
-            conn.close()
+        if result['denied'] == 'ticket_not_open':
+            conn.rollback()
             return jsonify({"error": "Regular users can only comment on open tickets"}), 403
         
-        # Admin users can only comment on tickets assigned to them
-        if is_admin_or_support and ticket['assign_id'] != user['id']:
-            cur.execute("ROLLBACK;")
-            cur.close()
-            conn.close()
+        if result['denied'] == 'not_assigned':
+            conn.rollback()
             return jsonify({"error": "Support staff can only comment on tickets assigned to them"}), 403
         
-        # Add the comment
-        cur.execute(
-            """
-            INSERT INTO comments (ticket_id, user_id, content)
-            VALUES (%s, %s, %s) RETURNING *;
-            """,
-            (id, data['user_id'], data['content'])
-        )
-        
-        new_comment = cur.fetchone()
+        new_comment = {
+            "id": result['comment_id'],
+            "ticket_id": result['id'],
+            "user_id": result['author_id'],
+            "content": data['content'],
+            "created_at": result['comment_created_at'],
+            # Add the username to the response
+            "user_name": result['author_name']
+        }
         notification_status = None
         
-        # Determine notification recipient
-        notification_recipient_id = None
-        
-        if is_admin_or_support:
-            # If comment is from admin/support, notify the ticket creator
-            notification_recipient_id = ticket['user_id']
-            notification_message = f"Nuevo comentario en tu ticket #{id}: {user['user_name']} \n{data['content']}"
-        
-            # Only send notification if we have a recipient
-            if notification_recipient_id:
-                # Get recipient user details
-                cur.execute("SELECT phone, user_name FROM users WHERE id = %s;", (notification_recipient_id,))
-                recipient = cur.fetchone()
-                
-                if recipient:
-                    # Create extra_info with relevant data
-                    extra_info = {
-                        "ticket_id": id,
-                        "category": ticket['category'],
-                        "sub_category": ticket['sub_category'],
-                        "comment_id": new_comment['id'],
-                        "comment_content": data['content'][:100] + ("..." if len(data['content']) > 100 else ""),
-                        "comment_author": user['user_name'],
-                        "phone": recipient['phone'],
-                        "user_name": recipient['user_name']
-                    }
-                    
-                    # Send notification via RabbitMQ
-                    notification_success = rabbitmq.publish_notification(
-                        user_id=notification_recipient_id,
-                        message=notification_message,
-                        notification_type='comment',
-                        extra_info=extra_info
-                    )
-                    
-                    # Track notification status
-                    if notification_success:
-                        notification_status = 'queued'
-                    else:
-                        notification_status = 'failed'
-        
-        # Add the username to the response
-        new_comment['user_name'] = user['user_name']
+        # If comment is from admin/support, notify the ticket creator
+        if result['is_staff'] and result['recipient_id'] is not None:
+            template_params = {"ticket_id": id, "author_name": result['author_name'], "content": data['content']}
+            notification_message = render('comment_added', template_params)
+            
+            # Create extra_info with relevant data
+            extra_info = {
+                "ticket_id": id,
+                "category": result['category'],
+                "sub_category": result['sub_category'],
+                "comment_id": result['comment_id'],
+                "comment_content": data['content'][:100] + ("..." if len(data['content']) > 100 else ""),
+                "comment_author": result['author_name'],
+                "phone": result['recipient_phone'],
+                "user_name": result['recipient_name']
+            }
+            
+            # Queue the notification in the outbox as part of the same transaction
+            enqueue_notification(
+                cur,
+                user_id=result['user_id'],
+                message=notification_message,
+                notification_type='comment',
+                extra_info=extra_info,
+                template='comment_added',
+                params=template_params
+            )
+            notification_status = 'queued'
+        
+        on_commit(response_cache.invalidate, f"ticket:{id}:comments")
+        conn.commit()
         
         # Add notification status to the response if applicable
         if notification_status:
             new_comment['notification_status'] = notification_status
         
-        # Commit the transaction
-        cur.execute("COMMIT;")
-        
         return jsonify(new_comment), 201
         
     except Exception as e:
         # Rollback in case of error
-        cur.execute("ROLLBACK;")
+        conn.rollback()
         logger.error(f"Error creating comment: {str(e)}", exc_info=True)
         return jsonify({"error": f"Failed to create comment: {str(e)}"}), 500
         
     finally:
         cur.close()
-        conn.close()
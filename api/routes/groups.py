@@ -1,5 +1,7 @@
 from flask import Blueprint, request, jsonify
-from api.database import get_db_connection, dict_cursor
+from api.database import get_db_connection, dict_cursor, on_commit
+from api.services.authorization import authorization
+from api.services.response_cache import response_cache
 
 # Create blueprint
 groups_bp = Blueprint('groups', __name__)
@@ -12,17 +14,14 @@ def create_group():
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the teacher exists
-    cur.execute("SELECT * FROM users WHERE id = %s;", (data['teacher_id'],))
-    teacher = cur.fetchone()
+    teacher = authorization.user(cur, data['teacher_id'])
     
     if not teacher:
         cur.close()
-        conn.close()
         return jsonify({"error": "Teacher not found"}), 404
     
-    if teacher['user_role'] != 'teacher' and teacher['user_role'] != 'admin':
+    if not authorization.is_staff(teacher):
         cur.close()
-        conn.close()
         return jsonify({"error": "User is not a teacher or admin"}), 403
     
     # Create the group
@@ -37,11 +36,11 @@ def create_group():
     group = cur.fetchone()
     conn.commit()
     cur.close()
-    conn.close()
     
     return jsonify(group), 201
 
 @groups_bp.route("/groups/<id>", methods=["GET"])
+@response_cache.cached(lambda body, id: [f"group:{id}"])
 def get_group(id):
     """Get a specific group"""
     conn = get_db_connection()
@@ -51,7 +50,6 @@ def get_group(id):
     group = cur.fetchone()
     
     cur.close()
-    conn.close()
     
     if not group:
         return jsonify({"error": "Group not found"}), 404
@@ -72,69 +70,72 @@ def add_members_to_group(id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the group exists
-    cur.execute("SELECT * FROM groups WHERE id = %s;", (id,))
-    group = cur.fetchone()
+    group = authorization.group(cur, id)
     
     if not group:
         cur.close()
-        conn.close()
         return jsonify({"error": "Group not found"}), 404
     
     # Check if user is authorized (must be the teacher who owns the group or an admin)
-    cur.execute("SELECT * FROM users WHERE id = %s;", (teacher_id,))
-    requester = cur.fetchone()
+    requester = authorization.user(cur, teacher_id)
     
     if not requester:
         cur.close()
-        conn.close() 
         return jsonify({"error": "Requester not found"}), 404
     
-    if requester['user_role'] != 'admin' and (requester['user_role'] != 'teacher' or requester['id'] != group['teacher_id']):
+    if not authorization.can_manage_group(requester, group):
         cur.close()
-        conn.close()
         return jsonify({"error": "Only the teacher who created the group or an admin can add members"}), 403
     
-    # Add members
+    # Resolve every name and add the members in one statement, however long the roster.
+    # user_name isn't unique: like a lookup by name, each name resolves to a single user.
+    cur.execute(
+        """
+        WITH requested AS (
+            SELECT DISTINCT name FROM unnest(%s::text[]) AS r(name)
+        ),
+        matched AS (
+            SELECT DISTINCT ON (r.name) r.name, u.id AS user_id
+            FROM requested r
+            JOIN users u ON u.user_name = r.name
+            ORDER BY r.name, u.id
+        ),
+        inserted AS (
+            INSERT INTO user_groups (user_id, group_id)
+            SELECT user_id, %s FROM matched
+            ON CONFLICT (user_id, group_id) DO NOTHING
+            RETURNING user_id
+        )
+        SELECT m.name, m.user_id, i.user_id IS NOT NULL AS added
+        FROM matched m
+        LEFT JOIN inserted i ON i.user_id = m.user_id;
+        """,
+        ([str(user_name) for user_name in user_names], group['id'])
+    )
+    rows = cur.fetchall()
+    outcome = {row['name']: row['added'] for row in rows}
+    
+    # New members may be cached as non-members, and their group lists are out of date
+    added_ids = [row['user_id'] for row in rows if row['added']]
+    on_commit(authorization.invalidate_membership, group['id'], added_ids)
+    on_commit(response_cache.invalidate, *[f"user:{user_id}:groups" for user_id in added_ids])
+    conn.commit()
+    cur.close()
+    
+    # Report in request order; a name repeated in the request counts as already a member
     added_count = 0
     not_found = []
     already_members = []
-    
+    reported = set()
     for user_name in user_names:
-        # Find user by username
-        cur.execute("SELECT * FROM users WHERE user_name = %s;", (str(user_name),))
-        user = cur.fetchone()
-        
-        if not user:
+        name = str(user_name)
+        if name not in outcome:
             not_found.append(user_name)
-            continue
-        
-        # Check if already a member
-        cur.execute(
-            "SELECT * FROM user_groups WHERE user_id = %s AND group_id = %s;",
-            (user['id'], id)
-        )
-        
-        if cur.fetchone():
-            already_members.append(user_name)
-            continue
-        
-        # Add to group
-        try:
-            cur.execute(
-                """
-                INSERT INTO user_groups (user_id, group_id)
-                VALUES (%s, %s);
-                """,
-                (user['id'], id)
-            )
+        elif outcome[name] and name not in reported:
             added_count += 1
-        except Exception as e:
-            # Handle error
-            print(f"Error adding user {user_name}: {e}")
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+        else:
+            already_members.append(user_name)
+        reported.add(name)
     
     return jsonify({
         "success": True,
@@ -155,26 +156,21 @@ def get_group_members(id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the group exists
-    cur.execute("SELECT * FROM groups WHERE id = %s;", (id,))
-    group = cur.fetchone()
+    group = authorization.group(cur, id)
     
     if not group:
         cur.close()
-        conn.close()
         return jsonify({"error": "Group not found"}), 404
     
     # Check if requester is authorized (teacher who owns the group or admin)
-    cur.execute("SELECT * FROM users WHERE id = %s;", (requester_id,))
-    requester = cur.fetchone()
+    requester = authorization.user(cur, requester_id)
     
     if not requester:
         cur.close()
-        conn.close()
         return jsonify({"error": "Requester not found"}), 404
     
-    if requester['user_role'] != 'admin' and (requester['user_role'] != 'teacher' or requester['id'] != group['teacher_id']):
+    if not authorization.can_manage_group(requester, group):
         cur.close()
-        conn.close()
         return jsonify({"error": "Only the teacher who created the group or an admin can view members"}), 403
     
     # Get all members of the group
@@ -186,12 +182,11 @@ def get_group_members(id):
         WHERE ug.group_id = %s
         ORDER BY u.user_name;
         """,
-        (id,)
+        (group['id'],)
     )
     
     members = cur.fetchall()
     cur.close()
-    conn.close()
     
     return jsonify(members)
 
@@ -202,23 +197,20 @@ def get_group_member_count(id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the group exists
-    cur.execute("SELECT * FROM groups WHERE id = %s;", (id,))
-    group = cur.fetchone()
+    group = authorization.group(cur, id)
     
     if not group:
         cur.close()
-        conn.close()
         return jsonify({"error": "Group not found"}), 404
     
     # Get count of members
     cur.execute(
         "SELECT COUNT(*) as member_count FROM user_groups WHERE group_id = %s;",
-        (id,)
+        (group['id'],)
     )
     
     result = cur.fetchone()
     cur.close()
-    conn.close()
     
     return jsonify({
         "group_id": id,
@@ -232,26 +224,16 @@ def check_user_in_group(group_id, user_id):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=dict_cursor())
     
-    cur.execute(
-        "SELECT * FROM user_groups WHERE user_id = %s AND group_id = %s;",
-        (user_id, group_id)
-    )
-    
-    is_member = cur.fetchone() is not None
+    is_member = authorization.is_member(cur, user_id, group_id)
     
     # If not a member, also check if they're the teacher of the group
     if not is_member:
-        cur.execute(
-            "SELECT * FROM groups WHERE id = %s AND teacher_id = %s;",
-            (group_id, user_id)
-        )
-        is_teacher = cur.fetchone() is not None
+        group = authorization.group(cur, group_id)
         
         # Consider the user part of the group if they're the teacher
-        is_member = is_teacher
+        is_member = group is not None and str(group['teacher_id']) == str(user_id)
     
     cur.close()
-    conn.close()
     
     return jsonify({"is_member": is_member})
 
@@ -262,17 +244,14 @@ def get_teacher_groups(teacher_id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the teacher exists
-    cur.execute("SELECT * FROM users WHERE id = %s;", (teacher_id,))
-    teacher = cur.fetchone()
+    teacher = authorization.user(cur, teacher_id)
     
     if not teacher:
         cur.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
-    if teacher['user_role'] != 'teacher' and teacher['user_role'] != 'admin':
+    if not authorization.is_staff(teacher):
         cur.close()
-        conn.close()
         return jsonify({"error": "User is not a teacher or admin"}), 403
     
     # Get all groups created by this teacher
@@ -282,12 +261,11 @@ def get_teacher_groups(teacher_id):
         WHERE teacher_id = %s
         ORDER BY created_at DESC;
         """,
-        (teacher_id,)
+        (teacher['id'],)
     )
     
     groups = cur.fetchall()
     cur.close()
-    conn.close()
     
     return jsonify(groups)
 
@@ -303,53 +281,46 @@ def get_unread_announcements_count(group_id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if user is a member of the group
-    cur.execute(
-        "SELECT * FROM user_groups WHERE user_id = %s AND group_id = %s;",
-        (user_id, group_id)
-    )
-    
-    membership = cur.fetchone()
-    
-    if not membership:
+    is_member = authorization.is_member(cur, user_id, group_id)
+    if not is_member:
         # Check if user is admin or teacher of the group
-        cur.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-        user = cur.fetchone()
+        user = authorization.user(cur, user_id)
         
-        if not user or (user['user_role'] != 'admin' and user['user_role'] != 'teacher'):
+        if not authorization.is_staff(user):
             cur.close()
-            conn.close()
             return jsonify({"error": "User is not a member of this group"}), 403
         
-        if user['user_role'] == 'teacher':
-            # Check if user is the teacher of this group
-            cur.execute(
-                "SELECT * FROM groups WHERE id = %s AND teacher_id = %s;",
-                (group_id, user_id)
-            )
-            is_teacher = cur.fetchone() is not None
-            
-            if not is_teacher:
-                cur.close()
-                conn.close()
-                return jsonify({"error": "User is not a member or teacher of this group"}), 403
-    
-    # Count unread announcements
-    cur.execute(
-        """
-        SELECT COUNT(*) as unread_count
-        FROM announcements a
-        WHERE a.group_id = %s
-        AND NOT EXISTS (
-            SELECT 1 FROM announcement_reads ar
-            WHERE ar.announcement_id = a.id AND ar.user_id = %s
-        );
-        """,
-        (group_id, user_id)
-    )
+        # Admins may ask about any group; teachers only about their own
+        group = authorization.group(cur, group_id)
+        if not authorization.owns(user, group['teacher_id'] if group else None):
+            cur.close()
+            return jsonify({"error": "User is not a member or teacher of this group"}), 403
     
-    result = cur.fetchone()
+    # Members have a maintained counter
+    result = None
+    if is_member:
+        cur.execute(
+            "SELECT unread_count FROM group_unread_counts WHERE user_id = %s AND group_id = %s;",
+            (user_id, group_id)
+        )
+        result = cur.fetchone()
+    
+    # The group's teacher and admins aren't members: count unread announcements
+    if result is None:
+        cur.execute(
+            """
+            SELECT COUNT(*) as unread_count
+            FROM announcements a
+            WHERE a.group_id = %s
+            AND NOT EXISTS (
+                SELECT 1 FROM announcement_reads ar
+                WHERE ar.announcement_id = a.id AND ar.user_id = %s
+            );
+            """,
+            (group_id, user_id)
+        )
+        result = cur.fetchone()
     cur.close()
-    conn.close()
     
     return jsonify({
         "group_id": group_id,
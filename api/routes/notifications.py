@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 import json
 from api.database import get_db_connection, dict_cursor
+from api.pagination import PAGE_KEY, get_page_args, build_page
 
 # Create notifications blueprint
 notifications_bp = Blueprint('notifications', __name__)
@@ -11,7 +12,7 @@ def get_pending_notifications():
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=dict_cursor())
     
-    # Get all pending notifications with user details
+    # Get all pending notifications with user details; leased ones are already being sent
     cur.execute(
         """
         SELECT 
@@ -24,26 +25,67 @@ def get_pending_notifications():
         FROM notifications n
         JOIN users u ON n.user_id = u.id
         WHERE n.status = 'pending'
+          AND (n.lease_expires_at IS NULL OR n.lease_expires_at < CURRENT_TIMESTAMP)
         ORDER BY n.created_at DESC;
         """
     )
     
     notifications = cur.fetchall()
     
-    # Parse the extra_info JSON for each notification
-    for notification in notifications:
-        if notification['extra_info']:
-            try:
-                notification['extra_info'] = json.loads(notification['extra_info'])
-            except:
-                # If parsing fails, keep as string
-                pass
-    
     cur.close()
-    conn.close()
     
     return jsonify(notifications)
 
+# extra_info keys that can be used as query parameters on GET /notifications
+EXTRA_INFO_FILTERS = ('ticket_id', 'group', 'announcement_id', 'phone')
+
+@notifications_bp.route("/notifications", methods=["GET"])
+def list_notifications():
+    """List notifications newest first, filtered by user, status, type and extra_info fields"""
+    conditions = []
+    params = []
+    
+    for column in ('user_id', 'status', 'type'):
+        value = request.args.get(column)
+        if value:
+            conditions.append(f"n.{column} = %s")
+            params.append(value)
+    
+    # Containment keeps these on the GIN index over extra_info. Ids may have been
+    # stored as JSON strings or numbers, so numeric values match either.
+    for key in EXTRA_INFO_FILTERS:
+        value = request.args.get(key)
+        if not value:
+            continue
+        candidates = [json.dumps({key: value})]
+        if value.isdigit():
+            candidates.append(json.dumps({key: int(value)}))
+        conditions.append("(" + " OR ".join(["n.extra_info @> %s::jsonb"] * len(candidates)) + ")")
+        params.extend(candidates)
+    
+    limit, cursor = get_page_args()
+    if cursor is not None:
+        conditions.append("(n.created_at, n.id) < (%s, %s)")
+        params.extend(cursor)
+    params.append(limit + 1)
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    cur.execute(
+        f"""
+        SELECT n.*, n.created_at AS {PAGE_KEY}
+        FROM notifications n
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY n.created_at DESC, n.id DESC
+        LIMIT %s;
+        """,
+        params
+    )
+    rows = cur.fetchall()
+    cur.close()
+    
+    return jsonify(build_page(rows, limit))
+
 @notifications_bp.route("/notifications/<notification_id>/update-status", methods=["POST"])
 def update_status_notification(notification_id):
     """Mark a notification as read"""
@@ -69,7 +111,6 @@ def update_status_notification(notification_id):
     
     if not notification:
         cur.close()
-        conn.close()
         return jsonify({"error": "Notification not found or does not belong to this user"}), 404
     
     # Update the notification status
@@ -85,16 +126,121 @@ def update_status_notification(notification_id):
     
     updated_notification = cur.fetchone()
     
-    # Parse the extra_info JSON if it exists
-    if updated_notification['extra_info']:
+    conn.commit()
+    cur.close()
+    
+    return jsonify(updated_notification)
+
+DEFAULT_CLAIM_LIMIT = 50
+MAX_CLAIM_LIMIT = 500
+DEFAULT_LEASE_SECONDS = 60
+MAX_LEASE_SECONDS = 600
+
+# Outcomes a delivery worker can report; 'pending' releases the lease for a retry
+REPORT_STATUSES = ('delivered', 'failed', 'pending')
+
+@notifications_bp.route("/notifications/claim", methods=["POST"])
+def claim_notifications():
+    """Lease up to `limit` pending notifications to a delivery worker"""
+    data = request.get_json() or {}
+    worker_id = data.get('worker_id')
+    
+    if not worker_id:
+        return jsonify({"error": "worker_id is required"}), 400
+    
+    try:
+        limit = min(int(data.get('limit', DEFAULT_CLAIM_LIMIT)), MAX_CLAIM_LIMIT)
+        lease_seconds = min(int(data.get('lease_seconds', DEFAULT_LEASE_SECONDS)), MAX_LEASE_SECONDS)
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit and lease_seconds must be integers"}), 400
+    
+    if limit < 1 or lease_seconds < 1:
+        return jsonify({"error": "limit and lease_seconds must be positive"}), 400
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    
+    # SKIP LOCKED: concurrent claims take disjoint sets of rows instead of waiting on each other
+    cur.execute(
+        """
+        WITH claimable AS (
+            SELECT id
+            FROM notifications
+            WHERE status = 'pending'
+              AND (lease_expires_at IS NULL OR lease_expires_at < CURRENT_TIMESTAMP)
+            ORDER BY created_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE notifications n
+        SET lease_owner = %s,
+            lease_expires_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+            delivery_attempts = n.delivery_attempts + 1,
+            updated_at = CURRENT_TIMESTAMP
+        FROM claimable c, users u
+        WHERE n.id = c.id AND u.id = n.user_id
+        RETURNING n.*, u.user_name, u.email, u.phone, u.user_role;
+        """,
+        (limit, worker_id, lease_seconds)
+    )
+    
+    notifications = sorted(cur.fetchall(), key=lambda n: (n['created_at'], n['id']))
+    conn.commit()
+    cur.close()
+    
+    return jsonify({
+        "worker_id": worker_id,
+        "lease_seconds": lease_seconds,
+        "notifications": notifications
+    })
+
+@notifications_bp.route("/notifications/report", methods=["POST"])
+def report_notifications():
+    """Record delivery outcomes for many leased notifications in one request"""
+    data = request.get_json() or {}
+    worker_id = data.get('worker_id')
+    results = data.get('results')
+    
+    if not worker_id or not isinstance(results, list) or not results:
+        return jsonify({"error": "worker_id and a non-empty results list are required"}), 400
+    
+    ids, statuses, errors = [], [], []
+    for result in results:
         try:
-            updated_notification['extra_info'] = json.loads(updated_notification['extra_info'])
-        except:
-            # If parsing fails, keep as string
-            pass
+            notification_id = int(result['id'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Every result needs an integer id"}), 400
+        if result.get('status') not in REPORT_STATUSES:
+            return jsonify({"error": "status must be one of: " + ", ".join(REPORT_STATUSES)}), 400
+        ids.append(notification_id)
+        statuses.append(result['status'])
+        errors.append(result.get('error'))
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
     
+    # Only the current lease holder may report: a worker whose lease expired and
+    # was re-claimed by someone else gets those ids back as rejected
+    cur.execute(
+        """
+        UPDATE notifications n
+        SET status = r.status,
+            last_error = r.error,
+            lease_owner = NULL,
+            lease_expires_at = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        FROM unnest(%s::int[], %s::text[], %s::text[]) AS r(id, status, error)
+        WHERE n.id = r.id AND n.status = 'pending' AND n.lease_owner = %s
+        RETURNING n.id;
+        """,
+        (ids, statuses, errors, worker_id)
+    )
+    
+    updated = {row['id'] for row in cur.fetchall()}
     conn.commit()
     cur.close()
-    conn.close()
     
-    return jsonify(updated_notification)
+    return jsonify({
+        "updated": sorted(updated),
+        "rejected": [notification_id for notification_id in dict.fromkeys(ids) if notification_id not in updated]
+    })
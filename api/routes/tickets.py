@@ -1,7 +1,12 @@
 from flask import Blueprint, request, jsonify
 import logging
-from api.database import get_db_connection, dict_cursor
-from api.services.rabbitmq import rabbitmq
+from api.database import get_db_connection, dict_cursor, on_commit
+from api.pagination import PAGE_KEY, wants_pagination, get_page_args, build_page
+from api.streaming import get_stream_format, stream_query
+from api.services.outbox import enqueue_notification
+from api.services.notification_templates import render
+from api.services.ticket_search import TicketSearch, text_search_sql
+from api.services.response_cache import response_cache
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -9,6 +14,70 @@ logger = logging.getLogger(__name__)
 # Create blueprint
 tickets_bp = Blueprint('tickets', __name__)
 
+def run_ticket_search(search):
+    """Run a TicketSearch, one keyset page at a time.
+
+    Pass ``paginate=false`` to get the legacy response: every matching ticket as a plain list,
+    or ``stream=json|ndjson`` to stream every matching ticket from a server-side cursor.
+    """
+    limit, cursor = None, None
+    stream_format = get_stream_format()
+    if not stream_format and wants_pagination():
+        limit, cursor = get_page_args()
+    
+    query, params = search.to_sql(limit, cursor)
+    
+    if stream_format:
+        return stream_query(query, params, stream_format, transform=_drop_page_key)
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    cur.execute(query, params)
+    tickets = cur.fetchall()
+    cur.close()
+    
+    if limit is None:
+        return jsonify([_drop_page_key(ticket) for ticket in tickets])
+    return jsonify(build_page(tickets, limit))
+
+def _drop_page_key(ticket):
+    ticket.pop(PAGE_KEY, None)
+    return ticket
+
+@tickets_bp.route("/tickets/search", methods=["GET"])
+def search_tickets():
+    """Search tickets by any combination of status, assignee, creator, category, priority and dates.
+
+    Filters: status, assign_id (or assign_id=none / unassigned=true), user_id, category,
+    sub_category, priority (status, category and priority accept comma-separated lists),
+    created_from/created_to, updated_from/updated_to, closed_from/closed_to.
+    Sorting: sort=created_at|updated_at|closed_at, order=desc|asc.
+    """
+    return run_ticket_search(TicketSearch.from_args(request.args))
+
+@tickets_bp.route("/tickets/text_search", methods=["GET"])
+def text_search_tickets():
+    """Full-text search over ticket descriptions and comments, best matches first.
+
+    Query parameters: q (web-search syntax: words, "quoted phrases", -exclusions, OR),
+    optional status, plus the usual limit/cursor paging. Each result carries its rank
+    and highlighted snippets from the description and the best-matching comment.
+    """
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({"error": "Search text (q) is required"}), 400
+    
+    limit, cursor = get_page_args()
+    query, params = text_search_sql(text, status=request.args.get('status') or None, limit=limit, cursor=cursor)
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    cur.execute(query, params)
+    tickets = cur.fetchall()
+    cur.close()
+    
+    return jsonify(build_page(tickets, limit))
+
 @tickets_bp.route("/tickets", methods=["POST"])
 def create_ticket():
     logger.info("Creating ticket")
@@ -23,60 +92,27 @@ def create_ticket():
         (data['id'], data['category'], data.get('sub_category'), data['description'], data['user_id'], data.get('assign_id'), data.get('status', 'open'), data.get('priority', 'medium'))
     )
     ticket = cur.fetchone()
+    on_commit(response_cache.invalidate, f"ticket:{data['id']}")
     conn.commit()
     cur.close()
-    conn.close()
     return jsonify(ticket), 201
 
 @tickets_bp.route("/tickets", methods=["GET"])
 def get_tickets():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    cur.execute("""
-        SELECT t.*, u.user_name 
-        FROM tickets t
-        LEFT JOIN users u ON t.user_id = u.id;
-    """)
-    tickets = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(tickets)
+    return run_ticket_search(TicketSearch())
 
 @tickets_bp.route("/all_open_tickets", methods=["GET"])
 def get_all_open_tickets():
     """Get all open tickets in the system for superuser dashboard"""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    cur.execute("""
-        SELECT t.*, u.user_name 
-        FROM tickets t
-        LEFT JOIN users u ON t.user_id = u.id
-        WHERE t.status = 'open' 
-        ORDER BY t.created_at DESC;
-    """)
-    tickets = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(tickets)
+    return run_ticket_search(TicketSearch({'status': 'open'}))
 
 @tickets_bp.route("/all_closed_tickets", methods=["GET"])
 def get_all_closed_tickets():
     """Get all closed tickets in the system for superuser dashboard"""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    cur.execute("""
-        SELECT t.*, u.user_name 
-        FROM tickets t
-        LEFT JOIN users u ON t.user_id = u.id
-        WHERE t.status = 'closed' 
-        ORDER BY t.closed_at DESC;
-    """)
-    tickets = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(tickets)
+    return run_ticket_search(TicketSearch({'status': 'closed'}, sort='closed_at'))
 
 @tickets_bp.route("/tickets/<id>", methods=["GET"])
+@response_cache.cached(lambda body, id: [f"ticket:{id}"])
 def get_ticket(id):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=dict_cursor())
@@ -88,7 +124,6 @@ def get_ticket(id):
     """, (id,))
     ticket = cur.fetchone()
     cur.close()
-    conn.close()
     if ticket:
         return jsonify(ticket)
     return jsonify({"error": "Ticket not found"}), 404
@@ -106,9 +141,9 @@ def update_ticket(id):
         (data['category'], data.get('sub_category'), data['description'], data.get('assign_id'), data['status'], id)
     )
     ticket = cur.fetchone()
+    on_commit(response_cache.invalidate, f"ticket:{id}")
     conn.commit()
     cur.close()
-    conn.close()
     if ticket:
         return jsonify(ticket)
     return jsonify({"error": "Ticket not found"}), 404
@@ -126,9 +161,9 @@ def update_ticket_priority(id):
         (data['priority'], id)
     )
     ticket = cur.fetchone()
+    on_commit(response_cache.invalidate, f"ticket:{id}")
     conn.commit()
     cur.close()
-    conn.close()
     if ticket:
         return jsonify(ticket)
     return jsonify({"error": "Ticket not found"}), 404
@@ -139,42 +174,22 @@ def delete_ticket(id):
     cur = conn.cursor()
     cur.execute("DELETE FROM tickets WHERE id = %s RETURNING *;", (id,))
     ticket = cur.fetchone()
+    on_commit(response_cache.invalidate, f"ticket:{id}", f"ticket:{id}:comments")
     conn.commit()
     cur.close()
-    conn.close()
     if ticket:
         return jsonify({"message": "Ticket deleted successfully"})
     return jsonify({"error": "Ticket not found"}), 404
 
 @tickets_bp.route("/tickets_assign_open/<user_id>", methods=["GET"])
 def tickets_assign_open(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    cur.execute("""
-        SELECT t.*, u.user_name 
-        FROM tickets t
-        LEFT JOIN users u ON t.user_id = u.id
-        WHERE t.assign_id = %s AND t.status = 'open';
-    """, (user_id,))
-    tickets = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(tickets)
+    return run_ticket_search(TicketSearch({'assign_id': user_id, 'status': 'open'}))
 
 @tickets_bp.route("/tickets_assign_closed/<user_id>", methods=["GET"])
 def tickets_assign_closed(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    cur.execute("""
-        SELECT t.*, u.user_name 
-        FROM tickets t
-        LEFT JOIN users u ON t.user_id = u.id
-        WHERE t.assign_id = %s AND t.status = 'closed';
-    """, (user_id,))
-    tickets = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(tickets)
+    return run_ticket_search(TicketSearch({'assign_id': user_id, 'status': 'closed'}, sort='closed_at'))
+
+ASSIGNMENT_COMMENT = "Recibimos tu caso, y el mismo lo escalamos a Tier 1 para su debido análisis y solución.\nPronto se contactarán contigo para brindarte una solución."
 
 @tickets_bp.route("/assign_ticket/<id>", methods=["PUT"])
 def assign_ticket(id):
@@ -183,53 +198,46 @@ def assign_ticket(id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     try:
-        # Begin transaction
-        cur.execute("BEGIN;")
-        
-        # Get ticket data before update
-        cur.execute("SELECT * FROM tickets WHERE id = %s;", (id,))
-        original_ticket = cur.fetchone()
-        
-        if not original_ticket:
-            # Rollback if ticket not found
-            cur.execute("ROLLBACK;")
-            cur.close()
-            conn.close()
-            return jsonify({"error": "Ticket not found"}), 404
-        
-        # Update the ticket with the new assignment
+        # Assign, add the automatic comment and collect everything the
+        # notification needs in a single statement
         cur.execute(
             """
-            UPDATE tickets SET assign_id = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING *;
+            WITH updated AS (
+                UPDATE tickets SET assign_id = %(assign_id)s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %(id)s
+                RETURNING *
+            ),
+            new_comment AS (
+                INSERT INTO comments (ticket_id, user_id, content)
+                SELECT id, %(assign_id)s, %(comment)s FROM updated
+                RETURNING id
+            )
+            SELECT updated.*,
+                   agent.user_name AS agent_name,
+                   new_comment.id AS comment_id,
+                   creator.phone AS creator_phone,
+                   creator.user_name AS creator_name
+            FROM updated
+            CROSS JOIN new_comment
+            LEFT JOIN users agent ON agent.id = %(assign_id)s
+            LEFT JOIN users creator ON creator.id = updated.user_id;
             """,
-            (data['assign_id'], id)
+            {"id": id, "assign_id": data['assign_id'], "comment": ASSIGNMENT_COMMENT}
         )
         ticket = cur.fetchone()
         
-        # Get agent name
-        cur.execute("SELECT user_name FROM users WHERE id = %s;", (data['assign_id'],))
-        agent = cur.fetchone()
-        agent_name = agent['user_name'] if agent else "Support Agent"
-        
-        # Add automatic comment when ticket is assigned
-        automatic_comment = "Recibimos tu caso, y el mismo lo escalamos a Tier 1 para su debido análisis y solución.\nPronto se contactarán contigo para brindarte una solución."
-        
-        cur.execute(
-            """
-            INSERT INTO comments (ticket_id, user_id, content)
-            VALUES (%s, %s, %s)
-            RETURNING *;
-            """,
-            (id, data['assign_id'], automatic_comment)
-        )
-        comment = cur.fetchone()
+        if not ticket:
+            conn.rollback()
+            return jsonify({"error": "Ticket not found"}), 404
         
-        # Get user details for notification
-        cur.execute("SELECT id, phone, user_name FROM users WHERE id = %s;", (ticket['user_id'],))
-        user = cur.fetchone()
+        agent_name = ticket.pop('agent_name') or "Support Agent"
+        comment_id = ticket.pop('comment_id')
+        creator_phone = ticket.pop('creator_phone')
+        creator_name = ticket.pop('creator_name')
         
         # Create notification for the ticket creator
-        notification_message = f"Tu ticket #{id} ha sido asignado a {agent_name}\n {automatic_comment}"
+        template_params = {"ticket_id": id, "agent_name": agent_name, "comment": ASSIGNMENT_COMMENT}
+        notification_message = render('ticket_assigned', template_params)
         
         # Create extra_info for RabbitMQ
         extra_info = {
@@ -238,40 +246,40 @@ def assign_ticket(id):
             "sub_category": ticket['sub_category'],
             "assigned_to": agent_name,
             "assigned_to_id": data['assign_id'],
-            "comment_id": comment['id'],
-            "comment_content": automatic_comment[:100] + ("..." if len(automatic_comment) > 100 else ""),
-            "phone": user['phone'],
-            "user_name": user['user_name']
+            "comment_id": comment_id,
+            "comment_content": ASSIGNMENT_COMMENT[:100] + ("..." if len(ASSIGNMENT_COMMENT) > 100 else ""),
+            "phone": creator_phone,
+            "user_name": creator_name
         }
         
-        # Send notification via RabbitMQ
-        notification_success = rabbitmq.publish_notification(
+        # Queue the notification in the outbox as part of the same transaction
+        enqueue_notification(
+            cur,
             user_id=ticket['user_id'],
             message=notification_message,
             notification_type='assignment',
-            extra_info=extra_info
+            extra_info=extra_info,
+            template='ticket_assigned',
+            params=template_params
         )
         
-        # Add notification status to the response
-        if notification_success:
-            ticket['notification_status'] = 'queued'
-        else:
-            ticket['notification_status'] = 'failed'
+        # The assignment also added a comment
+        on_commit(response_cache.invalidate, f"ticket:{id}", f"ticket:{id}:comments")
+        conn.commit()
         
-        # Commit transaction if everything was successful
-        cur.execute("COMMIT;")
+        # Add notification status to the response
+        ticket['notification_status'] = 'queued'
         
         return jsonify(ticket)
         
     except Exception as e:
         # Rollback in case of any error
-        cur.execute("ROLLBACK;")
+        conn.rollback()
         logger.error(f"Error assigning ticket: {str(e)}", exc_info=True)
         return jsonify({"error": f"Failed to assign ticket: {str(e)}"}), 500
         
     finally:
         cur.close()
-        conn.close()
 
 @tickets_bp.route("/close_ticket/<id>", methods=["PUT"])
 def close_ticket(id):
@@ -279,37 +287,37 @@ def close_ticket(id):
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     try:
-        # Begin transaction
-        cur.execute("BEGIN;")
-        
-        # Update ticket status to closed
+        # Close the ticket and fetch the creator's contact details in one statement
         cur.execute(
             """
-            UPDATE tickets 
-            SET status = 'closed', closed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP 
-            WHERE id = %s 
-            RETURNING *;
+            WITH updated AS (
+                UPDATE tickets 
+                SET status = 'closed', closed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP 
+                WHERE id = %s 
+                RETURNING *
+            )
+            SELECT updated.*, creator.phone AS creator_phone, creator.user_name AS creator_name
+            FROM updated
+            LEFT JOIN users creator ON creator.id = updated.user_id;
             """,
             (id,)
         )
         ticket = cur.fetchone()
         
         if not ticket:
-            cur.execute("ROLLBACK;")
-            cur.close()
-            conn.close()
+            conn.rollback()
             return jsonify({"error": "Ticket not found"}), 404
         
-        # Get the ticket creator's details
-        cur.execute("SELECT id, phone, user_name FROM users WHERE id = %s;", (ticket['user_id'],))
-        user = cur.fetchone()
+        creator_phone = ticket.pop('creator_phone')
+        creator_name = ticket.pop('creator_name')
         
         # Get the category and subcategory for the notification message
         category = ticket['category']
         sub_category = ticket['sub_category'] if ticket['sub_category'] else ""
         
         # Create the notification message
-        notification_message = f"Ticket #{id} ({category}/{sub_category}) se cerro."
+        template_params = {"ticket_id": id, "category": category, "sub_category": sub_category}
+        notification_message = render('ticket_closed', template_params)
         
         # Create extra_info for RabbitMQ
         extra_info = {
@@ -318,78 +326,45 @@ def close_ticket(id):
             "sub_category": sub_category,
             "last_comment": None,
             "comment_author": None,
-            "phone": user['phone'],
-            "user_name": user['user_name']
+            "phone": creator_phone,
+            "user_name": creator_name
         }
         
-        # Send notification via RabbitMQ
-        notification_success = rabbitmq.publish_notification(
+        # Queue the notification in the outbox as part of the same transaction
+        enqueue_notification(
+            cur,
             user_id=ticket['user_id'],
             message=notification_message,
             notification_type='ticket',
-            extra_info=extra_info
+            extra_info=extra_info,
+            template='ticket_closed',
+            params=template_params
         )
         
-        # Add notification status to the response
-        if notification_success:
-            ticket['notification_status'] = 'queued'
-        else:
-            ticket['notification_status'] = 'failed'
+        on_commit(response_cache.invalidate, f"ticket:{id}")
+        conn.commit()
         
-        cur.execute("COMMIT;")
+        # Add notification status to the response
+        ticket['notification_status'] = 'queued'
         
         return jsonify(ticket)
         
     except Exception as e:
-        cur.execute("ROLLBACK;")
+        conn.rollback()
         logger.error(f"Error closing ticket: {str(e)}", exc_info=True)
         return jsonify({"error": f"Failed to close ticket: {str(e)}"}), 500
         
     finally:
         cur.close()
-        conn.close()
 
 @tickets_bp.route("/tickets_user_open/<user_id>", methods=["GET"])
 def tickets_user_open(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    cur.execute("""
-        SELECT t.*, u.user_name 
-        FROM tickets t
-        LEFT JOIN users u ON t.user_id = u.id
-        WHERE t.user_id = %s AND t.status = 'open';
-    """, (user_id,))
-    tickets = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(tickets)
+    return run_ticket_search(TicketSearch({'user_id': user_id, 'status': 'open'}))
 
 @tickets_bp.route("/tickets_user_closed/<user_id>", methods=["GET"])
 def tickets_user_closed(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    cur.execute("""
-        SELECT t.*, u.user_name 
-        FROM tickets t
-        LEFT JOIN users u ON t.user_id = u.id
-        WHERE t.user_id = %s AND t.status = 'closed';
-    """, (user_id,))
-    tickets = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(tickets)
+    return run_ticket_search(TicketSearch({'user_id': user_id, 'status': 'closed'}, sort='closed_at'))
 
 @tickets_bp.route("/tickets_not_assigned_open", methods=["GET"])
 def tickets_not_assign_open():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=dict_cursor())
-    cur.execute("""
-        SELECT t.*, u.user_name 
-        FROM tickets t
-        LEFT JOIN users u ON t.user_id = u.id
-        WHERE t.assign_id IS NULL AND t.status = 'open';
-    """)
-    tickets = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(tickets)
+    return run_ticket_search(TicketSearch({'status': 'open'}, unassigned=True))
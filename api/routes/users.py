@@ -1,5 +1,11 @@
+import logging
 from flask import Blueprint, request, jsonify
-from api.database import get_db_connection, dict_cursor
+from api.database import get_db_connection, dict_cursor, on_commit
+from api.services.user_import import import_users, import_format, InvalidImportRequest
+from api.services.authorization import authorization
+from api.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
 
 # Create blueprint
 users_bp = Blueprint('users', __name__)
@@ -17,12 +23,77 @@ def create_user():
         (data['email'], data['password'], data.get('user_name'), data['user_role'])
     )
     user = cur.fetchone()
+    on_commit(response_cache.invalidate, "admin_users")
     conn.commit()
     cur.close()
-    conn.close()
     return jsonify(user), 201
 
+@users_bp.route("/users/bulk", methods=["POST"])
+def bulk_create_users():
+    """Create users from a streamed CSV or NDJSON upload, optionally enrolling them in a group.
+    
+    Query parameters: requester_id (required), format (csv|ndjson, defaults from
+    the Content-Type), on_conflict (skip|update, admins only for update) and group_id.
+    """
+    requester_id = request.args.get('requester_id')
+    group_id = request.args.get('group_id')
+    on_conflict = request.args.get('on_conflict', 'skip')
+    
+    if not requester_id:
+        return jsonify({"error": "Requester ID is required"}), 400
+    
+    # Validate the request before touching the body, which is only read once
+    fmt = import_format(request.args.get('format'), request.content_type)
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    
+    requester = authorization.user(cur, requester_id)
+    
+    if not requester:
+        cur.close()
+        return jsonify({"error": "Requester not found"}), 404
+    
+    if not authorization.is_staff(requester):
+        cur.close()
+        return jsonify({"error": "Only teachers and admins can import users"}), 403
+    
+    # Teachers may only provision students, and can't overwrite existing accounts
+    allowed_roles = None if requester['user_role'] == 'admin' else ('user',)
+    if on_conflict == 'update' and allowed_roles is not None:
+        cur.close()
+        return jsonify({"error": "Only admins can update existing users"}), 403
+    
+    if group_id is not None:
+        group = authorization.group(cur, group_id)
+        
+        if not group:
+            cur.close()
+            return jsonify({"error": "Group not found"}), 404
+        
+        if not authorization.can_manage_group(requester, group):
+            cur.close()
+            return jsonify({"error": "Only the teacher who created the group or an admin can add members"}), 403
+        group_id = group['id']
+    
+    try:
+        report = import_users(cur, request.stream, fmt, on_conflict, group_id, allowed_roles)
+        conn.commit()
+    except InvalidImportRequest:
+        conn.rollback()
+        cur.close()
+        raise
+    except Exception as e:
+        conn.rollback()
+        cur.close()
+        logger.error(f"Error importing users: {str(e)}", exc_info=True)
+        return jsonify({"error": "An error occurred while importing users"}), 500
+    
+    cur.close()
+    return jsonify(report), 200
+
 @users_bp.route("/admin_users", methods=["GET"])
+@response_cache.cached(lambda body: ["admin_users"])
 def get_admin_users():
     """Get all admin users for the superuser dashboard assignment dropdown"""
     conn = get_db_connection()
@@ -37,7 +108,6 @@ def get_admin_users():
     )
     admin_users = cur.fetchall()
     cur.close()
-    conn.close()
     return jsonify(admin_users)
 
 @users_bp.route("/auth", methods=["POST"])
@@ -51,47 +121,39 @@ def authenticate_user():
     )
     user = cur.fetchone()
     cur.close()
-    conn.close()
     
     if user:
         return jsonify({"message": "Authentication successful", "user": user})
     return jsonify({"error": "Invalid credentials"}), 401
 
 @users_bp.route("/users/<user_id>/groups", methods=["GET"])
+@response_cache.cached(lambda body, user_id: [f"user:{user_id}:groups"] + [f"group:{group['id']}:announcements" for group in body])
 def get_user_groups(user_id):
     """Get all groups that a user belongs to"""
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=dict_cursor())
     
     # Check if the user exists
-    cur.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-    user = cur.fetchone()
+    user = authorization.user(cur, user_id)
     
     if not user:
         cur.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
-    # Get all groups that the user belongs to
+    # Get all groups that the user belongs to, with the maintained unread counters
     cur.execute(
         """
-        SELECT g.*, 
-               (SELECT COUNT(*) FROM announcements a 
-                WHERE a.group_id = g.id 
-                AND NOT EXISTS (
-                    SELECT 1 FROM announcement_reads ar 
-                    WHERE ar.announcement_id = a.id AND ar.user_id = %s
-                )) as unread_count
+        SELECT g.*, COALESCE(c.unread_count, 0) as unread_count
         FROM groups g
         JOIN user_groups ug ON g.id = ug.group_id
+        LEFT JOIN group_unread_counts c ON c.user_id = ug.user_id AND c.group_id = ug.group_id
         WHERE ug.user_id = %s
         ORDER BY g.name;
         """,
-        (user_id, user_id)
+        (user['id'],)
     )
     
     groups = cur.fetchall()
     cur.close()
-    conn.close()
     
     return jsonify(groups)
@@ -0,0 +1,155 @@
+"""Cached facts for permission checks: user roles, group ownership and membership.
+
+Route handlers used to run SELECT * FROM users / groups / user_groups on every
+request just to compare user_role and teacher_id. Those facts change rarely,
+so they are kept in per-process TTL/LRU caches. Writes to users, groups and
+user_groups invalidate the affected entries once their transaction commits
+(register the invalidate_* calls with on_commit()); the TTL bounds how long
+another API process can act on a stale fact.
+
+Only facts that exist are cached for users and groups, so a row created a
+moment ago is never reported missing. Membership is cached both ways and must
+be invalidated when members are added.
+"""
+import os
+import logging
+from prometheus_client import Counter
+from api.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = Counter(
+    'authz_cache_requests_total',
+    'Authorization fact lookups, by fact and whether the cache answered',
+    ['fact', 'result']
+)
+
+ADMIN_ROLE = 'admin'
+TEACHER_ROLE = 'teacher'
+
+
+def _id(value):
+    """Normalize an id from a URL or JSON body; None if it can't be an id."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Authorization:
+    def __init__(self, maxsize=None, ttl=None):
+        maxsize = maxsize or int(os.getenv("AUTHZ_CACHE_SIZE", "10000"))
+        ttl = ttl if ttl is not None else float(os.getenv("AUTHZ_CACHE_TTL", "30"))
+        self.users = TTLCache(maxsize, ttl)
+        self.groups = TTLCache(maxsize, ttl)
+        self.memberships = TTLCache(maxsize, ttl)
+
+    def user(self, cur, user_id):
+        """Return {id, user_name, user_role} for a user, or None if there is no such user."""
+        key = _id(user_id)
+        if key is None:
+            return None
+
+        user = self.users.get(key)
+        CACHE_REQUESTS.labels(fact='user', result='hit' if user is not None else 'miss').inc()
+        if user is None:
+            cur.execute("SELECT id, user_name, user_role FROM users WHERE id = %s;", (key,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            user = {'id': row['id'], 'user_name': row['user_name'], 'user_role': row['user_role']}
+            self.users.set(key, user)
+        return dict(user)
+
+    def group(self, cur, group_id):
+        """Return {id, name, teacher_id} for a group, or None if there is no such group."""
+        key = _id(group_id)
+        if key is None:
+            return None
+
+        group = self.groups.get(key)
+        CACHE_REQUESTS.labels(fact='group', result='hit' if group is not None else 'miss').inc()
+        if group is None:
+            cur.execute("SELECT id, name, teacher_id FROM groups WHERE id = %s;", (key,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            group = {'id': row['id'], 'name': row['name'], 'teacher_id': row['teacher_id']}
+            self.groups.set(key, group)
+        return dict(group)
+
+    def is_member(self, cur, user_id, group_id):
+        """Whether the user is in the group's user_groups."""
+        key = (_id(group_id), _id(user_id))
+        if None in key:
+            return False
+
+        is_member = self.memberships.get(key)
+        CACHE_REQUESTS.labels(fact='membership', result='hit' if is_member is not None else 'miss').inc()
+        if is_member is None:
+            cur.execute(
+                "SELECT 1 FROM user_groups WHERE group_id = %s AND user_id = %s;",
+                key
+            )
+            is_member = cur.fetchone() is not None
+            self.memberships.set(key, is_member)
+        return is_member
+
+    @staticmethod
+    def is_staff(user):
+        return user is not None and user['user_role'] in (ADMIN_ROLE, TEACHER_ROLE)
+
+    @staticmethod
+    def owns(user, teacher_id):
+        """Admins, or the teacher whose id is ``teacher_id`` (a group's or an announcement's)."""
+        if user is None:
+            return False
+        return user['user_role'] == ADMIN_ROLE or (user['user_role'] == TEACHER_ROLE and user['id'] == _id(teacher_id))
+
+    def can_manage_group(self, user, group):
+        """The teacher who owns the group, or an admin."""
+        return self.owns(user, group['teacher_id'])
+
+    def can_view_group(self, cur, user, group):
+        """Group members, the group's teacher and admins."""
+        return self.can_manage_group(user, group) or self.is_member(cur, user['id'], group['id'])
+
+    def can_read_group(self, cur, user, group):
+        """Group members, admins and whoever is the group's teacher_id, whatever their role.
+
+        Unlike owns(), the teacher_id match doesn't require the teacher role
+        (e.g. a group's teacher who has since become a regular user).
+        """
+        if user is None or group is None:
+            return False
+        return (user['user_role'] == ADMIN_ROLE or user['id'] == _id(group['teacher_id'])
+                or self.is_member(cur, user['id'], group['id']))
+
+    def invalidate_user(self, user_id):
+        self.users.pop(_id(user_id))
+
+    def invalidate_users(self, user_ids):
+        for user_id in user_ids:
+            self.users.pop(_id(user_id))
+
+    def invalidate_group(self, group_id):
+        self.groups.pop(_id(group_id))
+        self.invalidate_membership(group_id)
+
+    def invalidate_membership(self, group_id, user_ids=None):
+        """Forget membership in a group, for ``user_ids`` or for everyone."""
+        group_key = _id(group_id)
+        if user_ids is None:
+            self.memberships.discard_where(lambda key, value: key[0] == group_key)
+        else:
+            for user_id in user_ids:
+                self.memberships.pop((group_key, _id(user_id)))
+
+    def clear(self):
+        self.users.clear()
+        self.groups.clear()
+        self.memberships.clear()
+
+
+# Shared by every request in the process
+authorization = Authorization()
@@ -0,0 +1,23 @@
+"""Notification message templates.
+
+With NOTIFICATION_TEMPLATES enabled, messages carry a template id and its
+parameters instead of the rendered text, and consumers render them. The same
+templates are mirrored in wa-bot/utils/templates.js.
+"""
+import os
+
+TEMPLATES = {
+    'ticket_assigned': "Tu ticket #{ticket_id} ha sido asignado a {agent_name}\n {comment}",
+    'ticket_closed': "Ticket #{ticket_id} ({category}/{sub_category}) se cerro.",
+    'comment_added': "Nuevo comentario en tu ticket #{ticket_id}: {author_name} \n{content}",
+    'announcement_created': "Nuevo anuncio en {group_name}:\n\n{title}\n {excerpt}..."
+}
+
+
+def templates_enabled():
+    return os.environ.get('NOTIFICATION_TEMPLATES', 'false').lower() in ('true', '1', 'yes')
+
+
+def render(template_id, params):
+    """Render a template with its parameters."""
+    return TEMPLATES[template_id].format(**params)
@@ -0,0 +1,93 @@
+"""Transactional outbox for RabbitMQ notifications.
+
+Handlers write notifications with the same cursor (and so the same
+transaction) as the change that triggers them. Nothing is sent to the broker
+on the request path; api.workers.outbox_relay publishes committed rows.
+While the broker is down, undelivered notifications wait here, so the
+backlog is exported as notification_outbox_depth.
+"""
+import json
+import uuid
+import logging
+from datetime import datetime
+from prometheus_client import Gauge
+from api.database import pooled_connection
+from api.services.rabbitmq import (
+    build_notification, routing_key_for, NOTIFICATIONS_EXCHANGE, ANNOUNCEMENT_CREATED_ROUTING_KEY
+)
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_DEPTH = Gauge('notification_outbox_depth', 'Notifications in notification_outbox waiting to be published')
+
+
+def outbox_depth():
+    """Count the outbox backlog, or NaN if the database can't be reached."""
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT count(*) FROM notification_outbox;")
+                return cur.fetchone()[0]
+            finally:
+                cur.close()
+    except Exception as e:
+        logger.warning(f"Could not measure the outbox backlog: {str(e)}")
+        return float('nan')
+
+
+# Measured on every scrape of the API's /metrics; the relay workers aren't scraped
+OUTBOX_DEPTH.set_function(outbox_depth)
+
+
+def enqueue_notification(cur, user_id, message, notification_type, extra_info, template=None, params=None):
+    """Write one notification to the outbox and return its message id."""
+    payload = build_notification(user_id, message, notification_type, extra_info, template, params)
+    cur.execute(
+        """
+        INSERT INTO notification_outbox (message_id, exchange, routing_key, payload)
+        VALUES (%s, %s, %s, %s);
+        """,
+        (payload['id'], NOTIFICATIONS_EXCHANGE, routing_key_for(notification_type), json.dumps(payload))
+    )
+    return payload['id']
+
+
+def enqueue_announcement_fanout(cur, announcement_id, group_id, message, extra_info, template_params=None):
+    """Record a pending fan-out for an announcement and queue its 'announcement created' event.
+
+    The per-member notifications are produced later by api.workers.announcement_fanout.
+    Returns the event's message id.
+    """
+    cur.execute(
+        """
+        INSERT INTO announcement_fanouts (announcement_id, group_id, message, extra_info, template_params)
+        VALUES (%s, %s, %s, %s, %s);
+        """,
+        (announcement_id, group_id, message, json.dumps(extra_info),
+         json.dumps(template_params) if template_params is not None else None)
+    )
+
+    return enqueue_announcement_event(cur, announcement_id, group_id)
+
+
+def enqueue_announcement_event(cur, announcement_id, group_id):
+    """Queue an 'announcement created' event for a fan-out already recorded in announcement_fanouts.
+
+    Returns the event's message id.
+    """
+    message_id = str(uuid.uuid4())
+    payload = {
+        'id': message_id,
+        'announcement_id': announcement_id,
+        'group_id': group_id,
+        'created_at': datetime.now().isoformat()
+    }
+    cur.execute(
+        """
+        INSERT INTO notification_outbox (message_id, exchange, routing_key, payload)
+        VALUES (%s, %s, %s, %s);
+        """,
+        (message_id, NOTIFICATIONS_EXCHANGE, ANNOUNCEMENT_CREATED_ROUTING_KEY, json.dumps(payload))
+    )
+    return message_id
@@ -1,135 +1,401 @@
 import pika
-import json
+import time
 import logging
+import threading
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
 import os
+from prometheus_client import Counter, Gauge, Histogram
+from api.services.circuit_breaker import CircuitBreaker, STATE_VALUES
+from api.services.serialization import serialize
+from api.services.notification_templates import render, templates_enabled
 
 logger = logging.getLogger(__name__)
 
+NOTIFICATIONS_EXCHANGE = 'notifications'
+# Legacy routing key for every notification type; still bound to the interactive lane
+NOTIFICATION_ROUTING_KEY = 'user.notification'
+
+# Priority lanes: interactive notifications get their own queue so bulk
+# fan-out never delays them. Queues and bindings are declared by
+# rabbitmq/generate-config.py, which must list the same lanes.
+INTERACTIVE_LANE = 'interactive'
+BULK_LANE = 'bulk'
+NOTIFICATION_LANES = {
+    'assignment': INTERACTIVE_LANE,
+    'ticket': INTERACTIVE_LANE,
+    'comment': INTERACTIVE_LANE,
+    'group': BULK_LANE
+}
+
+
+def lane_for(notification_type):
+    """Lane a notification type is delivered on; unknown types are treated as interactive."""
+    return NOTIFICATION_LANES.get(notification_type, INTERACTIVE_LANE)
+
+
+def routing_key_for(notification_type):
+    """Per-type routing key, e.g. 'notification.assignment'.
+
+    Types without a binding of their own use the legacy key, so they stay routable.
+    """
+    if notification_type not in NOTIFICATION_LANES:
+        return NOTIFICATION_ROUTING_KEY
+    return f"notification.{notification_type}"
+
+
+def lane_for_routing_key(routing_key):
+    if routing_key.startswith('notification.'):
+        return lane_for(routing_key[len('notification.'):])
+    return INTERACTIVE_LANE
+
+# One event per announcement, expanded into per-member notifications by api.workers.announcement_fanout
+ANNOUNCEMENT_CREATED_ROUTING_KEY = 'announcement.created'
+ANNOUNCEMENT_FANOUT_QUEUE = 'announcement_fanout_queue'
+# Receives a copy of every notification, both lanes, for api.workers.notification_persister
+NOTIFICATION_PERSISTENCE_QUEUE = 'notification_persistence_queue'
+
+PUBLISH_SECONDS = Histogram(
+    'rabbitmq_publish_seconds',
+    'Time to publish and get the broker acknowledgement',
+    ['mode']
+)
+RECONNECTS = Counter('rabbitmq_reconnects_total', 'Connections opened to RabbitMQ after a failure or drop')
+POOL_SIZE = Gauge('rabbitmq_channel_pool_size', 'Open publisher connections held by the pool')
+POOL_IN_USE = Gauge('rabbitmq_channel_pool_in_use', 'Publisher connections currently checked out')
+CIRCUIT_STATE = Gauge('rabbitmq_circuit_state', 'Publisher circuit breaker state (0 closed, 1 half-open, 2 open)')
+
+# How long publish_batch waits for the broker to confirm a batch
+CONFIRM_TIMEOUT = 30.0
+
+
+def build_notification(user_id, message, notification_type, extra_info, template=None, params=None,
+                       created_at=None):
+    """Return the notification payload consumers expect, with a fresh message id.
+
+    With a ``template`` id and NOTIFICATION_TEMPLATES enabled the payload carries
+    the template and its ``params`` instead of the rendered ``message``.
+    Producers that may build the same notification again (and reuse its id)
+    must pass the original ``created_at``: stored notifications are unique on
+    (message_id, created_at).
+    """
+    payload = {
+        # Unique message ID for idempotency
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'type': notification_type,
+        'extra_info': extra_info,
+        'created_at': (created_at or datetime.now()).isoformat()
+    }
+    if template is not None and templates_enabled():
+        payload['template'] = template
+        payload['params'] = params
+    else:
+        payload['message'] = message if message is not None else render(template, params)
+    return payload
+
+
+def outgoing_message(payload, routing_key, exchange=NOTIFICATIONS_EXCHANGE):
+    """Serialize a payload into the message dict publish_batch works with."""
+    body, content_type = serialize(payload)
+    return {
+        "exchange": exchange,
+        "routing_key": routing_key,
+        "body": body,
+        "content_type": content_type,
+        "message_id": payload['id']
+    }
+
+
+class PublisherChannel:
+    """One BlockingConnection with its publishing channels.
+
+    pika connections are not thread-safe, so a PublisherChannel is only ever
+    used by the thread that checked it out of the pool.
+    """
+
+    def __init__(self, parameters):
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+
+        # Enable publisher confirms
+        self.channel.confirm_delivery()
+
+        # Declare the exchange (even though defined in rabbit-definitions.json, it's good practice)
+        self.channel.exchange_declare(
+            exchange=NOTIFICATIONS_EXCHANGE,
+            exchange_type='direct',
+            durable=True
+        )
+        self.batch_channel = None
+        # Delivery tag -> message id of batch messages the broker hasn't confirmed yet
+        self._unconfirmed = {}
+        self._next_tag = 1
+        self._nacked = []
+
+    @property
+    def is_open(self):
+        return self.connection.is_open and self.channel.is_open
+
+    def service(self):
+        """Answer heartbeats accumulated while the connection sat idle in the pool."""
+        self.connection.process_data_events(time_limit=0)
+
+    def publish(self, exchange, routing_key, body, properties, mandatory=True):
+        self.channel.basic_publish(
+            exchange=exchange,
+            routing_key=routing_key,
+            body=body,
+            properties=properties,
+            mandatory=mandatory
+        )
+
+    def _open_batch_channel(self):
+        """Open the confirm-mode channel batches are published on.
+
+        BlockingChannel waits for each message's confirm inside basic_publish, so
+        batches are published on its underlying asynchronous channel instead and
+        the confirms are collected by _on_confirm.
+        """
+        channel = self.connection.channel()
+        self._unconfirmed = {}
+        # Delivery tags restart at 1 on every channel put into confirm mode
+        self._next_tag = 1
+        selected = []
+
+        def on_select_ok(frame):
+            selected.append(frame)
+            self._wake()
+
+        channel._impl.confirm_delivery(ack_nack_callback=self._on_confirm, callback=on_select_ok)
+        self._wait(channel, lambda: selected, "publisher confirms to be enabled")
+        self.batch_channel = channel
+
+    def _on_confirm(self, frame):
+        """Ack/nack callback for the batch channel; ``multiple`` covers every tag up to this one."""
+        method = frame.method
+        if method.multiple:
+            tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self._unconfirmed else []
+        for tag in tags:
+            message_id = self._unconfirmed.pop(tag)
+            if isinstance(method, pika.spec.Basic.Nack):
+                self._nacked.append(message_id)
+        if not self._unconfirmed:
+            self._wake()
+
+    def _wake(self):
+        """Make the current process_data_events call return instead of running out its time limit.
+
+        Callbacks on the underlying channel don't end the wait by themselves.
+        """
+        self.connection.add_callback_threadsafe(lambda: None)
+
+    def _wait(self, channel, done, what):
+        """Process I/O until ``done()`` is true, for at most CONFIRM_TIMEOUT seconds."""
+        deadline = time.monotonic() + CONFIRM_TIMEOUT
+        while not done():
+            if channel.is_closed:
+                raise pika.exceptions.ChannelWrongStateError(f"Channel closed while waiting for {what}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ConnectionError(f"Timed out waiting for {what}")
+            self.connection.process_data_events(time_limit=remaining)
+
+    def publish_batch(self, messages):
+        if self.batch_channel is None or self.batch_channel.is_closed:
+            self._open_batch_channel()
+
+        self._nacked = []
+        for message in messages:
+            routing_key = message.get('routing_key', NOTIFICATION_ROUTING_KEY)
+            self.batch_channel._impl.basic_publish(
+                exchange=message.get('exchange', NOTIFICATIONS_EXCHANGE),
+                routing_key=routing_key,
+                body=message['body'],
+                properties=pika.BasicProperties(
+                    delivery_mode=2,  # make message persistent
+                    content_type=message.get('content_type', 'application/json'),
+                    message_id=message['message_id'],
+                    headers={'lane': lane_for_routing_key(routing_key)}
+                )
+            )
+            self._unconfirmed[self._next_tag] = message['message_id']
+            self._next_tag += 1
+
+        # One wait for the whole batch; the broker usually confirms it with a few multiple=True acks
+        self._wait(self.batch_channel, lambda: not self._unconfirmed,
+                   f"the broker to confirm a batch of {len(messages)} messages")
+        if self._nacked:
+            raise pika.exceptions.NackError(self._nacked)
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+
+
 class RabbitMQ:
-    def __init__(self, app=None):
-        self.connection = None
-        self.channel = None
-        self.connected = False
-        
-        if app is not None:
-            self.init_app(app)
-            
-    def init_app(self, app):
-        """Initialize the extension with the Flask app"""
-        # Get connection parameters from app config
-        app.config.setdefault('RABBITMQ_HOST', os.environ.get('RABBITMQ_HOST'))
-        app.config.setdefault('RABBITMQ_USER', os.environ.get('RABBITMQ_USER'))
-        app.config.setdefault('RABBITMQ_PASSWORD', os.environ.get('RABBITMQ_PASSWORD'))
-        
-        # Connect to RabbitMQ when the app starts
-        with app.app_context():
-            self.connect(app)
-        
-        # Register teardown function to close connection when app context ends
-        app.teardown_appcontext(self.teardown)
-        
-    def connect(self, app):
-        """Connect to RabbitMQ server"""
-        if self.connected:
-            return
-            
+    """Long-lived, thread-safe notification publisher used by the workers.
+
+    Keeps a pool of up to ``pool_size`` connections that survive across
+    batches; each publishing thread checks one out exclusively. Broken
+    connections are replaced, and reconnect attempts back off exponentially
+    while the broker is unreachable so callers fail fast instead of each
+    paying a connection timeout.
+    """
+
+    def __init__(self, pool_size=None, checkout_timeout=10.0):
+        self.host = None
+        self.user = None
+        self.password = None
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._open_count = 0
+        self._in_use = 0
+
+        self._failures = 0
+        self._retry_at = 0.0
+        self.max_backoff = 30.0
+
+        self.breaker = CircuitBreaker(
+            'rabbitmq',
+            failure_threshold=int(os.environ.get('RABBITMQ_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.environ.get('RABBITMQ_BREAKER_RESET_SECONDS', '30')),
+            on_state_change=lambda state: CIRCUIT_STATE.set(STATE_VALUES[state])
+        )
+
+    def configure(self, host=None, user=None, password=None):
+        """Set connection parameters, defaulting to the RABBITMQ_* environment variables"""
+        self.host = host or os.environ.get('RABBITMQ_HOST')
+        self.user = user or os.environ.get('RABBITMQ_USER')
+        self.password = password or os.environ.get('RABBITMQ_PASSWORD')
+        if self.pool_size is None:
+            self.pool_size = int(os.environ.get('RABBITMQ_POOL_SIZE', '4'))
+
+    @property
+    def connected(self):
+        return self._failures == 0
+
+    def _parameters(self):
+        if self.host is None:
+            self.configure()
+        return pika.ConnectionParameters(
+            host=self.host,
+            credentials=pika.PlainCredentials(self.user, self.password),
+            heartbeat=600,
+            blocked_connection_timeout=300
+        )
+
+    def _open(self):
+        """Open a new connection, honouring the reconnect backoff."""
+        with self._cond:
+            wait = self._retry_at - time.monotonic()
+        if wait > 0:
+            raise ConnectionError(f"RabbitMQ unavailable, next reconnect attempt in {wait:.1f}s")
         try:
-            # Get connection parameters from app config
-            rabbitmq_host = app.config['RABBITMQ_HOST']
-            rabbitmq_user = app.config['RABBITMQ_USER']
-            rabbitmq_password = app.config['RABBITMQ_PASSWORD']
-            
-            # Create connection parameters
-            credentials = pika.PlainCredentials(rabbitmq_user, rabbitmq_password)
-            parameters = pika.ConnectionParameters(
-                host=rabbitmq_host,
-                credentials=credentials,
-                heartbeat=600,
-                blocked_connection_timeout=300
-            )
-            
-            # Connect to RabbitMQ
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-            
-            # Enable publisher confirms
-            self.channel.confirm_delivery()
-            
-            # Declare the exchange (even though defined in rabbit-definitions.json, it's good practice)
-            self.channel.exchange_declare(
-                exchange='notifications',
-                exchange_type='direct',
-                durable=True
-            )
-            
-            self.connected = True
-            logger.info("Successfully connected to RabbitMQ")
-            
+            channel = PublisherChannel(self._parameters())
         except Exception as e:
+            with self._cond:
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(self.max_backoff, 0.5 * 2 ** self._failures)
             logger.error(f"Error connecting to RabbitMQ: {str(e)}")
-            self.connected = False
-            
-    def teardown(self, exception):
-        """Close connection when the app context ends"""
-        self.close()
-            
-    def close(self):
-        """Close the connection to RabbitMQ"""
-        if self.connection and self.connection.is_open:
-            self.connection.close()
-            self.connected = False
-            
-    def publish_notification(self, user_id, message, notification_type, extra_info):
-        """Publish a notification message to RabbitMQ"""
-        from flask import current_app
-        
-        if not self.connected:
-            self.connect(current_app)
-            
-        if not self.connected:
-            logger.error("Failed to connect to RabbitMQ, cannot publish notification")
-            return False
-            
+            raise ConnectionError(str(e))
+
+        with self._cond:
+            reconnected = self._failures > 0
+            self._failures = 0
+            self._retry_at = 0.0
+        if reconnected:
+            RECONNECTS.inc()
+            logger.info("Reconnected to RabbitMQ")
+        else:
+            logger.info("Successfully connected to RabbitMQ")
+        return channel
+
+    def _set_gauges(self):
+        POOL_SIZE.set(self._open_count)
+        POOL_IN_USE.set(self._in_use)
+
+    @contextmanager
+    def checkout(self):
+        """Borrow a connection for the calling thread, returning it afterwards.
+
+        A connection that raised while checked out is discarded rather than returned.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        channel = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    channel = self._idle.pop()
+                    break
+                if self._open_count < self.pool_size:
+                    self._open_count += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ConnectionError("Timed out waiting for a RabbitMQ channel")
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._set_gauges()
+
+        healthy = False
         try:
-            # Generate a unique message ID for idempotency
-            message_id = str(uuid.uuid4())
-            
-            # Create the notification payload
-            notification_payload = {
-                'id': message_id,
-                'message': message,
-                'user_id': user_id,
-                'type': notification_type,
-                'extra_info': extra_info,
-                'created_at': datetime.now().isoformat()
-            }
-            
-            # Convert dict to JSON string
-            message_body = json.dumps(notification_payload)
-            
-            # Publish the message
-            self.channel.basic_publish(
-                exchange='notifications',
-                routing_key='user.notification',
-                body=message_body,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # make message persistent
-                    content_type='application/json',
-                    message_id=message_id
-                ),
-                mandatory=True
-            )
-            
-            logger.info(f"Published notification for user {user_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error publishing notification: {str(e)}")
-            # Try to reconnect for next message
-            self.connected = False
-            return False
+            if channel is not None:
+                try:
+                    channel.service()
+                except Exception:
+                    channel.close()
+                    channel = None
+                if channel is not None and not channel.is_open:
+                    channel.close()
+                    channel = None
+            if channel is None:
+                channel = self._open()
+
+            yield channel
+            healthy = True
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                if healthy:
+                    self._idle.append(channel)
+                else:
+                    if channel is not None:
+                        channel.close()
+                    self._open_count -= 1
+                self._set_gauges()
+                self._cond.notify()
+
+    def close(self):
+        """Close every idle connection (checked out ones are closed when returned broken)"""
+        with self._cond:
+            for channel in self._idle:
+                channel.close()
+                self._open_count -= 1
+            self._idle = []
+            self._set_gauges()
+
+    def _publish_batch(self, messages):
+        with self.checkout() as channel, PUBLISH_SECONDS.labels(mode='batch').time():
+            channel.publish_batch(messages)
+
+    def publish_batch(self, messages):
+        """Publish a batch of messages and wait for the broker to accept all of them at once.
 
-# Create the extension instance
-rabbitmq = RabbitMQ()
+        ``messages`` is a list of dicts with exchange, routing_key, body, message_id
+        and optionally content_type (see outgoing_message).
+        The batch goes out on a publisher-confirm channel without waiting between
+        messages, then waits once for the broker to confirm all of them. Raises if
+        any message was nacked or left unconfirmed, and raises
+        CircuitOpenError without touching the network while the circuit is open.
+        """
+        self.breaker.call(self._publish_batch, messages)
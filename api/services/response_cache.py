@@ -0,0 +1,288 @@
+"""Two-level read-through cache for hot GET endpoints.
+
+Rendered JSON bodies are kept in an in-process LRU (L1, short TTL) in front of
+Redis (L2, shared by every API process). Each entry carries tags such as
+'ticket:42'; write handlers drop every entry with a tag through
+``on_commit(response_cache.invalidate, 'ticket:42')``. Invalidation deletes the
+Redis entries and is broadcast over Redis pub/sub so the other processes drop
+their L1 copies too. The L1 TTL bounds staleness if a broadcast is missed.
+
+A miss must not store a body its query read before an invalidation of one of
+its tags. Every invalidation stamps its tags with the next value of a Redis
+counter, and a fill only writes to Redis if none of its own tags was stamped
+after the counter value it read before running the view (checked and written
+under WATCH). Within a process, invalidations are also recorded on the fills
+still in flight, which then skip L1 for those tags.
+
+Without Redis (REDIS_HOST unset, the redis package missing, or the server
+down) the cache runs on L1 alone; Redis errors never fail a request.
+"""
+import os
+import json
+import logging
+import threading
+import time
+from functools import wraps
+from flask import request, make_response
+from prometheus_client import Counter
+from api.services.ttl_cache import TTLCache
+from api.services.circuit_breaker import CircuitBreaker
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - Redis is optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_HITS = Counter('response_cache_hits_total', 'Responses served from cache', ['endpoint', 'layer'])
+CACHE_MISSES = Counter('response_cache_misses_total', 'Cacheable requests that went to the database', ['endpoint'])
+CACHE_EVICTIONS = Counter(
+    'response_cache_evictions_total',
+    'Cached responses removed, by reason (lru: L1 size limit, invalidated: tag invalidation)',
+    ['reason']
+)
+
+KEY_PREFIX = 'response_cache:'
+TAG_PREFIX = 'response_cache:tag:'
+# Per-tag invalidation stamps, taken from a counter shared by every process
+VERSION_PREFIX = 'response_cache:version:'
+VERSION_COUNTER = 'response_cache:version_counter'
+INVALIDATION_CHANNEL = 'response_cache:invalidations'
+
+
+class _Fill:
+    """A cache fill in progress: where it started, and the tags invalidated since."""
+
+    def __init__(self, since):
+        self.since = since
+        self.invalidated = set()
+
+
+class ResponseCache:
+    def __init__(self, redis_client=None, ttl=60.0, l1_ttl=5.0, l1_size=5000):
+        self.ttl = ttl
+        self.local = TTLCache(l1_size, l1_ttl, on_evict=lambda n: CACHE_EVICTIONS.labels(reason='lru').inc(n))
+        self.redis = redis_client
+        self.breaker = CircuitBreaker('redis', failure_threshold=3, reset_timeout=10.0)
+        # Fills in flight in this process; local invalidations are recorded on each
+        self._fills = set()
+        self._lock = threading.Lock()
+        self._subscriber = None
+
+    def init_app(self, app):
+        self.ttl = float(os.getenv("RESPONSE_CACHE_TTL", self.ttl))
+        self.local.ttl = float(os.getenv("RESPONSE_CACHE_L1_TTL", self.local.ttl))
+        self.local.maxsize = int(os.getenv("RESPONSE_CACHE_L1_SIZE", self.local.maxsize))
+
+        if self.redis is None and redis is not None and os.getenv("REDIS_HOST"):
+            self.redis = redis.Redis(
+                host=os.getenv("REDIS_HOST"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                password=os.getenv("REDIS_PASSWORD") or None,
+                socket_timeout=float(os.getenv("RESPONSE_CACHE_REDIS_TIMEOUT", "0.1")),
+                socket_connect_timeout=float(os.getenv("RESPONSE_CACHE_REDIS_TIMEOUT", "0.1"))
+            )
+        if self.redis is not None:
+            self.start_subscriber()
+        else:
+            logger.info("Response cache running without Redis (in-process only)")
+
+    def _redis_call(self, fn, *args):
+        """Run a Redis command through the breaker; None (and a log line) on failure."""
+        if self.redis is None or not self.breaker.allow():
+            return None
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.breaker.record_failure()
+            logger.warning(f"Response cache Redis error: {str(e)}")
+            return None
+        self.breaker.record_success()
+        return result
+
+    def begin_fill(self, shared=True):
+        """Start a fill: call before running the query whose result will be cached.
+
+        ``shared=False`` only tracks invalidations in this process (for copying
+        an L2 entry into L1), saving the Redis round trip.
+        """
+        since = None
+        if shared:
+            since = self._redis_call(lambda: int(self.redis.get(VERSION_COUNTER) or 0))
+        fill = _Fill(since)
+        with self._lock:
+            self._fills.add(fill)
+        return fill
+
+    def end_fill(self, fill):
+        with self._lock:
+            self._fills.discard(fill)
+
+    def get(self, key, endpoint='unknown'):
+        """Return a cached JSON body, or None."""
+        entry = self.local.get(key)
+        if entry is not None:
+            CACHE_HITS.labels(endpoint=endpoint, layer='l1').inc()
+            return entry[0]
+
+        fill = self.begin_fill(shared=False)
+        try:
+            raw = self._redis_call(lambda: self.redis.get(KEY_PREFIX + key))
+            if raw is not None:
+                try:
+                    cached = json.loads(raw)
+                    self._set_local(key, cached['body'], frozenset(cached['tags']), fill)
+                    CACHE_HITS.labels(endpoint=endpoint, layer='l2').inc()
+                    return cached['body']
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Discarding malformed response cache entry {key}")
+        finally:
+            self.end_fill(fill)
+
+        CACHE_MISSES.labels(endpoint=endpoint).inc()
+        return None
+
+    def _set_local(self, key, body, tags, fill):
+        # Under the lock, so an invalidation either marks the fill first or discards the entry after
+        with self._lock:
+            if fill is not None and not fill.invalidated.isdisjoint(tags):
+                return False
+            self.local.set(key, (body, tags))
+        return True
+
+    def set(self, key, body, tags, fill=None):
+        """Store a JSON body under ``tags``.
+
+        With a ``fill`` (from begin_fill), the body is dropped if any of
+        ``tags`` was invalidated after the fill began.
+        """
+        tags = frozenset(tags)
+        if fill is not None and not fill.invalidated.isdisjoint(tags):
+            return
+
+        def store():
+            version_keys = [VERSION_PREFIX + tag for tag in sorted(tags)]
+            with self.redis.pipeline() as pipe:
+                try:
+                    if fill is not None and version_keys:
+                        # An invalidation of these tags between the check and EXEC aborts the write
+                        pipe.watch(*version_keys)
+                        if any(int(version) > fill.since for version in pipe.mget(version_keys) if version is not None):
+                            return False
+                    pipe.multi()
+                    pipe.set(KEY_PREFIX + key, json.dumps({'body': body, 'tags': sorted(tags)}), ex=int(self.ttl))
+                    for tag in tags:
+                        pipe.sadd(TAG_PREFIX + tag, key)
+                        # The tag set outlives its newest entry, then goes away on its own
+                        pipe.expire(TAG_PREFIX + tag, int(self.ttl) * 2)
+                    pipe.execute()
+                except redis.WatchError:
+                    return False
+            return True
+
+        # Redis can only vouch for the fill if it was reachable when the fill began
+        stored = None
+        if fill is None or fill.since is not None:
+            stored = self._redis_call(store)
+        if stored is not False:
+            self._set_local(key, body, tags, fill)
+
+    def invalidate(self, *tags):
+        """Drop every cached response carrying any of ``tags``, in every process."""
+        if not tags:
+            return
+        self._invalidate_local(tags)
+
+        version_keys = [VERSION_PREFIX + tag for tag in tags]
+        tag_keys = [TAG_PREFIX + tag for tag in tags]
+
+        def invalidate_shared(pipe):
+            # Retried if a concurrent invalidation stamps these tags (so stamps only
+            # ever increase) or a fill adds an entry to them (so it gets deleted too)
+            version = pipe.incr(VERSION_COUNTER)
+            keys = set()
+            for tag_key in tag_keys:
+                keys.update(pipe.smembers(tag_key))
+
+            pipe.multi()
+            for version_key in version_keys:
+                # Only has to outlive the fills that started before it
+                pipe.set(version_key, version, ex=int(self.ttl) * 2)
+            if keys:
+                pipe.delete(*[KEY_PREFIX + (key.decode() if isinstance(key, bytes) else key) for key in keys])
+            pipe.delete(*tag_keys)
+            pipe.publish(INVALIDATION_CHANNEL, json.dumps(list(tags)))
+        self._redis_call(lambda: self.redis.transaction(invalidate_shared, *version_keys, *tag_keys))
+
+    def _invalidate_local(self, tags):
+        tags = set(tags)
+        with self._lock:
+            for fill in self._fills:
+                fill.invalidated.update(tags)
+            removed = self.local.discard_where(lambda key, entry: not tags.isdisjoint(entry[1]))
+        if removed:
+            CACHE_EVICTIONS.labels(reason='invalidated').inc(removed)
+
+    def start_subscriber(self):
+        """Listen for invalidations from other processes in a daemon thread."""
+        if self._subscriber is not None:
+            return
+        self._subscriber = threading.Thread(target=self._subscribe_loop, name="response-cache-invalidations", daemon=True)
+        self._subscriber.start()
+
+    def _subscribe_loop(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    try:
+                        self._invalidate_local(json.loads(message['data']))
+                    except (ValueError, TypeError):
+                        logger.warning(f"Ignoring malformed cache invalidation: {message['data']!r}")
+            except Exception as e:
+                logger.warning(f"Response cache invalidation listener error, reconnecting: {str(e)}")
+                # Invalidations may have been missed: drop everything held locally
+                self.local.clear()
+                time.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def cached(self, tags):
+        """Cache a GET view's 200 JSON response.
+
+        ``tags(body, **view_args)`` returns the tags for a response, given its
+        decoded JSON body. The key is the request path plus query string;
+        streamed responses are never cached.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = request.full_path
+                body = self.get(key, request.endpoint or view.__name__)
+                if body is not None:
+                    return make_response(body, 200, {'Content-Type': 'application/json'})
+
+                fill = self.begin_fill()
+                try:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code == 200 and not response.is_streamed and response.mimetype == 'application/json':
+                        self.set(key, response.get_data(as_text=True), tags(response.get_json(), **kwargs), fill)
+                finally:
+                    self.end_fill(fill)
+                return response
+            return wrapper
+        return decorator
+
+
+# Shared by every request in the process; configured by init_app()
+response_cache = ResponseCache()
@@ -0,0 +1,52 @@
+"""Wire formats for notification messages.
+
+The format is chosen with NOTIFICATION_CONTENT_TYPE and travels with every
+message as its AMQP content_type, so consumers decode each message by what it
+says it is. JSON is the default; msgpack is available when the msgpack package
+is installed.
+"""
+import os
+import json
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+
+class UnsupportedContentType(ValueError):
+    """Raised for a content type with no serializer available."""
+
+
+SERIALIZERS = {
+    JSON: (lambda payload: json.dumps(payload).encode('utf-8'), lambda body: json.loads(body))
+}
+if msgpack is not None:
+    SERIALIZERS[MSGPACK] = (lambda payload: msgpack.packb(payload, use_bin_type=True),
+                            lambda body: msgpack.unpackb(body, raw=False))
+
+
+def default_content_type():
+    content_type = os.environ.get('NOTIFICATION_CONTENT_TYPE') or JSON
+    if content_type not in SERIALIZERS:
+        raise UnsupportedContentType(f"No serializer for {content_type}" + (" (pip install msgpack)" if content_type == MSGPACK else ""))
+    return content_type
+
+
+def serialize(payload, content_type=None):
+    """Return (body, content_type) for a message payload."""
+    content_type = content_type or default_content_type()
+    if content_type not in SERIALIZERS:
+        raise UnsupportedContentType(f"No serializer for {content_type}")
+    return SERIALIZERS[content_type][0](payload), content_type
+
+
+def deserialize(body, content_type=None):
+    """Decode a message body; messages without a content type are JSON."""
+    content_type = content_type or JSON
+    if content_type not in SERIALIZERS:
+        raise UnsupportedContentType(f"No serializer for {content_type}")
+    return SERIALIZERS[content_type][1](body)
@@ -0,0 +1,239 @@
+"""Composable ticket search.
+
+A TicketSearch is a set of filters plus a sort key. The SQL text only depends
+on the *shape* of the search (which filters are present, single or multi
+valued, sort and paging mode), so it is compiled once per shape and cached;
+the values themselves are always passed as query parameters.
+"""
+from datetime import datetime
+from functools import lru_cache
+from api.pagination import PAGE_KEY
+
+# Sort keys map to the expressions the ticket indexes in api/migrations are built on
+SORT_KEYS = {
+    'created_at': "t.created_at",
+    'updated_at': "t.updated_at",
+    # Tickets closed outside the API may not have closed_at set
+    'closed_at': "COALESCE(t.closed_at, t.created_at)"
+}
+
+# name -> (column, parser). Order here is the order predicates appear in the SQL.
+EQUALITY_FILTERS = {
+    'status': ("t.status", str),
+    'assign_id': ("t.assign_id", int),
+    'user_id': ("t.user_id", int),
+    'category': ("t.category", str),
+    'sub_category': ("t.sub_category", str),
+    'priority': ("t.priority", str)
+}
+
+# name -> (column, operator) for half-open date ranges: [from, to)
+RANGE_FILTERS = {
+    'created_from': ("t.created_at", ">="),
+    'created_to': ("t.created_at", "<"),
+    'updated_from': ("t.updated_at", ">="),
+    'updated_to': ("t.updated_at", "<"),
+    'closed_from': ("t.closed_at", ">="),
+    'closed_to': ("t.closed_at", "<")
+}
+
+# Filters that accept a comma-separated list of values
+MULTI_VALUE_FILTERS = ('status', 'category', 'priority')
+
+
+class InvalidSearchRequest(ValueError):
+    """Raised when search parameters cannot be parsed."""
+
+
+def _parse_date(name, value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidSearchRequest(f"{name} must be an ISO 8601 date or timestamp")
+
+
+class TicketSearch:
+    """Filters, sort key and direction for a ticket list query.
+
+    ``filters`` maps filter names to a value, or to a list of values for the
+    multi-value filters. ``unassigned=True`` selects tickets with no assignee.
+    """
+
+    def __init__(self, filters=None, unassigned=False, sort='created_at', descending=True):
+        filters = dict(filters or {})
+        unknown = set(filters) - set(EQUALITY_FILTERS) - set(RANGE_FILTERS)
+        if unknown:
+            raise InvalidSearchRequest("Unknown filter(s): " + ", ".join(sorted(unknown)))
+        if sort not in SORT_KEYS:
+            raise InvalidSearchRequest("sort must be one of: " + ", ".join(SORT_KEYS))
+        if unassigned and 'assign_id' in filters:
+            raise InvalidSearchRequest("assign_id cannot be combined with unassigned")
+
+        self.filters = filters
+        self.unassigned = unassigned
+        self.sort = sort
+        self.descending = descending
+
+    @classmethod
+    def from_args(cls, args):
+        """Build a search from request query parameters."""
+        filters = {}
+        for name, (_, parser) in EQUALITY_FILTERS.items():
+            raw = args.get(name)
+            if raw is None or raw == '':
+                continue
+            if name == 'assign_id' and raw.lower() == 'none':
+                continue
+            try:
+                if name in MULTI_VALUE_FILTERS and ',' in raw:
+                    filters[name] = [parser(v.strip()) for v in raw.split(',') if v.strip()]
+                else:
+                    filters[name] = parser(raw)
+            except ValueError:
+                raise InvalidSearchRequest(f"Invalid value for {name}")
+
+        for name in RANGE_FILTERS:
+            raw = args.get(name)
+            if raw:
+                filters[name] = _parse_date(name, raw)
+
+        order = args.get('order', 'desc').lower()
+        if order not in ('asc', 'desc'):
+            raise InvalidSearchRequest("order must be asc or desc")
+
+        unassigned = (args.get('assign_id', '').lower() == 'none'
+                      or args.get('unassigned', '').lower() in ('true', '1', 'yes'))
+
+        return cls(filters, unassigned=unassigned, sort=args.get('sort', 'created_at'), descending=order == 'desc')
+
+    @property
+    def shape(self):
+        """Hashable description of everything that affects the SQL text."""
+        return tuple(
+            (name, isinstance(self.filters[name], (list, tuple)))
+            for name in list(EQUALITY_FILTERS) + list(RANGE_FILTERS)
+            if name in self.filters
+        ) + ((('unassigned', False),) if self.unassigned else ())
+
+    def to_sql(self, limit=None, cursor=None):
+        """Return (query, params) for this search, optionally as one keyset page."""
+        query = compile_search(self.shape, self.sort, self.descending, limit is not None, cursor is not None)
+
+        params = []
+        for name, is_list in self.shape:
+            if name == 'unassigned':
+                continue
+            value = self.filters[name]
+            params.append(list(value) if is_list else value)
+        if cursor is not None:
+            params.extend(cursor)
+        if limit is not None:
+            params.append(limit + 1)
+        return query, tuple(params)
+
+
+@lru_cache(maxsize=256)
+def compile_search(shape, sort, descending, paginated, has_cursor):
+    """Compile the SQL text for a search shape. Cached, since shapes repeat constantly."""
+    sort_expression = SORT_KEYS[sort]
+    conditions = []
+    for name, is_list in shape:
+        if name == 'unassigned':
+            conditions.append("t.assign_id IS NULL")
+        elif name in EQUALITY_FILTERS:
+            column = EQUALITY_FILTERS[name][0]
+            conditions.append(f"{column} = ANY(%s)" if is_list else f"{column} = %s")
+        else:
+            column, operator = RANGE_FILTERS[name]
+            conditions.append(f"{column} {operator} %s")
+
+    direction = "DESC" if descending else "ASC"
+    if has_cursor:
+        # Row comparison keeps the predicate a single index range scan
+        conditions.append(f"({sort_expression}, t.id) {'<' if descending else '>'} (%s, %s)")
+
+    query = f"""
+        SELECT t.*, u.user_name, {sort_expression} AS {PAGE_KEY}
+        FROM tickets t
+        LEFT JOIN users u ON t.user_id = u.id
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY {sort_expression} {direction}, t.id {direction}
+    """
+    if paginated:
+        query += " LIMIT %s"
+    return query
+
+
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=25, MinWords=8, MaxFragments=2"
+
+# Comment matches count, but a hit in the ticket itself ranks higher
+COMMENT_RANK_WEIGHT = 0.5
+
+
+@lru_cache(maxsize=8)
+def compile_text_search(filter_by_status, has_cursor):
+    """Compile the full-text search query: rank matches, cut one page, then build snippets.
+
+    Snippets (ts_headline re-parses the raw text) are only computed for the rows on the page.
+    """
+    conditions = []
+    if filter_by_status:
+        conditions.append("t.status = %(status)s")
+    if has_cursor:
+        conditions.append("(r.rank, r.ticket_id) < (%(after_rank)s::float8, %(after_id)s)")
+
+    return f"""
+        WITH q AS (
+            SELECT websearch_to_tsquery('spanish', %(q)s) AS query
+        ),
+        matches AS (
+            SELECT ts.ticket_id, ts_rank_cd(ts.search_vector, q.query) AS rank
+            FROM ticket_search ts, q
+            WHERE ts.search_vector @@ q.query
+            UNION ALL
+            SELECT cs.ticket_id, ts_rank_cd(cs.search_vector, q.query) * {COMMENT_RANK_WEIGHT} AS rank
+            FROM comment_search cs, q
+            WHERE cs.search_vector @@ q.query
+        ),
+        ranked AS (
+            SELECT ticket_id, max(rank)::float8 AS rank
+            FROM matches
+            GROUP BY ticket_id
+        ),
+        page AS (
+            SELECT r.ticket_id, r.rank
+            FROM ranked r
+            JOIN tickets t ON t.id = r.ticket_id
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY r.rank DESC, r.ticket_id DESC
+            LIMIT %(limit)s
+        )
+        SELECT t.*, u.user_name, p.rank, p.rank AS {PAGE_KEY},
+            ts_headline('spanish', t.description, q.query, %(headline)s) AS snippet,
+            (
+                SELECT ts_headline('spanish', c.content, q.query, %(headline)s)
+                FROM comment_search cs
+                JOIN comments c ON c.id = cs.comment_id
+                WHERE cs.ticket_id = t.id AND cs.search_vector @@ q.query
+                ORDER BY ts_rank_cd(cs.search_vector, q.query) DESC
+                LIMIT 1
+            ) AS comment_snippet
+        FROM page p
+        JOIN tickets t ON t.id = p.ticket_id
+        LEFT JOIN users u ON t.user_id = u.id
+        CROSS JOIN q
+        ORDER BY p.rank DESC, t.id DESC
+    """
+
+
+def text_search_sql(text, status=None, limit=50, cursor=None):
+    """Return (query, params) for one page of ranked full-text results."""
+    params = {
+        'q': text,
+        'status': status,
+        'limit': limit + 1,
+        'headline': HEADLINE_OPTIONS
+    }
+    if cursor is not None:
+        params['after_rank'], params['after_id'] = cursor
+    return compile_text_search(status is not None, cursor is not None), params
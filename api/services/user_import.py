@@ -0,0 +1,250 @@
+"""Bulk user provisioning.
+
+An upload (CSV with a header row, or NDJSON) is parsed as it streams in and
+validated row by row; valid rows are fed straight into COPY into a temporary
+staging table, then merged into users with a single INSERT ... ON CONFLICT
+(email). Nothing holds the whole upload in memory.
+"""
+import io
+import csv
+import json
+from api.services.authorization import authorization
+from api.services.response_cache import response_cache
+
+FIELDS = ('email', 'password', 'user_name', 'phone', 'user_role')
+REQUIRED_FIELDS = ('email', 'password')
+DEFAULT_ROLE = 'user'
+
+FORMATS = {
+    'csv': ('text/csv', 'application/csv'),
+    'ndjson': ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+}
+
+# What to do when an email already exists: report it, or update that user
+CONFLICT_ACTIONS = {
+    'skip': "NOTHING",
+    'update': """UPDATE SET password = EXCLUDED.password,
+                            user_name = COALESCE(EXCLUDED.user_name, users.user_name),
+                            phone = COALESCE(EXCLUDED.phone, users.phone),
+                            user_role = EXCLUDED.user_role"""
+}
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class InvalidImportRequest(ValueError):
+    """Raised when an upload can't be imported at all (as opposed to individual bad rows)."""
+
+
+def import_format(requested, content_type):
+    """Return 'csv' or 'ndjson' from ?format= or the request's content type."""
+    if requested:
+        fmt = requested.lower()
+    else:
+        mimetype = (content_type or '').split(';')[0].strip().lower()
+        fmt = next((name for name, mimetypes in FORMATS.items() if mimetype in mimetypes), None)
+    if fmt not in FORMATS:
+        raise InvalidImportRequest("Upload CSV (text/csv) or NDJSON (application/x-ndjson), or pass format=csv|ndjson")
+    return fmt
+
+
+def read_records(stream, fmt):
+    """Yield (row number, record dict) from an upload, or (row number, error) for unparseable rows."""
+    lines = (line.decode('utf-8-sig') if isinstance(line, bytes) else line for line in stream)
+
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        try:
+            missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or ())]
+            if missing:
+                raise InvalidImportRequest("CSV header is missing: " + ", ".join(missing))
+            for row_no, record in enumerate(reader, 1):
+                yield row_no, record
+        except csv.Error as e:
+            raise InvalidImportRequest(f"Malformed CSV near line {reader.line_num}: {str(e)}")
+        return
+
+    row_no = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row_no += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield row_no, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield row_no, "Each line must be a JSON object"
+            continue
+        yield row_no, record
+
+
+def validate(record, allowed_roles=None):
+    """Return (values, None) for a valid record or (None, error message)."""
+    values = {}
+    for field in FIELDS:
+        value = record.get(field)
+        values[field] = str(value).strip() if value is not None and str(value).strip() != '' else None
+
+    missing = [field for field in REQUIRED_FIELDS if values[field] is None]
+    if missing:
+        return None, "Missing " + ", ".join(missing)
+    if '@' not in values['email']:
+        return None, "Invalid email"
+
+    values['user_role'] = values['user_role'] or DEFAULT_ROLE
+    if allowed_roles is not None and values['user_role'] not in allowed_roles:
+        return None, f"Not allowed to provision {values['user_role']} users"
+    return values, None
+
+
+class _ChunkStream:
+    """File-like object over an iterator of text chunks, for copy_expert."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _copy_chunks(records, errors, allowed_roles):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_no, record in records:
+        if isinstance(record, str):
+            errors.append({"row": row_no, "error": record})
+            continue
+        values, error = validate(record, allowed_roles)
+        if error:
+            errors.append({"row": row_no, "email": record.get('email'), "error": error})
+            continue
+        # None becomes an unquoted empty field, which COPY reads as NULL
+        writer.writerow([row_no] + [values[field] for field in FIELDS])
+        if buffer.tell() >= COPY_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def import_users(cur, stream, fmt, on_conflict='skip', group_id=None, allowed_roles=None):
+    """Load an upload into users and optionally enrol every imported user into ``group_id``.
+
+    With ``allowed_roles``, existing accounts with any other role are reported
+    as errors instead of being enrolled.
+
+    Runs in the caller's transaction, and drops cached authorization facts and
+    responses for the users it changes once that commits. Returns a summary with per-row errors.
+    """
+    if on_conflict not in CONFLICT_ACTIONS:
+        raise InvalidImportRequest("on_conflict must be one of: " + ", ".join(CONFLICT_ACTIONS))
+
+    cur.execute(
+        """
+        CREATE TEMP TABLE user_import (
+            row_no INTEGER PRIMARY KEY,
+            email TEXT NOT NULL,
+            password TEXT NOT NULL,
+            user_name TEXT,
+            phone TEXT,
+            user_role TEXT NOT NULL
+        ) ON COMMIT DROP;
+        """
+    )
+
+    errors = []
+    chunks = _copy_chunks(read_records(stream, fmt), errors, allowed_roles)
+    cur.copy_expert(
+        "COPY user_import (row_no, email, password, user_name, phone, user_role) FROM STDIN WITH (FORMAT csv)",
+        _ChunkStream(chunks)
+    )
+
+    # The first row wins when an email appears more than once in the upload
+    cur.execute(
+        f"""
+        WITH deduped AS (
+            SELECT DISTINCT ON (email) * FROM user_import ORDER BY email, row_no
+        ),
+        merged AS (
+            INSERT INTO users (email, password, user_name, phone, user_role)
+            SELECT email, password, user_name, phone, user_role FROM deduped ORDER BY row_no
+            ON CONFLICT (email) DO {CONFLICT_ACTIONS[on_conflict]}
+            RETURNING id, email, (xmax = 0) AS created
+        )
+        SELECT s.row_no, s.email, COALESCE(m.id, u.id) AS user_id, u.user_role AS existing_role,
+               CASE WHEN d.row_no IS NULL THEN 'duplicate_in_upload'
+                    WHEN m.id IS NULL THEN 'exists'
+                    WHEN m.created THEN 'created'
+                    ELSE 'updated' END AS status
+        FROM user_import s
+        LEFT JOIN deduped d ON d.row_no = s.row_no
+        LEFT JOIN merged m ON m.email = s.email AND d.row_no IS NOT NULL
+        LEFT JOIN users u ON u.email = s.email AND d.row_no IS NOT NULL AND m.id IS NULL
+        ORDER BY s.row_no;
+        """
+    )
+    results = cur.fetchall()
+    invalid = len(errors)
+
+    counts = {"created": 0, "updated": 0, "exists": 0, "duplicate_in_upload": 0}
+    user_ids = []
+    updated_ids = []
+    for row in results:
+        counts[row['status']] += 1
+        if row['status'] == 'duplicate_in_upload':
+            errors.append({"row": row['row_no'], "email": row['email'], "error": "Duplicate email in upload"})
+        elif row['status'] == 'exists':
+            # Existing accounts are only enrolled if the importer could have provisioned them
+            if allowed_roles is not None and row['existing_role'] not in allowed_roles:
+                errors.append({"row": row['row_no'], "email": row['email'], "user_id": row['user_id'],
+                               "error": f"Email already registered to an existing {row['existing_role']} account"})
+                continue
+            errors.append({"row": row['row_no'], "email": row['email'], "user_id": row['user_id'], "error": "Email already registered"})
+            user_ids.append(row['user_id'])
+        else:
+            user_ids.append(row['user_id'])
+            if row['status'] == 'updated':
+                updated_ids.append(row['user_id'])
+    if updated_ids:
+        cur.connection.on_commit(authorization.invalidate_users, updated_ids)
+    if counts['created'] or counts['updated']:
+        cur.connection.on_commit(response_cache.invalidate, "admin_users")
+
+    enrolled = 0
+    if group_id is not None and user_ids:
+        cur.execute(
+            """
+            INSERT INTO user_groups (user_id, group_id)
+            SELECT user_id, %s FROM unnest(%s::int[]) AS user_id
+            ON CONFLICT (user_id, group_id) DO NOTHING;
+            """,
+            (group_id, user_ids)
+        )
+        enrolled = cur.rowcount
+        cur.connection.on_commit(authorization.invalidate_membership, group_id, user_ids)
+        cur.connection.on_commit(response_cache.invalidate, *[f"user:{user_id}:groups" for user_id in user_ids])
+
+    errors.sort(key=lambda error: error['row'])
+    return {
+        "rows": len(results) + invalid,
+        "created": counts['created'],
+        "updated": counts['updated'],
+        "existing": counts['exists'],
+        "duplicates": counts['duplicate_in_upload'],
+        "invalid": invalid,
+        "enrolled": enrolled,
+        "errors": errors
+    }
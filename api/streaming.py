@@ -0,0 +1,78 @@
+import uuid
+import logging
+from flask import Response, current_app, request, stream_with_context
+from api.database import get_db_connection, dict_cursor
+
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH_SIZE = 500
+
+STREAM_MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+class InvalidStreamFormat(ValueError):
+    """Raised when the stream query parameter names an unknown format."""
+
+
+def get_stream_format():
+    """Return the requested stream format ('json' or 'ndjson'), or None when not streaming."""
+    stream_format = request.args.get('stream')
+    if not stream_format:
+        return None
+    stream_format = stream_format.lower()
+    if stream_format not in STREAM_MIMETYPES:
+        raise InvalidStreamFormat("stream must be one of: " + ", ".join(STREAM_MIMETYPES))
+    return stream_format
+
+
+def stream_query(query, params=(), stream_format='json', transform=None, batch_size=STREAM_BATCH_SIZE):
+    """Stream the rows of ``query`` as a JSON array or NDJSON without materializing them.
+
+    Rows are read through a named (server-side) cursor in ``batch_size`` chunks on the
+    request's own connection, so memory stays flat, the first rows are sent while the
+    rest are still being produced, and the rows come from the same transaction as the
+    checks the handler ran before streaming. stream_with_context keeps the app context,
+    and with it the connection, alive until the body is finished.
+    """
+    app = current_app._get_current_object()
+
+    def generate():
+        conn = get_db_connection()
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=dict_cursor())
+        cur.itersize = batch_size
+        first = True
+        try:
+            cur.execute(query, params)
+            if stream_format == 'json':
+                yield '['
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                chunk = []
+                for row in rows:
+                    if transform is not None:
+                        row = transform(row)
+                    encoded = app.json.dumps(row)
+                    if stream_format == 'json':
+                        chunk.append(encoded if first else ',' + encoded)
+                    else:
+                        chunk.append(encoded + '\n')
+                    first = False
+                yield ''.join(chunk)
+            if stream_format == 'json':
+                yield ']'
+        except Exception as e:
+            # Headers are already sent, so all we can do is cut the body short
+            logger.error(f"Error streaming query results: {str(e)}", exc_info=True)
+            raise
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_MIMETYPES[stream_format])
@@ -0,0 +1,133 @@
+"""A fan-out batch replayed after a crash is stored once per recipient, against Postgres.
+
+Needs a migrated database reachable through the POSTGRES_* settings; skipped otherwise.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+import psycopg2
+
+from api.database import connect
+from api.workers import announcement_fanout
+from api.workers.announcement_fanout import fan_out, record_error, recipient_message_id
+from api.workers.notification_persister import to_row, persist
+
+FANOUT_CREATED_AT = datetime(2026, 1, 15, 9, 30)
+
+
+class RecordingPublisher:
+    """Stands in for RabbitMQ: keeps every message it is asked to publish."""
+
+    def __init__(self):
+        self.published = []
+
+    def publish_batch(self, messages):
+        self.published.append(list(messages))
+
+
+@pytest.fixture
+def conn():
+    try:
+        conn = connect()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres is not available: {e}")
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('announcement_fanouts') IS NOT NULL;")
+    migrated = cur.fetchone()[0]
+    cur.close()
+    if not migrated:
+        conn.close()
+        pytest.skip("database is not migrated")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def announcement(conn):
+    """A group with two reachable members and a pending fan-out for its announcement."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO users (email, password, user_name, phone, user_role) VALUES
+            ('test-replay-teacher@example.invalid', 'x', 'Teacher', NULL, 'teacher'),
+            ('test-replay-first@example.invalid', 'x', 'First', '000', 'user'),
+            ('test-replay-second@example.invalid', 'x', 'Second', '001', 'user')
+        RETURNING id;
+        """
+    )
+    teacher_id, *member_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("INSERT INTO groups (name, teacher_id) VALUES ('test-replay', %s) RETURNING id;", (teacher_id,))
+    group_id = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO user_groups (user_id, group_id) SELECT unnest(%s::int[]), %s;",
+        (member_ids, group_id)
+    )
+    cur.execute(
+        "INSERT INTO announcements (group_id, teacher_id, title, content) VALUES (%s, %s, 'Replay', 'Replayed batch') RETURNING id;",
+        (group_id, teacher_id)
+    )
+    announcement_id = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO announcement_fanouts (announcement_id, group_id, message, created_at) VALUES (%s, %s, 'Replayed batch', %s);",
+        (announcement_id, group_id, FANOUT_CREATED_AT)
+    )
+    conn.commit()
+
+    yield SimpleNamespace(id=announcement_id, member_ids=member_ids)
+
+    conn.rollback()
+    cur.execute("DELETE FROM groups WHERE id = %s;", (group_id,))
+    cur.execute("DELETE FROM users WHERE id = ANY(%s);", ([teacher_id] + member_ids,))
+    conn.commit()
+    cur.close()
+
+
+def deliver(conn, batch):
+    """What the persister does with one delivery of a published batch."""
+    rows = [
+        to_row(SimpleNamespace(message_id=m['message_id'], content_type=m['content_type']), m['body'])
+        for m in batch
+    ]
+    return persist(conn, rows)
+
+
+def test_replayed_batch_is_stored_once_per_recipient(conn, announcement, monkeypatch):
+    stream_conn = connect()
+    publisher = RecordingPublisher()
+    checkpoint = announcement_fanout.checkpoint
+
+    def crash_before_checkpoint(*args, **kwargs):
+        raise RuntimeError("worker died after publishing")
+
+    try:
+        # The first attempt publishes the batch but dies before recording progress
+        monkeypatch.setattr(announcement_fanout, 'checkpoint', crash_before_checkpoint)
+        with pytest.raises(RuntimeError):
+            fan_out(conn, stream_conn, publisher, announcement.id, batch_size=10)
+        record_error(conn, announcement.id, RuntimeError("worker died after publishing"))
+
+        # The redelivered event replays the same batch from the start
+        monkeypatch.setattr(announcement_fanout, 'checkpoint', checkpoint)
+        assert fan_out(conn, stream_conn, publisher, announcement.id, batch_size=10)
+    finally:
+        stream_conn.close()
+
+    first, replay = publisher.published
+    expected_ids = {recipient_message_id(announcement.id, user_id) for user_id in announcement.member_ids}
+    assert {m['message_id'] for m in first} == expected_ids
+    assert {m['message_id'] for m in replay} == expected_ids
+
+    assert deliver(conn, first) == len(announcement.member_ids)
+    assert deliver(conn, replay) == 0
+
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT user_id, message_id::text, created_at FROM notifications WHERE user_id = ANY(%s) ORDER BY user_id;",
+        (announcement.member_ids,)
+    )
+    stored = cur.fetchall()
+    cur.close()
+    assert stored == [
+        (user_id, recipient_message_id(announcement.id, user_id), FANOUT_CREATED_AT)
+        for user_id in sorted(announcement.member_ids)
+    ]
@@ -0,0 +1,168 @@
+"""Response cache fills and invalidation, against fakeredis as the shared Redis."""
+import json
+import pytest
+from flask import Flask, jsonify
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from api.services.response_cache import ResponseCache, KEY_PREFIX
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_cache(server=None):
+    """One API process's cache; caches made from the same server share Redis."""
+    return ResponseCache(fakeredis.FakeRedis(server=server) if server is not None else None)
+
+
+def stored(cache, key):
+    raw = cache.redis.get(KEY_PREFIX + key)
+    return json.loads(raw)['body'] if raw is not None else None
+
+
+def test_fill_is_stored_in_both_layers(server):
+    cache = make_cache(server)
+    fill = cache.begin_fill()
+    cache.set('/tickets/1', '{"id": 1}', ['ticket:1'], fill)
+    cache.end_fill(fill)
+
+    assert cache.local.get('/tickets/1')[0] == '{"id": 1}'
+    assert stored(cache, '/tickets/1') == '{"id": 1}'
+    assert cache.get('/tickets/1') == '{"id": 1}'
+
+
+def test_invalidate_drops_entries_with_the_tag(server):
+    cache = make_cache(server)
+    cache.set('/tickets/1', '{"id": 1}', ['ticket:1'])
+    cache.set('/tickets/2', '{"id": 2}', ['ticket:2'])
+
+    cache.invalidate('ticket:1')
+
+    assert cache.get('/tickets/1') is None
+    assert stored(cache, '/tickets/1') is None
+    assert cache.get('/tickets/2') == '{"id": 2}'
+
+
+def test_fill_skipped_when_its_tag_is_invalidated_meanwhile(server):
+    cache = make_cache(server)
+    fill = cache.begin_fill()
+    cache.invalidate('ticket:1')
+    cache.set('/tickets/1', '{"status": "stale"}', ['ticket:1'], fill)
+    cache.end_fill(fill)
+
+    assert cache.local.get('/tickets/1') is None
+    assert stored(cache, '/tickets/1') is None
+
+
+def test_fill_kept_when_an_unrelated_tag_is_invalidated_meanwhile(server):
+    cache = make_cache(server)
+    fill = cache.begin_fill()
+    cache.invalidate('ticket:2', 'admin_users')
+    cache.set('/tickets/1', '{"id": 1}', ['ticket:1'], fill)
+    cache.end_fill(fill)
+
+    assert cache.local.get('/tickets/1')[0] == '{"id": 1}'
+    assert stored(cache, '/tickets/1') == '{"id": 1}'
+
+
+def test_fill_skipped_when_another_process_invalidates_its_tag(server):
+    filling, writer = make_cache(server), make_cache(server)
+    fill = filling.begin_fill()
+    # The other process's broadcast hasn't reached this one yet
+    writer.invalidate('ticket:1')
+    filling.set('/tickets/1', '{"status": "stale"}', ['ticket:1'], fill)
+    filling.end_fill(fill)
+
+    assert stored(filling, '/tickets/1') is None
+    assert filling.local.get('/tickets/1') is None
+
+
+def test_fill_started_after_invalidation_is_stored(server):
+    filling, writer = make_cache(server), make_cache(server)
+    writer.invalidate('ticket:1')
+    fill = filling.begin_fill()
+    filling.set('/tickets/1', '{"id": 1}', ['ticket:1'], fill)
+    filling.end_fill(fill)
+
+    assert stored(filling, '/tickets/1') == '{"id": 1}'
+
+
+def test_invalidation_stamps_only_increase(server):
+    first, second = make_cache(server), make_cache(server)
+    first.invalidate('ticket:1')
+    fill = first.begin_fill()
+    second.invalidate('ticket:1', 'ticket:2')
+    first.invalidate('ticket:2')
+
+    versions = [int(v) for v in first.redis.mget(['response_cache:version:ticket:1', 'response_cache:version:ticket:2'])]
+    assert all(version > fill.since for version in versions)
+    first.end_fill(fill)
+
+
+def test_without_redis_fills_use_local_invalidations():
+    cache = make_cache()
+    fill = cache.begin_fill()
+    assert fill.since is None
+    cache.invalidate('ticket:1')
+    cache.set('/tickets/1', '{"status": "stale"}', ['ticket:1'], fill)
+    cache.set('/tickets/2', '{"id": 2}', ['ticket:2'], fill)
+    cache.end_fill(fill)
+
+    assert cache.get('/tickets/1') is None
+    assert cache.get('/tickets/2') == '{"id": 2}'
+
+
+def test_cached_view_skips_fill_invalidated_during_the_request(server):
+    cache, writer = make_cache(server), make_cache(server)
+    app = Flask(__name__)
+    calls = []
+
+    @app.route("/tickets/<id>")
+    @cache.cached(lambda body, id: [f"ticket:{id}"])
+    def get_ticket(id):
+        calls.append(id)
+        if len(calls) == 1:
+            # A write commits in another process while this request's query runs
+            writer.invalidate(f"ticket:{id}")
+        return jsonify({"id": id, "version": len(calls)})
+
+    client = app.test_client()
+    assert client.get("/tickets/7").get_json()["version"] == 1
+    assert client.get("/tickets/7").get_json()["version"] == 2
+    # The second response was filled without interference and is served from cache
+    assert client.get("/tickets/7").get_json()["version"] == 2
+    assert calls == ["7", "7"]
+
+
+def test_fill_written_while_invalidation_runs_is_deleted(server):
+    filling, writer = make_cache(server), make_cache(server)
+    fill = filling.begin_fill()
+    original = writer.redis.transaction
+
+    def transaction(func, *watches, **kwargs):
+        attempts = []
+
+        def racing(pipe):
+            attempts.append(1)
+            if len(attempts) == 1:
+                multi = pipe.multi
+
+                def fill_then_multi():
+                    # The fill checks the (not yet stamped) version and writes after
+                    # this invalidation read the tag set, before its EXEC
+                    pipe.multi = multi
+                    filling.set('/tickets/1', '{"status": "stale"}', ['ticket:1'], fill)
+                    multi()
+                pipe.multi = fill_then_multi
+            return func(pipe)
+        return original(racing, *watches, **kwargs)
+
+    writer.redis.transaction = transaction
+    writer.invalidate('ticket:1')
+    filling.end_fill(fill)
+
+    assert stored(filling, '/tickets/1') is None
+    assert not writer.redis.smembers('response_cache:tag:ticket:1')
@@ -0,0 +1 @@
+"""Background processes that run alongside the API: python -m api.workers.<name>"""
@@ -0,0 +1,287 @@
+"""Worker that expands 'announcement created' events into per-member notifications.
+
+create_announcement only records an announcement_fanouts row and queues one
+event. This worker consumes those events, streams the group's members through
+a server-side cursor in batches, publishes one notification per member and
+checkpoints progress after every batch, so a restarted worker resumes where
+the previous one stopped. Message ids are derived from (announcement, user)
+and created_at is the fan-out's, so a batch replayed after a crash carries
+the same ids and timestamps as the first attempt.
+
+Each claim counts as an attempt, except ones that stopped because RabbitMQ was
+unreachable: a broker outage delays a fan-out but never exhausts its attempts.
+
+Run with: python -m api.workers.announcement_fanout
+"""
+import os
+import time
+import uuid
+import logging
+import argparse
+import pika
+from api.database import connect, dict_cursor
+from api.services.circuit_breaker import CircuitOpenError
+from api.services.serialization import deserialize
+from api.services.rabbitmq import (
+    RabbitMQ, build_notification, outgoing_message, routing_key_for, ANNOUNCEMENT_FANOUT_QUEUE
+)
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_ATTEMPTS = 3
+MAX_FANOUT_ATTEMPTS = 5
+
+# Errors that mean the broker is unreachable rather than that the fan-out is broken
+BROKER_ERRORS = (ConnectionError, pika.exceptions.AMQPConnectionError)
+
+# Namespace for per-recipient message ids
+RECIPIENT_NAMESPACE = uuid.UUID('6f1c2a3e-5b7d-4c1e-9a0f-3d2b8e4c7a15')
+
+
+def recipient_message_id(announcement_id, user_id):
+    return str(uuid.uuid5(RECIPIENT_NAMESPACE, f"announcement:{announcement_id}:user:{user_id}"))
+
+
+def claim_fanout(conn, announcement_id):
+    """Mark the fan-out as running and return it, or None if there is nothing left to do."""
+    cur = conn.cursor(cursor_factory=dict_cursor())
+    try:
+        cur.execute(
+            """
+            UPDATE announcement_fanouts
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'running' END,
+                attempts = attempts + 1,
+                started_at = COALESCE(started_at, CURRENT_TIMESTAMP),
+                updated_at = CURRENT_TIMESTAMP,
+                total_recipients = COALESCE(
+                    total_recipients,
+                    (SELECT count(*) FROM user_groups WHERE group_id = announcement_fanouts.group_id)
+                )
+            WHERE announcement_id = %s AND status IN ('pending', 'running')
+            RETURNING *;
+            """,
+            (MAX_FANOUT_ATTEMPTS, announcement_id)
+        )
+        fanout = cur.fetchone()
+        conn.commit()
+    finally:
+        cur.close()
+
+    if fanout is not None and fanout['status'] == 'failed':
+        logger.error(f"Giving up on fan-out for announcement {announcement_id} after {MAX_FANOUT_ATTEMPTS} attempts")
+        return None
+    return fanout
+
+
+def publish_with_retry(publisher, messages):
+    for attempt in range(1, PUBLISH_ATTEMPTS + 1):
+        try:
+            publisher.publish_batch(messages)
+            return
+        except CircuitOpenError:
+            raise
+        except Exception:
+            if attempt == PUBLISH_ATTEMPTS:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def checkpoint(conn, announcement_id, last_user_id, processed, published, failures):
+    """Record one batch of progress and its failed recipients in a single transaction."""
+    cur = conn.cursor()
+    try:
+        if failures:
+            user_ids, reasons = zip(*failures)
+            cur.execute(
+                """
+                INSERT INTO announcement_fanout_failures (announcement_id, user_id, reason)
+                SELECT %s, user_id, reason FROM unnest(%s::int[], %s::text[]) AS f(user_id, reason)
+                ON CONFLICT (announcement_id, user_id) DO UPDATE SET reason = EXCLUDED.reason;
+                """,
+                (announcement_id, list(user_ids), list(reasons))
+            )
+        cur.execute(
+            """
+            UPDATE announcement_fanouts
+            SET processed = processed + %s,
+                published = published + %s,
+                failed = failed + %s,
+                last_user_id = %s,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE announcement_id = %s;
+            """,
+            (processed, published, len(failures), last_user_id, announcement_id)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def fan_out(conn, stream_conn, publisher, announcement_id, batch_size):
+    """Notify every member of the announcement's group. Returns False if there was nothing to do."""
+    fanout = claim_fanout(conn, announcement_id)
+    if fanout is None:
+        return False
+
+    # Fan-outs queued before templates existed have no parameters
+    template = 'announcement_created' if fanout['template_params'] is not None else None
+
+    # Named cursor: members are streamed from the server batch by batch. It lives on
+    # its own connection because checkpoints commit on ``conn`` after every batch.
+    members = stream_conn.cursor(name=f"announcement_fanout_{announcement_id}")
+    members.itersize = batch_size
+    try:
+        members.execute(
+            """
+            SELECT ug.user_id, u.phone, u.user_name
+            FROM user_groups ug
+            JOIN users u ON u.id = ug.user_id
+            WHERE ug.group_id = %s AND ug.user_id > %s
+            ORDER BY ug.user_id;
+            """,
+            (fanout['group_id'], fanout['last_user_id'])
+        )
+
+        while True:
+            rows = members.fetchmany(batch_size)
+            if not rows:
+                break
+
+            messages, recipients, failures = [], [], []
+            for user_id, phone, user_name in rows:
+                if not phone:
+                    failures.append((user_id, 'no_phone'))
+                    continue
+                extra_info = dict(fanout['extra_info'], phone=phone, user_name=user_name)
+                # Same id and created_at on every replay, so the persister stores each recipient once
+                payload = build_notification(user_id, fanout['message'], 'group', extra_info,
+                                             template, fanout['template_params'], fanout['created_at'])
+                payload['id'] = recipient_message_id(announcement_id, user_id)
+                messages.append(outgoing_message(payload, routing_key_for('group')))
+                recipients.append(user_id)
+
+            published = 0
+            if messages:
+                try:
+                    publish_with_retry(publisher, messages)
+                    published = len(messages)
+                except BROKER_ERRORS:
+                    # Broker down: retry the whole batch later instead of failing every recipient
+                    raise
+                except Exception as e:
+                    logger.error(f"Announcement {announcement_id}: failed to publish {len(messages)} notifications: {str(e)}")
+                    failures.extend((user_id, f"publish_failed: {str(e)}") for user_id in recipients)
+
+            checkpoint(conn, announcement_id, rows[-1][0], len(rows), published, failures)
+    finally:
+        members.close()
+        stream_conn.rollback()
+
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE announcement_fanouts
+        SET status = 'completed', completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP,
+            last_error = NULL, last_error_kind = NULL
+        WHERE announcement_id = %s;
+        """,
+        (announcement_id,)
+    )
+    conn.commit()
+    cur.close()
+    logger.info(f"Announcement {announcement_id} fan-out completed")
+    return True
+
+
+def record_error(conn, announcement_id, error):
+    """Record why an attempt stopped; a broker outage gives back the attempt claim_fanout counted."""
+    conn.rollback()
+    broker_unavailable = isinstance(error, BROKER_ERRORS)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE announcement_fanouts
+        SET last_error = %s,
+            last_error_kind = %s,
+            attempts = CASE WHEN %s THEN GREATEST(attempts - 1, 0) ELSE attempts END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE announcement_id = %s AND status = 'running';
+        """,
+        (str(error), 'broker_unavailable' if broker_unavailable else 'error', broker_unavailable, announcement_id)
+    )
+    conn.commit()
+    cur.close()
+
+
+def run(batch_size, retry_delay):
+    publisher = RabbitMQ(pool_size=1)
+    publisher.configure()
+
+    while True:
+        conn = stream_conn = consumer = None
+        try:
+            conn = connect()
+            stream_conn = connect()
+
+            consumer = pika.BlockingConnection(pika.ConnectionParameters(
+                host=publisher.host,
+                credentials=pika.PlainCredentials(publisher.user, publisher.password),
+                heartbeat=600
+            ))
+            channel = consumer.channel()
+            channel.queue_declare(queue=ANNOUNCEMENT_FANOUT_QUEUE, durable=True)
+            # One announcement at a time: an unacked event is redelivered if this worker dies
+            channel.basic_qos(prefetch_count=1)
+
+            def on_message(ch, method, properties, body):
+                try:
+                    announcement_id = deserialize(body, properties.content_type)['announcement_id']
+                except (ValueError, KeyError, TypeError):
+                    logger.error(f"Dropping malformed fan-out event: {body!r}")
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                    return
+
+                try:
+                    fan_out(conn, stream_conn, publisher, announcement_id, batch_size)
+                except Exception as e:
+                    logger.error(f"Fan-out for announcement {announcement_id} failed: {str(e)}", exc_info=True)
+                    record_error(conn, announcement_id, e)
+                    time.sleep(retry_delay)
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                    return
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+
+            channel.basic_consume(queue=ANNOUNCEMENT_FANOUT_QUEUE, on_message_callback=on_message)
+            logger.info("Announcement fan-out worker started")
+            channel.start_consuming()
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            logger.error(f"Announcement fan-out worker error, restarting: {str(e)}", exc_info=True)
+            time.sleep(retry_delay)
+        finally:
+            if consumer is not None and consumer.is_open:
+                consumer.close()
+            for c in (conn, stream_conn):
+                if c is not None and not c.closed:
+                    c.close()
+
+    publisher.close()
+
+
+def main(argv=None):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(prog="python -m api.workers.announcement_fanout", description=__doc__.split("\n")[0])
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("FANOUT_BATCH_SIZE", "500")))
+    parser.add_argument("--retry-delay", type=float, default=float(os.getenv("FANOUT_RETRY_DELAY", "5")))
+    args = parser.parse_args(argv)
+
+    run(args.batch_size, args.retry_delay)
+
+
+if __name__ == "__main__":
+    main()
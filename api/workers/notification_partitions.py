@@ -0,0 +1,120 @@
+"""Partition maintenance for the notifications table.
+
+Creates the monthly partitions for the coming months and applies retention by
+detaching whole partitions older than the retention window, then dropping them
+(or, with --archive, keeping them as standalone notifications_archive_* tables).
+
+Run with: python -m api.workers.notification_partitions [--interval SECONDS]
+"""
+import os
+import re
+import time
+import logging
+import argparse
+from datetime import date
+from api.database import connect
+
+logger = logging.getLogger(__name__)
+
+# Monthly partitions are named by notifications_create_partition() in api/migrations
+PARTITION_NAME = re.compile(r'^notifications_p(\d{4})_(\d{2})$')
+
+
+def months_before(day, months):
+    """First day of the month ``months`` before the month containing ``day``."""
+    index = day.year * 12 + day.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(conn, months_ahead):
+    cur = conn.cursor()
+    cur.execute("SELECT notifications_ensure_partitions(%s);", (months_ahead,))
+    created = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    for name in created:
+        logger.info(f"Created partition {name}")
+    return created
+
+
+def expire_partitions(conn, retain_months, archive=False, today=None):
+    """Detach (and drop, unless archiving) partitions entirely older than the retention window."""
+    cutoff = months_before(today or date.today(), retain_months)
+
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'notifications'::regclass
+        ORDER BY c.relname;
+        """
+    )
+    partitions = [row[0] for row in cur.fetchall()]
+    conn.commit()
+
+    expired = []
+    for name in partitions:
+        match = PARTITION_NAME.match(name)
+        if not match:
+            # The default partition is never expired
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if months_before(month, -1) > cutoff:
+            continue
+
+        # One short transaction per partition: DETACH takes an exclusive lock on the parent
+        try:
+            cur.execute(f'ALTER TABLE notifications DETACH PARTITION "{name}";')
+            if archive:
+                cur.execute(f'ALTER TABLE "{name}" RENAME TO "{name.replace("notifications_p", "notifications_archive_", 1)}";')
+            else:
+                cur.execute(f'DROP TABLE "{name}";')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"{'Archived' if archive else 'Dropped'} partition {name}")
+        expired.append(name)
+
+    cur.close()
+    return expired
+
+
+def maintain(months_ahead, retain_months, archive):
+    conn = connect()
+    try:
+        ensure_partitions(conn, months_ahead)
+        if retain_months is not None:
+            expire_partitions(conn, retain_months, archive)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(message)s', level=logging.INFO)
+
+    retain = os.getenv("NOTIFICATIONS_RETAIN_MONTHS")
+    parser = argparse.ArgumentParser(prog="python -m api.workers.notification_partitions", description=__doc__.split("\n")[0])
+    parser.add_argument("--months-ahead", type=int, default=int(os.getenv("NOTIFICATIONS_PARTITIONS_AHEAD", "3")))
+    parser.add_argument("--retain-months", type=int, default=int(retain) if retain else None,
+                        help="Keep this many whole months before the current one; omit to keep everything")
+    parser.add_argument("--archive", action="store_true", help="Keep expired partitions as standalone tables instead of dropping them")
+    parser.add_argument("--interval", type=float, help="Run every INTERVAL seconds instead of once")
+    args = parser.parse_args(argv)
+
+    while True:
+        try:
+            maintain(args.months_ahead, args.retain_months, args.archive)
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {str(e)}", exc_info=True)
+            if args.interval is None:
+                raise
+        if args.interval is None:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
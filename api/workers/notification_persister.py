@@ -0,0 +1,176 @@
+"""Consumer that stores every published notification in the notifications table.
+
+Messages are read from notification_persistence_queue, which is bound to the
+same routing keys as the wa-bot's lane queues, and written in micro-batches
+with one multi-row INSERT. A batch is acknowledged (a single multiple=True
+ack) only after its transaction commits; redelivered messages are skipped by
+the unique index on (message_id, created_at), both of which come from the message.
+
+Run with: python -m api.workers.notification_persister
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+import pika
+from psycopg2.extras import execute_values
+from api.database import connect
+from api.services.rabbitmq import RabbitMQ, NOTIFICATION_PERSISTENCE_QUEUE
+from api.services.serialization import deserialize
+from api.services.notification_templates import render
+
+logger = logging.getLogger(__name__)
+
+
+def to_row(properties, body):
+    """Turn one message into a notifications row, or None if it can't be stored."""
+    try:
+        notification = deserialize(body, properties.content_type)
+        message_id = properties.message_id or notification['id']
+        extra_info = notification.get('extra_info')
+        # Template messages are stored rendered
+        message = notification.get('message')
+        if message is None:
+            message = render(notification['template'], notification['params'])
+        return (
+            message_id,
+            message,
+            int(notification['user_id']),
+            notification['type'],
+            json.dumps(extra_info) if extra_info is not None else None,
+            notification.get('created_at')
+        )
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None
+
+
+def persist(conn, rows):
+    """Insert a batch in one statement. Returns the number of new notifications."""
+    cur = conn.cursor()
+    try:
+        execute_values(
+            cur,
+            """
+            INSERT INTO notifications (message_id, message, user_id, status, type, extra_info, created_at)
+            SELECT v.message_id::uuid, v.message, v.user_id, 'pending', v.type, v.extra_info::jsonb,
+                   COALESCE(v.created_at::timestamp, CURRENT_TIMESTAMP)
+            FROM (VALUES %s) AS v(message_id, message, user_id, type, extra_info, created_at)
+            -- Users deleted since the message was published would fail the whole batch
+            JOIN users u ON u.id = v.user_id
+            ON CONFLICT (message_id, created_at) DO NOTHING;
+            """,
+            rows,
+            page_size=len(rows)
+        )
+        inserted = cur.rowcount
+        conn.commit()
+        return inserted
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def consume(params, batch_size, prefetch, flush_interval):
+    """Consume until the broker or database connection fails."""
+    conn = connect()
+    connection = pika.BlockingConnection(params)
+    try:
+        channel = connection.channel()
+        channel.queue_declare(queue=NOTIFICATION_PERSISTENCE_QUEUE, durable=True)
+        channel.basic_qos(prefetch_count=prefetch)
+
+        rows = []
+        last_tag = None
+        deadline = None
+        # inactivity_timeout yields (None, None, None) when the queue goes quiet,
+        # so a partial batch is never held longer than flush_interval
+        for method, properties, body in channel.consume(NOTIFICATION_PERSISTENCE_QUEUE, inactivity_timeout=flush_interval):
+            if method is not None:
+                row = to_row(properties, body)
+                if row is None:
+                    logger.error(f"Dropping malformed notification message: {body!r}")
+                    channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                    continue
+                if not rows:
+                    deadline = time.monotonic() + flush_interval
+                rows.append(row)
+                last_tag = method.delivery_tag
+
+            if rows and (len(rows) >= batch_size or method is None or time.monotonic() >= deadline):
+                try:
+                    inserted = persist(conn, rows)
+                except Exception:
+                    channel.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+                    raise
+                channel.basic_ack(delivery_tag=last_tag, multiple=True)
+                logger.info(f"Persisted {inserted} notifications ({len(rows) - inserted} duplicates or orphans skipped)")
+                rows = []
+    finally:
+        if connection.is_open:
+            connection.close()
+        if not conn.closed:
+            conn.close()
+
+
+def worker(params, batch_size, prefetch, flush_interval, retry_delay):
+    while True:
+        try:
+            consume(params, batch_size, prefetch, flush_interval)
+        except Exception as e:
+            logger.error(f"Notification persister error, restarting: {str(e)}", exc_info=True)
+            time.sleep(retry_delay)
+
+
+def run(concurrency, batch_size, prefetch, flush_interval, retry_delay):
+    settings = RabbitMQ()
+    settings.configure()
+    params = pika.ConnectionParameters(
+        host=settings.host,
+        credentials=pika.PlainCredentials(settings.user, settings.password),
+        heartbeat=600
+    )
+
+    # pika connections aren't thread-safe: every worker has its own broker and database connection
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(params, batch_size, prefetch, flush_interval, retry_delay),
+            name=f"notification-persister-{i}",
+            daemon=True
+        )
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info(f"Notification persister started with {concurrency} workers")
+
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(prog="python -m api.workers.notification_persister", description=__doc__.split("\n")[0])
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("PERSISTER_CONCURRENCY", "2")))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("PERSISTER_BATCH_SIZE", "200")))
+    parser.add_argument("--prefetch", type=int, default=int(os.getenv("PERSISTER_PREFETCH", "500")))
+    parser.add_argument("--flush-interval", type=float, default=float(os.getenv("PERSISTER_FLUSH_INTERVAL", "1")))
+    parser.add_argument("--retry-delay", type=float, default=float(os.getenv("PERSISTER_RETRY_DELAY", "5")))
+    args = parser.parse_args(argv)
+
+    if args.prefetch < args.batch_size:
+        parser.error("--prefetch must be at least --batch-size, or batches can never fill")
+
+    run(args.concurrency, args.batch_size, args.prefetch, args.flush_interval, args.retry_delay)
+
+
+if __name__ == "__main__":
+    main()
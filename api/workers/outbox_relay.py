@@ -0,0 +1,130 @@
+"""Relay that drains notification_outbox into RabbitMQ.
+
+Rows are claimed with FOR UPDATE SKIP LOCKED, so any number of relays can
+run side by side without publishing the same row twice. Each batch is
+published with a single broker acknowledgement and deleted in the same
+database transaction that claimed it.
+
+Run with: python -m api.workers.outbox_relay
+"""
+import os
+import time
+import select
+import logging
+import argparse
+from api.database import connect
+from api.services.rabbitmq import RabbitMQ, outgoing_message
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 300
+
+
+def relay_batch(conn, publisher, batch_size):
+    """Publish up to ``batch_size`` outbox rows. Returns the number of rows published."""
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            SELECT id, message_id, exchange, routing_key, payload
+            FROM notification_outbox
+            WHERE available_at <= CURRENT_TIMESTAMP
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED;
+            """,
+            (batch_size,)
+        )
+        rows = cur.fetchall()
+        if not rows:
+            conn.commit()
+            return 0
+
+        ids = [row[0] for row in rows]
+        # Payloads are stored as JSONB and serialized in the configured wire format here
+        messages = [
+            outgoing_message(payload, routing_key, exchange)
+            for _, message_id, exchange, routing_key, payload in rows
+        ]
+
+        try:
+            publisher.publish_batch(messages)
+        except Exception as e:
+            logger.error(f"Failed to publish {len(rows)} outbox rows: {str(e)}")
+            # Back off exponentially per row so a broker outage doesn't spin the relay
+            cur.execute(
+                """
+                UPDATE notification_outbox
+                SET attempts = attempts + 1,
+                    last_error = %s,
+                    available_at = CURRENT_TIMESTAMP + LEAST(POWER(2, attempts), %s) * INTERVAL '1 second'
+                WHERE id = ANY(%s);
+                """,
+                (str(e), MAX_BACKOFF_SECONDS, ids)
+            )
+            conn.commit()
+            return 0
+
+        cur.execute("DELETE FROM notification_outbox WHERE id = ANY(%s);", (ids,))
+        conn.commit()
+        logger.info(f"Relayed {len(rows)} notifications")
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def wait_for_rows(conn, timeout):
+    """Block until an INSERT is committed into the outbox or ``timeout`` elapses."""
+    if select.select([conn], [], [], timeout) != ([], [], []):
+        conn.poll()
+        conn.notifies.clear()
+
+
+def run(batch_size, poll_interval):
+    # Single-threaded, so one pooled connection is enough
+    publisher = RabbitMQ(pool_size=1)
+    publisher.configure()
+
+    while True:
+        conn = None
+        try:
+            conn = connect()
+            cur = conn.cursor()
+            cur.execute("LISTEN notification_outbox;")
+            conn.commit()
+            cur.close()
+            logger.info("Outbox relay started")
+
+            while True:
+                published = relay_batch(conn, publisher, batch_size)
+                if published < batch_size:
+                    # Caught up (or backing off): sleep until new rows are committed
+                    wait_for_rows(conn, poll_interval)
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            logger.error(f"Outbox relay error, restarting: {str(e)}", exc_info=True)
+            time.sleep(poll_interval)
+        finally:
+            if conn is not None and not conn.closed:
+                conn.close()
+
+    publisher.close()
+
+
+def main(argv=None):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(prog="python -m api.workers.outbox_relay", description=__doc__.split("\n")[0])
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("OUTBOX_BATCH_SIZE", "200")))
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("OUTBOX_POLL_INTERVAL", "5")))
+    args = parser.parse_args(argv)
+
+    run(args.batch_size, args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Reconciliation job for the maintained unread-announcement counters.
+
+Triggers on user_groups, announcements and announcement_reads keep
+group_unread_counts current. This job recomputes the counters from scratch,
+a batch of groups per transaction, repairs any that drifted, adds missing
+ones and deletes those left without a membership.
+
+Run with: python -m api.workers.unread_counters [--interval SECONDS]
+"""
+import os
+import time
+import logging
+import argparse
+from api.database import connect
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock namespace the counter triggers lock groups in (migration 0013)
+GROUP_LOCK_SPACE = 8412
+
+
+def reconcile_groups(conn, group_ids):
+    """Repair the counters of ``group_ids`` in one transaction. Returns how many rows changed."""
+    cur = conn.cursor()
+    try:
+        # Wait out membership and announcement changes in these groups, as the
+        # triggers do, so none lands between the recount and the repair
+        cur.execute(
+            "SELECT pg_advisory_xact_lock(%s, group_id) FROM unnest(%s::int[]) AS group_id ORDER BY group_id;",
+            (GROUP_LOCK_SPACE, sorted(set(group_ids)))
+        )
+        # Lock the existing counters too: trigger updates from concurrent
+        # reads wait, then apply on top of the recomputed value instead of
+        # being overwritten by it
+        cur.execute(
+            "SELECT 1 FROM group_unread_counts WHERE group_id = ANY(%s) FOR UPDATE;",
+            (group_ids,)
+        )
+        cur.execute(
+            """
+            WITH actual AS (
+                SELECT ug.user_id, ug.group_id, COUNT(a.id) FILTER (WHERE ar.user_id IS NULL) AS unread_count
+                FROM user_groups ug
+                LEFT JOIN announcements a ON a.group_id = ug.group_id
+                LEFT JOIN announcement_reads ar ON ar.announcement_id = a.id AND ar.user_id = ug.user_id
+                WHERE ug.group_id = ANY(%(group_ids)s)
+                GROUP BY ug.user_id, ug.group_id
+            ),
+            repaired AS (
+                INSERT INTO group_unread_counts (user_id, group_id, unread_count)
+                SELECT user_id, group_id, unread_count FROM actual
+                ON CONFLICT (user_id, group_id) DO UPDATE SET unread_count = EXCLUDED.unread_count
+                WHERE group_unread_counts.unread_count <> EXCLUDED.unread_count
+                RETURNING 1
+            ),
+            orphaned AS (
+                DELETE FROM group_unread_counts c
+                WHERE c.group_id = ANY(%(group_ids)s)
+                AND NOT EXISTS (
+                    SELECT 1 FROM user_groups ug
+                    WHERE ug.user_id = c.user_id AND ug.group_id = c.group_id
+                )
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM repaired) + (SELECT COUNT(*) FROM orphaned);
+            """,
+            {"group_ids": group_ids}
+        )
+        changed = cur.fetchone()[0]
+        conn.commit()
+        return changed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def reconcile(conn, batch_size):
+    """Walk every group in id order, ``batch_size`` groups per transaction."""
+    cur = conn.cursor()
+    last_id = 0
+    groups = 0
+    changed = 0
+    try:
+        while True:
+            cur.execute(
+                "SELECT id FROM groups WHERE id > %s ORDER BY id LIMIT %s;",
+                (last_id, batch_size)
+            )
+            group_ids = [row[0] for row in cur.fetchall()]
+            conn.commit()
+            if not group_ids:
+                break
+            changed += reconcile_groups(conn, group_ids)
+            groups += len(group_ids)
+            last_id = group_ids[-1]
+    finally:
+        cur.close()
+
+    if changed:
+        logger.warning(f"Repaired {changed} unread counters across {groups} groups")
+    else:
+        logger.info(f"Unread counters consistent across {groups} groups")
+    return changed
+
+
+def main(argv=None):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(prog="python -m api.workers.unread_counters", description=__doc__.split("\n")[0])
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("UNREAD_RECONCILE_BATCH_SIZE", "100")),
+                        help="Groups recomputed per transaction")
+    parser.add_argument("--interval", type=float, help="Run every INTERVAL seconds instead of once")
+    args = parser.parse_args(argv)
+
+    while True:
+        try:
+            conn = connect()
+            try:
+                reconcile(conn, args.batch_size)
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"Unread counter reconciliation failed: {str(e)}", exc_info=True)
+            if args.interval is None:
+                raise
+        if args.interval is None:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
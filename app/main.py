@@ -1,7 +1,7 @@
 import logging
 import streamlit as st
 from dotenv import load_dotenv
-from app.model.db_connection import get_db_connection
+from app.model.db_connection import db_connection
 from app.views.dashboard import display_dashboard
 
 logging.basicConfig(
@@ -10,7 +10,6 @@ logging.basicConfig(
 )
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
 load_dotenv('.env', override=True)
 
 @st.cache_resource
@@ -25,10 +24,11 @@ if "authenticated" not in st.session_state:
     st.session_state.email = state["email"]
 
 def authenticate_user(username, password) -> bool:
-    cur = conn.cursor()
-    
-    cur.execute("SELECT id, email, user_name, user_role FROM users WHERE email = %s AND password = %s", (username.lower(), password.lower()))
-    user = cur.fetchone()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, email, user_name, user_role FROM users WHERE email = %s AND password = %s", (username.lower(), password.lower()))
+        user = cur.fetchone()
+        cur.close()
     if user:
         logger.info(f"User: '{username}' authenticated")
         user_id, user_email, user_name, user_role = user
@@ -62,6 +62,5 @@ else:
         st.session_state.user_id,
         st.session_state.email,
         st.session_state.user_name,
-        st.session_state.user_role,
-        conn
+        st.session_state.user_role
     )
@@ -1,5 +1,12 @@
 import os
+import logging
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import pool
+import streamlit as st
+
+logger = logging.getLogger(__name__)
 
 
 def get_db_connection():
@@ -14,3 +21,89 @@ def get_db_connection():
         host=DB_HOST,
         port=DB_PORT
     )
+
+
+class BoundedConnectionPool:
+    """Connection pool shared by every Streamlit session.
+
+    A semaphore caps concurrent checkouts at ``maxconn`` so extra sessions wait
+    for a connection instead of failing with PoolError.
+    """
+
+    def __init__(self, minconn, maxconn, timeout):
+        self.timeout = timeout
+        self._pool = pool.ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            dbname='postgres',
+            user=os.getenv("POSTGRES_USER"),
+            password=os.getenv("POSTGRES_PASSWORD"),
+            host=os.getenv("POSTGRES_HOST"),
+            port="5432"
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise pool.PoolError("Timed out waiting for a database connection")
+        try:
+            conn = self._pool.getconn()
+            if not self._is_alive(conn):
+                # Drop the broken connection and open a fresh one in its slot
+                logger.warning("Discarding broken database connection")
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _is_alive(conn):
+        if conn.closed:
+            return False
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+@st.cache_resource
+def get_connection_pool():
+    """Create the pool once per Streamlit server process."""
+    return BoundedConnectionPool(
+        minconn=int(os.getenv("DB_POOL_MIN", "1")),
+        maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    )
+
+
+@contextmanager
+def db_connection():
+    """Check out a short-lived connection, committing on success and rolling back on error."""
+    connection_pool = get_connection_pool()
+    conn = connection_pool.getconn()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except Exception as e:
+        broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        raise
+    finally:
+        connection_pool.putconn(conn, close=broken)
@@ -1,6 +1,8 @@
 from app.model.db_connection import get_db_connection
 
 def create_tables():
+    # Deprecated: the schema is now managed by versioned migrations in api/migrations
+    # (python -m api.migrations upgrade). Kept for local setups that still call it.
     conn = get_db_connection()
     cur = conn.cursor()
     
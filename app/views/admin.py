@@ -1,9 +1,10 @@
 import logging
 import streamlit as st
+from app.model.db_connection import db_connection
 
 logger = logging.getLogger(__name__)
 
-def admin_dashboard(user_id, user_email, conn):
+def admin_dashboard(user_id, user_email):
     with st.sidebar:
         st.header("Admin Menu")
         open_tickets = st.button("📂 Tickets Abiertos", key="open_tickets")
@@ -13,23 +14,21 @@ def admin_dashboard(user_id, user_email, conn):
 
     # Handle button clicks and display the corresponding tickets
     if open_tickets:
-        display_tickets(conn, user_id, status="open", header_message="Tickets Abiertos sin asignar")
+        display_tickets(user_id, status="open", header_message="Tickets Abiertos sin asignar")
     elif assigned_not_closed:
-        display_tickets(conn, user_id, assigned_to=user_id, status="open", header_message=f"Tickets Asignados a {user_email}")
+        display_tickets(user_id, assigned_to=user_id, status="open", header_message=f"Tickets Asignados a {user_email}")
     elif assigned_closed:
-        display_tickets(conn, user_id, assigned_to=user_id, status="closed", header_message=f"Historial de tickets cerrados por {user_email}")
+        display_tickets(user_id, assigned_to=user_id, status="closed", header_message=f"Historial de tickets cerrados por {user_email}")
     elif graphs:
         display_graphs()
     else:
         # Default: Show open tickets when no button is clicked initially
-        display_tickets(conn, user_id, status="open", header_message="Tickets Abiertos sin asignar")
+        display_tickets(user_id, status="open", header_message="Tickets Abiertos sin asignar")
 
 
-def display_tickets(conn, user_id, header_message="", assigned_to=None, status=None):
+def display_tickets(user_id, header_message="", assigned_to=None, status=None):
     logger.info(f"Showin tickets with status: {status}, assigned_to {assigned_to}")
     """Fetch and display tickets based on the selected menu option"""
-    cur = conn.cursor()
-
     query = """
         SELECT id, category, description, created_at, status, assign_id
         FROM tickets WHERE 1=1
@@ -47,8 +46,11 @@ def display_tickets(conn, user_id, header_message="", assigned_to=None, status=N
 
     query += " ORDER BY created_at DESC"
 
-    cur.execute(query, tuple(params))
-    tickets = cur.fetchall()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, tuple(params))
+        tickets = cur.fetchall()
+        cur.close()
 
     st.subheader(f"{header_message}")
 
@@ -64,33 +66,31 @@ def display_tickets(conn, user_id, header_message="", assigned_to=None, status=N
                     assign_button = st.button("➕ Asignar", key=f"assign_{ticket_id}")
                     if assign_button:
                         logger.info(f"Assigning ticket {ticket_id} to user {user_id}")
-                        #assign_ticket(conn, ticket_id, user_id)
+                        #assign_ticket(ticket_id, user_id)
                 else:
                     closed_button = st.button("✔️ Cerrar", key=f"close_{ticket_id}")
                     if closed_button:
                         logger.info(f"Closing ticket {ticket_id}")
-                        #close_ticket(conn, ticket_id)
-
-    cur.close()
+                        #close_ticket(ticket_id)
 
-def close_ticket(conn, ticket_id):
+def close_ticket(ticket_id):
     logger.info(f"Closing ticket {ticket_id}")
     query = "UPDATE tickets SET status = 'closed' WHERE id = %s"
     params = (ticket_id,)
-    cur = conn.cursor()
-    cur.execute(query, params)
-    conn.commit()
-    cur.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        cur.close()
     st.rerun()
 
-def assign_ticket(conn, ticket_id, user_id):
+def assign_ticket(ticket_id, user_id):
     logger.info(f"Assigning ticket {ticket_id} to user {user_id}")
     query = "UPDATE tickets SET assign_id = %s WHERE id = %s"
     params = (user_id, ticket_id)
-    cur = conn.cursor()
-    cur.execute(query, params)
-    conn.commit()
-    cur.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        cur.close()
     st.rerun()
 
 def display_graphs():
@@ -6,11 +6,11 @@ from app.views.user import user_dashboard
 
 logger = logging.getLogger(__name__)
 
-def display_dashboard(user_id, user_email, user_name, user_role, conn):
+def display_dashboard(user_id, user_email, user_name, user_role):
     logger.info(f"Displaying dashboard for {user_email} with role {user_role}")
     if user_role == "user":
-        user_dashboard(user_id, user_name, conn)
+        user_dashboard(user_id, user_name)
     elif user_role == "admin":
-        admin_dashboard(user_id, user_email, conn)
+        admin_dashboard(user_id, user_email)
     else:
         st.error("Invalid user role")
@@ -2,6 +2,7 @@ import time
 import logging
 import streamlit as st
 import uuid
+from app.model.db_connection import db_connection
 
 logger = logging.getLogger(__name__)
 
@@ -16,27 +17,26 @@ def generate_ticket_id():
     """Generates a unique 5-character ticket ID from a UUID."""
     return str(uuid.uuid4()).replace("-", "")[:5]
 
-def save_ticket_to_db(ticket_id, category, description, user_id, conn):
+def save_ticket_to_db(ticket_id, category, description, user_id):
     """Inserts a new ticket into the database."""
     try:
-        cur = conn.cursor()
         insert_query = """
         INSERT INTO tickets (id, category, description, user_id, created_at)
         VALUES (%s, %s, %s, %s, NOW())
         """
-        cur.execute(insert_query, (ticket_id, category, description, user_id))
-        conn.commit()
-        cur.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(insert_query, (ticket_id, category, description, user_id))
+            cur.close()
         logger.info(f"Ticket {ticket_id} created successfully for user {user_id}")
         return True
     except Exception as e:
         logger.error(f"Error inserting ticket: {e}")
         return False
 
-def get_user_tickets(user_id, status, conn, offset=0, limit=100):
+def get_user_tickets(user_id, status, offset=0, limit=100):
     """Fetches user tickets ordered by creation timestamp (DESC) with pagination."""
     try:
-        cur = conn.cursor()
         query = """
         SELECT id, category, description, created_at 
         FROM tickets 
@@ -44,28 +44,31 @@ def get_user_tickets(user_id, status, conn, offset=0, limit=100):
         ORDER BY created_at DESC 
         LIMIT %s OFFSET %s
         """
-        cur.execute(query, (user_id, status, limit, offset))
-        tickets = cur.fetchall()
-        cur.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, (user_id, status, limit, offset))
+            tickets = cur.fetchall()
+            cur.close()
         return tickets
     except Exception as e:
         logger.error(f"Error fetching tickets: {e}")
         return []
 
-def count_user_tickets(user_id, conn):
+def count_user_tickets(user_id):
     """Counts the total number of tickets for a user."""
     try:
-        cur = conn.cursor()
         query = "SELECT COUNT(*) FROM tickets WHERE user_id = %s"
-        cur.execute(query, (user_id,))
-        count = cur.fetchone()[0]
-        cur.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, (user_id,))
+            count = cur.fetchone()[0]
+            cur.close()
         return count
     except Exception as e:
         logger.error(f"Error counting tickets: {e}")
         return 0
 
-def user_dashboard(user_id, user_name, conn):
+def user_dashboard(user_id, user_name):
     logger.info(f"User webpage display")
     
     st.title(f"Bienvenido, {user_name}")
@@ -84,15 +87,15 @@ def user_dashboard(user_id, user_name, conn):
 
     # Display content based on active page
     if st.session_state["page"] == "create_ticket":
-        create_ticket(user_id, conn)
+        create_ticket(user_id)
     elif st.session_state["page"] == "open_tickets":
-        display_tickets_user(user_id=user_id, status="open", conn=conn)
+        display_tickets_user(user_id=user_id, status="open")
     elif st.session_state["page"] == "closed":
-        display_tickets_user(user_id=user_id, status="closed", conn=conn)
+        display_tickets_user(user_id=user_id, status="closed")
 
-def display_tickets_user(user_id, status, conn):
+def display_tickets_user(user_id, status):
     # Pagination setup
-    user_tickets = get_user_tickets(user_id, status, conn)
+    user_tickets = get_user_tickets(user_id, status)
 
     # **Display Tickets Timeline**
     st.subheader("Tus Tickets")
@@ -105,7 +108,7 @@ def display_tickets_user(user_id, status, conn):
     else:
         st.write("Ningun ticket para mostrar")
 
-def create_ticket(user_id, conn):
+def create_ticket(user_id):
     # **Ticket Creation Form**
     st.subheader("Crear nuevo ticket")
     ticket_description = st.text_area("Descripción", "", placeholder="Escribe los detalles de tu problema o solicitud aquí...")
@@ -117,7 +120,7 @@ def create_ticket(user_id, conn):
         ticket_id = generate_ticket_id()
         with st.spinner('Creando ticket...'):
             time.sleep(2)
-        if save_ticket_to_db(ticket_id, ticket_category, ticket_description, user_id, conn):
+        if save_ticket_to_db(ticket_id, ticket_category, ticket_description, user_id):
             st.success(f"✅ Tu ticket ({ticket_id}) se creó con éxito.")
             time.sleep(1)
             st.session_state.current_page = 1  # Reset pagination to show the new ticket
@@ -10,6 +10,49 @@ def hash_password(password):
     hash_obj = hashlib.sha256(salt + password.encode('utf-8'))
     return base64.b64encode(salt + hash_obj.digest()).decode('utf-8')
 
+# Notification priority lanes: queue name -> routing keys bound to it.
+# Must match NOTIFICATION_LANES in api/services/rabbitmq.py.
+NOTIFICATION_LANES = {
+    # Interactive: one-off messages about a user's own tickets. 'user.notification'
+    # is the legacy key every type used to share.
+    'notification_queue': ['notification.assignment', 'notification.ticket', 'notification.comment', 'user.notification'],
+    # Bulk: announcement fan-out, consumed separately so it can't starve the interactive lane
+    'notification_bulk_queue': ['notification.group'],
+}
+
+# Gets a copy of every notification so api.workers.notification_persister can store
+# them without competing with the wa-bot for deliveries
+PERSISTENCE_QUEUE = 'notification_persistence_queue'
+
+def add_notification_lanes(template_data):
+    queues = template_data.setdefault('queues', [])
+    bindings = template_data.setdefault('bindings', [])
+    declared = {queue['name'] for queue in queues}
+    bound = {(binding['destination'], binding['routing_key']) for binding in bindings}
+
+    queue_keys = dict(NOTIFICATION_LANES)
+    queue_keys[PERSISTENCE_QUEUE] = [key for keys in NOTIFICATION_LANES.values() for key in keys]
+
+    for queue_name, routing_keys in queue_keys.items():
+        if queue_name not in declared:
+            queues.append({
+                "name": queue_name,
+                "vhost": "/",
+                "durable": True,
+                "auto_delete": False,
+                "arguments": {}
+            })
+        for routing_key in routing_keys:
+            if (queue_name, routing_key) not in bound:
+                bindings.append({
+                    "source": "notifications",
+                    "vhost": "/",
+                    "destination": queue_name,
+                    "destination_type": "queue",
+                    "routing_key": routing_key,
+                    "arguments": {}
+                })
+
 def generate_config():
     # Get environment variables or use defaults
     rabbitmq_user = os.environ.get('RABBITMQ_USER')
@@ -34,6 +77,9 @@ def generate_config():
         if permission.get('user') == '{{RABBITMQ_USER}}':
             permission['user'] = rabbitmq_user
     
+    # Declare the notification lane queues and their bindings
+    add_notification_lanes(template_data)
+    
     # Write output to the correct location
     with open('/etc/rabbitmq/definitions.json', 'w') as f:
         json.dump(template_data, f, indent=2)
@@ -24,7 +24,7 @@ const generateTicketId = () => {
 // Fetch open tickets for a user
 export const fetchUserTickets = async (userId) => {
   try {
-    const response = await axios.get(`/tickets_user_open/${userId}`);
+    const response = await axios.get(`/tickets_user_open/${userId}?paginate=false`);
     return response.data;
   } catch (error) {
     console.error('Error fetching open tickets:', error);
@@ -35,7 +35,7 @@ export const fetchUserTickets = async (userId) => {
 // Fetch closed tickets for a user
 export const fetchClosedTickets = async (userId) => {
   try {
-    const response = await axios.get(`/tickets_user_closed/${userId}`);
+    const response = await axios.get(`/tickets_user_closed/${userId}?paginate=false`);
     return response.data;
   } catch (error) {
     console.error('Error fetching closed tickets:', error);
@@ -19,7 +19,7 @@ function AdminDashboard({ user }) {
       setLoading(true);
       setActiveTab('assigned_open');
       setSelectedTicketId(null);
-      const response = await axios.get(`/tickets_assign_open/${user.id}`);
+      const response = await axios.get(`/tickets_assign_open/${user.id}?paginate=false`);
       setTickets(response.data);
       setError('');
     } catch (err) {
@@ -34,7 +34,7 @@ function AdminDashboard({ user }) {
       setLoading(true);
       setActiveTab('assigned_closed');
       setSelectedTicketId(null);
-      const response = await axios.get(`/tickets_assign_closed/${user.id}`);
+      const response = await axios.get(`/tickets_assign_closed/${user.id}?paginate=false`);
       setTickets(response.data);
       setError('');
     } catch (err) {
@@ -49,7 +49,7 @@ function AdminDashboard({ user }) {
       setLoading(true);
       setActiveTab('unassigned');
       setSelectedTicketId(null);
-      const response = await axios.get('/tickets_not_assigned_open');
+      const response = await axios.get('/tickets_not_assigned_open?paginate=false');
       setTickets(response.data);
       setError('');
     } catch (err) {
@@ -40,7 +40,7 @@ function SuperUserDashboard({ user }) {
       setLoading(true);
       setActiveTab('all_open');
       setSelectedTicketId(null);
-      const response = await axios.get('/all_open_tickets');
+      const response = await axios.get('/all_open_tickets?paginate=false');
       setTickets(response.data);
       setError('');
       
@@ -65,7 +65,7 @@ function SuperUserDashboard({ user }) {
       setLoading(true);
       setActiveTab('all_closed');
       setSelectedTicketId(null);
-      const response = await axios.get('/all_closed_tickets');
+      const response = await axios.get('/all_closed_tickets?paginate=false');
       setTickets(response.data);
       setError('');
       
@@ -90,7 +90,7 @@ function SuperUserDashboard({ user }) {
       setLoading(true);
       setActiveTab('unassigned');
       setSelectedTicketId(null);
-      const response = await axios.get('/tickets_not_assigned_open');
+      const response = await axios.get('/tickets_not_assigned_open?paginate=false');
       setTickets(response.data);
       setError('');
       
@@ -53,7 +53,7 @@ function TeacherDashboard({ user }) {
       setSelectedGroupId(null);
       setSelectedTicketId(null);
       
-      const response = await axios.get(`/tickets_user_open/${user.id}`);
+      const response = await axios.get(`/tickets_user_open/${user.id}?paginate=false`);
       setTickets(response.data);
       setError('');
     } catch (err) {
@@ -70,7 +70,7 @@ function TeacherDashboard({ user }) {
       setSelectedGroupId(null);
       setSelectedTicketId(null);
       
-      const response = await axios.get(`/tickets_user_closed/${user.id}`);
+      const response = await axios.get(`/tickets_user_closed/${user.id}?paginate=false`);
       setTickets(response.data);
       setError('');
     } catch (err) {
@@ -1,4 +1,27 @@
 const amqp = require('amqplib');
+const { decode } = require('@msgpack/msgpack');
+const { renderTemplate } = require('./templates');
+
+// Notification lanes declared by rabbitmq/generate-config.py: interactive first, then bulk
+const NOTIFICATION_QUEUES = ['notification_queue', 'notification_bulk_queue'];
+
+const MSGPACK = 'application/msgpack';
+
+/**
+ * Decodes a message body by its content type (JSON unless it says msgpack)
+ * and renders template messages
+ * @param {Object} msg - The amqplib message
+ * @returns {Object} - The notification
+ */
+const decodeNotification = (msg) => {
+  const notification = msg.properties.contentType === MSGPACK
+    ? decode(msg.content)
+    : JSON.parse(msg.content.toString());
+  if (!notification.message && notification.template) {
+    notification.message = renderTemplate(notification.template, notification.params);
+  }
+  return notification;
+};
 
 /**
  * Starts a RabbitMQ consumer that processes WhatsApp notification messages
@@ -15,32 +38,22 @@ const startNotificationConsumer = async (sock, mongoClient) => {
     
     // Connect to RabbitMQ
     const connection = await amqp.connect(rabbitMQUrl);
-    const channel = await connection.createChannel();
-    
-    // Make sure the queue exists
-    await channel.assertQueue('notification_queue', { durable: true });
-    
-    console.log('Connected to RabbitMQ, waiting for notification messages...');
     
     // Get MongoDB collection for audit logs
     const db = mongoClient.db('wa-bot');
     const notificationsCollection = db.collection('notifications');
     
-    // Set prefetch to 1 to ensure we process one message at a time
-    channel.prefetch(1);
-    
-    // Consume messages
-    channel.consume('notification_queue', async (msg) => {
+    const handleMessage = async (channel, msg) => {
       if (msg !== null) {
         const notificationRecord = {
-          raw_message: msg.content.toString(),
+          raw_message: msg.properties.contentType === MSGPACK ? msg.content.toString('base64') : msg.content.toString(),
           timestamp: new Date(),
           status: 'processing',
           acknowledged: false
         };
         
         try {
-          const notification = JSON.parse(msg.content.toString());
+          const notification = decodeNotification(msg);
           console.log('Received notification message:', notification);
           notificationRecord.parsed_message = notification;
           
@@ -122,7 +135,24 @@ const startNotificationConsumer = async (sock, mongoClient) => {
           }
         }
       }
-    }, { noAck: false }); // Explicit acknowledgment mode
+    };
+    
+    // One channel per lane, each with prefetch 1: a backlog of bulk announcement
+    // messages only ever holds one delivery, so interactive ones keep flowing
+    const channels = [];
+    for (const queue of NOTIFICATION_QUEUES) {
+      const channel = await connection.createChannel();
+      
+      // Make sure the queue exists
+      await channel.assertQueue(queue, { durable: true });
+      channel.prefetch(1);
+      
+      // Consume messages
+      channel.consume(queue, (msg) => handleMessage(channel, msg), { noAck: false }); // Explicit acknowledgment mode
+      channels.push(channel);
+    }
+    
+    console.log('Connected to RabbitMQ, waiting for notification messages...');
     
     // Handle connection close events
     connection.on('close', async () => {
@@ -137,7 +167,7 @@ const startNotificationConsumer = async (sock, mongoClient) => {
       console.error('RabbitMQ connection error:', err);
     });
     
-    return { connection, channel };
+    return { connection, channel: channels[0], channels };
   } catch (error) {
     console.error('Failed to start notification consumer:', error);
     // Wait before retry
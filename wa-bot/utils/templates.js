@@ -0,0 +1,27 @@
+/**
+ * Notification templates, mirrored from api/services/notification_templates.py.
+ * Messages published with NOTIFICATION_TEMPLATES enabled carry a template id
+ * and params instead of the rendered text.
+ */
+const TEMPLATES = {
+  ticket_assigned: 'Tu ticket #{ticket_id} ha sido asignado a {agent_name}\n {comment}',
+  ticket_closed: 'Ticket #{ticket_id} ({category}/{sub_category}) se cerro.',
+  comment_added: 'Nuevo comentario en tu ticket #{ticket_id}: {author_name} \n{content}',
+  announcement_created: 'Nuevo anuncio en {group_name}:\n\n{title}\n {excerpt}...'
+};
+
+/**
+ * Renders a template with its params
+ * @param {string} templateId - Key in TEMPLATES
+ * @param {Object} params - Values for the {placeholders}
+ * @returns {string|null} - The rendered message, or null for an unknown template
+ */
+const renderTemplate = (templateId, params = {}) => {
+  const template = TEMPLATES[templateId];
+  if (!template) {
+    return null;
+  }
+  return template.replace(/\{(\w+)\}/g, (_, key) => (params[key] ?? '').toString());
+};
+
+module.exports = { TEMPLATES, renderTemplate };